@@ -0,0 +1,144 @@
+# bench/async_db.py
+"""
+Сравнение пропускной способности event loop при синхронной работе с SQLite
+прямо в корутинах и при работе через пул потоков `db.run_db`.
+
+Каждый "апдейт" читает список открытых задач и пишет строку в events,
+параллельно фоновый поток периодически держит блокировку записи.
+
+Апдейты приходят с постоянной частотой --rate (ниже пропускной способности
+обоих вариантов), как от пользователей, а не одной пачкой. Задержка апдейта
+считается от запланированного момента прихода до окончания обработки: в неё
+входит и время, пока апдейт ждал замёрзший event loop.
+
+Запуск из корня проекта:
+    python -m bench.async_db --updates 500 --rate 30
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+import db
+from utils.time import now_ts
+
+OPEN_TASKS_SQL = "SELECT * FROM tasks WHERE status='new' AND publish_mode='open' ORDER BY deadline_ts ASC"
+EVENT_SQL = "INSERT INTO events (ts, actor_id, action, task_id, meta) VALUES (?, ?, 'bench', NULL, NULL)"
+
+
+def _prepare(tasks: int):
+    db.init_db()
+    conn = db.get_conn()
+    now = now_ts()
+    conn.executemany(
+        "INSERT INTO tasks(title, notion_url, publish_mode, deadline_ts, status, created_by, created_at, updated_at) "
+        "VALUES (?, ?, 'open', ?, 'new', 0, ?, ?)",
+        [(f"task {i}", f"https://notion.so/bench/{i}", now + 3600 + i, now, now) for i in range(tasks)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def _writer(stop: threading.Event, hold: float):
+    """Имитирует конкурирующую запись: держит блокировку `hold` секунд."""
+    conn = db.get_conn()
+    while not stop.is_set():
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE tasks SET updated_at = ? WHERE id = 1", (now_ts(),))
+        time.sleep(hold)
+        conn.commit()
+        time.sleep(hold / 2)
+    conn.close()
+
+
+def _sync_update(uid: int):
+    conn = db.get_conn()
+    try:
+        conn.execute(OPEN_TASKS_SQL).fetchall()
+        conn.execute(EVENT_SQL, (now_ts(), uid))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+async def _update_blocking(uid: int):
+    # Так работали обработчики: запрос выполняется прямо в корутине
+    _sync_update(uid)
+
+
+async def _update_async(uid: int):
+    await db.fetchall(OPEN_TASKS_SQL)
+    await db.execute(EVENT_SQL, (now_ts(), uid))
+
+
+async def _heartbeat(stop: asyncio.Event, lags: list, period: float = 0.01):
+    """Измеряет задержку event loop: насколько позже запланированного просыпается корутина."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(period)
+        lags.append(time.perf_counter() - started - period)
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def _run(update, updates: int, rate: float):
+    latencies, lags = [], []
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(stop, lags))
+
+    async def one(uid, arrival):
+        await update(uid)
+        latencies.append(time.perf_counter() - arrival)
+
+    started = time.perf_counter()
+    handlers = []
+    for i in range(updates):
+        arrival = started + i / rate
+        # Если loop был занят, апдейт запускается позже, но задержка всё равно от arrival
+        await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+        handlers.append(asyncio.create_task(one(i, arrival)))
+    await asyncio.gather(*handlers)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await heartbeat
+    return {
+        "updates_per_sec": updates / elapsed,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "loop_lag_p99_ms": _percentile(lags, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=30, help="апдейтов в секунду")
+    parser.add_argument("--hold", type=float, default=0.02, help="сколько секунд писатель держит блокировку")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        _prepare(args.tasks)
+
+        for name, update in (("sync (до)", _update_blocking), ("run_db (после)", _update_async)):
+            stop = threading.Event()
+            writer = threading.Thread(target=_writer, args=(stop, args.hold), daemon=True)
+            writer.start()
+            result = asyncio.run(_run(update, args.updates, args.rate))
+            stop.set()
+            writer.join()
+            print(f"{name:>16}: {result['updates_per_sec']:8.1f} upd/s  "
+                  f"p50={result['p50_ms']:7.1f}ms  p99={result['p99_ms']:7.1f}ms  "
+                  f"loop lag p99={result['loop_lag_p99_ms']:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
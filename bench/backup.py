@@ -0,0 +1,67 @@
+# bench/backup.py
+"""
+Резервная копия на ходу: backup API одним шагом против шагов по
+BACKUP_STEP_PAGES страниц (services.backup).
+
+Пока идёт копия, «обработчик» каждые 10 мс пишет событие и фиксирует
+транзакцию; максимальное время такой записи показывает, мешала ли копия
+записи. Затем снимок проверяется и восстанавливается во временный файл,
+и число строк в events сверяется с базой на момент начала копии.
+
+Запуск из корня проекта:
+    python -m bench.backup --events 500000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import db
+from bench.retention import _seed, _writer
+from services import backup
+
+
+async def _measure(backup_dir: str, step_pages: int) -> tuple:
+    stop = asyncio.Event()
+    writer = asyncio.create_task(_writer(stop))
+    started = time.perf_counter()
+    report = await asyncio.to_thread(backup.create_snapshot, backup_dir, 2, step_pages)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return report, elapsed, await writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--step-pages", type=int, default=backup.BACKUP_STEP_PAGES)
+    args = parser.parse_args()
+    random.seed(1)
+
+    for variant, step_pages in (("одним шагом", -1), ("шагами", args.step_pages)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_PATH = os.path.join(tmp, "backup.db")
+            db.init_db()
+            _seed(args.events)
+            rows_before = db._fetchone("SELECT COUNT(*) FROM events", ())[0]
+
+            report, elapsed, worst = asyncio.run(_measure(os.path.join(tmp, "backups"), step_pages))
+
+            restored = os.path.join(tmp, "restored.db")
+            backup.restore_snapshot(report["path"], restored)
+            conn = sqlite3.connect(restored)
+            rows = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+            conn.close()
+
+            print(f"{variant:<11}: {report['pages']} страниц за {elapsed:.2f} с, шагов {report['steps']}, "
+                  f"перезапусков {report['restarts']}, запись обработчика до {worst * 1000:.0f} мс, "
+                  f"база {report['db_bytes'] / 2**20:.1f} МБ -> снимок {report['bytes'] / 2**20:.1f} МБ, "
+                  f"восстановлено {rows} строк events (до копии {rows_before})")
+            db.pool.close()
+
+
+if __name__ == "__main__":
+    main()
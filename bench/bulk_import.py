@@ -0,0 +1,112 @@
+# bench/bulk_import.py
+"""
+Массовый импорт против мастера: те же задачи создаются по одной (запрос
+антидубля addtask_url + save_task на каждую, как при проходе мастера) и
+одним файлом через services.bulk_import.
+
+В файле есть дубли внутри файла, дубли уже активных задач и строки с
+ошибками — их отклонение тоже входит в замер.
+
+Запуск из корня проекта:
+    python -m bench.bulk_import --rows 10000
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+
+import db
+from handlers.pm import ACTIVE_DUPLICATE_SQL, save_task
+from services.bulk_import import import_tasks, report_summary
+from utils.hash import dedupe_hash
+from utils.time import now_ts, parse_deadline
+
+PM = 1
+
+
+def _rows(count: int) -> list[dict]:
+    rows = []
+    for i in range(count):
+        row = {
+            "notion_url": f"https://www.notion.so/bench/task-{i}",
+            "title": f"Задача {i}",
+            "level": random.choice(("L1", "L2", "L3")),
+            "est_hours": random.choice(("", "2", "4.5")),
+            "deadline": random.choice(("6h", "48h", "2099-01-01 12:00")),
+            "publish_mode": "open",
+            "usernames": "",
+        }
+        if i % 10 == 0:
+            row.update(publish_mode="direct", usernames=f"@exec{i % 50} @exec{(i + 1) % 50}")
+        rows.append(row)
+    # ~2% дублей внутри файла и ~1% строк с ошибками
+    for i in random.sample(range(count), count // 50):
+        # Тот же URL после normalize_url: другой регистр домена, слэш и якорь
+        rows[i]["notion_url"] = rows[(i + 1) % count]["notion_url"].replace("www.notion.so", "WWW.Notion.so") + "/#x"
+    for i in random.sample(range(count), count // 100):
+        rows[i]["deadline"] = "когда-нибудь"
+    return rows
+
+
+def _csv(rows: list[dict]) -> bytes:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+
+def _seed_active(rows: list[dict]):
+    """~2% задач файла уже есть среди активных."""
+    for row in random.sample(rows, len(rows) // 50):
+        save_task({**row, "publish_mode": "open", "deadline_ts": now_ts() + 3600,
+                   "dedupe_hash": dedupe_hash(row["notion_url"])}, PM)
+
+
+def _one_by_one(rows: list[dict]) -> int:
+    created = 0
+    for row in rows:
+        h = dedupe_hash(row["notion_url"])
+        if db._fetchone(ACTIVE_DUPLICATE_SQL, (h,)):
+            continue
+        deadline_ts = parse_deadline(row["deadline"])
+        if not deadline_ts:
+            continue
+        save_task({**row, "deadline_ts": deadline_ts, "dedupe_hash": h,
+                   "allowed_usernames": None}, PM)
+        created += 1
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000)
+    args = parser.parse_args()
+    random.seed(1)
+    rows = _rows(args.rows)
+    data = _csv(rows)
+
+    for variant in ("по одной", "файлом"):
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_PATH = os.path.join(tmp, "import.db")
+            db.init_db()
+            _seed_active(rows)
+
+            started = time.perf_counter()
+            if variant == "по одной":
+                created, rejected = _one_by_one(rows), None
+            else:
+                report, _ = import_tasks(data, "tasks.csv", PM)
+                created, rejected = report_summary(report)
+            elapsed = time.perf_counter() - started
+
+            print(f"{variant:<9}: {args.rows} строк за {elapsed:.2f} с, создано {created}"
+                  + (f", отклонено {rejected}" if rejected is not None else ""))
+            db.pool.close()
+
+
+if __name__ == "__main__":
+    main()
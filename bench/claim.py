@@ -0,0 +1,132 @@
+# bench/claim.py
+"""
+Гонка за только что опубликованной задачей: сотни одновременных нажатий
+"Принять" на одну задачу и пачка нажатий одного исполнителя на разные
+задачи. Старая схема (COUNT вне транзакции, SELECT, UPDATE, событие отдельным
+соединением, повторный SELECT) против одного условного UPDATE ... RETURNING.
+
+Проверяется корректность: у задачи ровно один исполнитель и одно событие
+'take', а исполнитель не набирает больше MAX_ACTIVE_TASKS задач.
+
+В старой схеме между проверкой лимита и транзакцией обработчик отдаёт
+управление (await, переключение потока пула); --gap-ms задаёт эту паузу,
+чтобы одновременные нажатия успели пройти проверку до первой фиксации.
+В новой схеме проверки вне UPDATE нет, пауза к ней не применяется.
+
+Запуск из корня проекта:
+    python -m bench.claim --claims 300 --rounds 20 --threads 16
+"""
+import argparse
+import functools
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from config import MAX_ACTIVE_TASKS
+from handlers.exec import _take_task
+from utils.time import now_ts
+
+
+def _legacy_take(task_id: int, uid: int, gap: float = 0.0):
+    """Взятие задачи в том виде, в каком оно было до атомарного UPDATE."""
+    with db.connection() as conn:
+        cur = conn.cursor()
+        active_count = cur.execute("SELECT COUNT(*) FROM tasks WHERE status='taken' AND assigned_to=?", (uid,)).fetchone()[0]
+        if active_count >= MAX_ACTIVE_TASKS:
+            return "limit", None
+        time.sleep(gap)
+
+        cur.execute("BEGIN IMMEDIATE")
+        task = cur.execute("SELECT * FROM tasks WHERE id=? AND status='new'", (task_id,)).fetchone()
+        if not task:
+            conn.rollback()
+            return "gone", None
+
+        cur.execute("UPDATE tasks SET status='taken', assigned_to=?, updated_at=? WHERE id=?", (uid, now_ts(), task_id))
+        conn.commit()
+    with db.connection() as conn:
+        conn.execute(
+            "INSERT INTO events (ts, actor_id, action, task_id, meta) VALUES (?, ?, 'take', ?, NULL)",
+            (now_ts(), uid, task_id)
+        )
+        conn.commit()
+    with db.connection() as conn:
+        return "ok", conn.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
+
+
+def _add_tasks(count: int) -> list:
+    now = now_ts()
+    with db.connection() as conn:
+        ids = [
+            conn.execute(
+                "INSERT INTO tasks(title, notion_url, publish_mode, deadline_ts, status, created_by, created_at, updated_at) "
+                "VALUES (?, ?, 'open', ?, 'new', 0, ?, ?)",
+                (f"task {i}", f"https://notion.so/bench/{i}", now + 3600, now, now)
+            ).lastrowid
+            for i in range(count)
+        ]
+        conn.commit()
+    return ids
+
+
+def _rush(take, pool: ThreadPoolExecutor, claims: int, rounds: int):
+    """Все нажимают на одну задачу. Возвращает (секунды, нарушения)."""
+    elapsed, violations = 0.0, 0
+    for r in range(rounds):
+        (task_id,) = _add_tasks(1)
+        uids = range(r * claims + 1, (r + 1) * claims + 1)
+        started = time.perf_counter()
+        results = list(pool.map(lambda uid: take(task_id, uid)[0], uids))
+        elapsed += time.perf_counter() - started
+        with db.connection() as conn:
+            takes = conn.execute("SELECT COUNT(*) FROM events WHERE action='take' AND task_id=?", (task_id,)).fetchone()[0]
+        if results.count("ok") != 1 or takes != 1:
+            violations += 1
+    return elapsed, violations
+
+
+def _greedy(take, pool: ThreadPoolExecutor, claims: int, rounds: int):
+    """Один исполнитель жмёт на много задач сразу. Возвращает (секунды, нарушения, максимум взятых)."""
+    elapsed, violations, most = 0.0, 0, 0
+    for r in range(rounds):
+        uid = 10_000_000 + r
+        task_ids = _add_tasks(claims)
+        started = time.perf_counter()
+        list(pool.map(lambda task_id: take(task_id, uid), task_ids))
+        elapsed += time.perf_counter() - started
+        with db.connection() as conn:
+            taken = conn.execute("SELECT COUNT(*) FROM tasks WHERE status='taken' AND assigned_to=?", (uid,)).fetchone()[0]
+        if taken > MAX_ACTIVE_TASKS:
+            violations += 1
+        most = max(most, taken)
+    return elapsed, violations, most
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--claims", type=int, default=300, help="нажатий в одном раунде")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=16, help="одновременных обработчиков")
+    parser.add_argument("--gap-ms", type=float, default=5, help="пауза старой схемы между проверкой лимита и транзакцией")
+    args = parser.parse_args()
+
+    legacy = functools.partial(_legacy_take, gap=args.gap_ms / 1000)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, take in (("старый", legacy), ("UPDATE RETURNING", _take_task)):
+            db.DB_PATH = os.path.join(tmp, f"{name}.db")
+            db.pool = db.ConnectionPool(args.threads)
+            db.init_db()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                for scenario, run in (("одна задача", _rush), ("лимит", _greedy)):
+                    elapsed, violations, *most = run(take, pool, args.claims, args.rounds)
+                    total = args.claims * args.rounds
+                    extra = f", у исполнителя до {most[0]} задач при лимите {MAX_ACTIVE_TASKS}" if most else ""
+                    print(f"{name:>16} / {scenario:<11}: {total / elapsed:8.0f} нажатий/с, "
+                          f"нарушений {violations} из {args.rounds} раундов{extra}")
+            db.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# bench/db_pool.py
+"""
+Стоимость открытия соединения на каждый запрос по сравнению с пулом
+долгоживущих соединений `db.pool`.
+
+Запуск из корня проекта:
+    python -m bench.db_pool --queries 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import db
+
+
+def _connect_per_query(queries: int):
+    for i in range(queries):
+        conn = db.get_conn()
+        conn.execute("SELECT * FROM tasks WHERE id = ?", (i,)).fetchone()
+        conn.close()
+
+
+def _pooled(queries: int):
+    for i in range(queries):
+        with db.connection() as conn:
+            conn.execute("SELECT * FROM tasks WHERE id = ?", (i,)).fetchone()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        for name, func in (("get_conn на запрос", _connect_per_query), ("пул", _pooled)):
+            started = time.perf_counter()
+            func(args.queries)
+            elapsed = time.perf_counter() - started
+            print(f"{name:>20}: {args.queries / elapsed:10.0f} запросов/с")
+        print("статистика пула:", db.pool.stats())
+        db.pool.close()
+
+
+if __name__ == "__main__":
+    main()
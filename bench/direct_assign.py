@@ -0,0 +1,82 @@
+# bench/direct_assign.py
+"""
+"Мои назначения" на 50k открытых точечных задач: старый вариант (все задачи
++ json.loads в Python) против индексированной таблицы task_assignees.
+
+Запуск из корня проекта:
+    python -m bench.direct_assign --tasks 50000 --users 2000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import db
+from services.direct import save_assignees
+from utils.time import now_ts
+
+
+def _prepare(tasks: int, users: int, per_task: int):
+    db.init_db()
+    names = [f"User{i}" for i in range(users)]
+    now = now_ts()
+    with db.connection() as conn:
+        for i in range(tasks):
+            allowed = json.dumps(random.sample(names, per_task))
+            cur = conn.execute(
+                "INSERT INTO tasks(title, notion_url, publish_mode, deadline_ts, status, created_by, "
+                "allowed_usernames, created_at, updated_at) VALUES (?, ?, 'direct', ?, 'new', 0, ?, ?, ?)",
+                (f"task {i}", f"https://notion.so/bench/{i}", now + i, allowed, now, now)
+            )
+            save_assignees(conn, cur.lastrowid, allowed)
+        conn.commit()
+        conn.execute("ANALYZE")
+    return names
+
+
+def _old(username: str):
+    with db.connection() as conn:
+        all_tasks = conn.execute("SELECT * FROM tasks WHERE status='new' AND publish_mode='direct'").fetchall()
+    my_tasks = []
+    for t in all_tasks:
+        allowed = json.loads(t["allowed_usernames"] or "[]")
+        if username in [a.lower() for a in allowed]:
+            my_tasks.append(t)
+    return my_tasks
+
+
+def _new(username: str):
+    with db.connection() as conn:
+        return conn.execute("""
+            SELECT t.* FROM task_assignees a
+            CROSS JOIN tasks t ON t.id = a.task_id
+            WHERE a.username_lower = ? AND t.status='new' AND t.publish_mode='direct'
+            ORDER BY t.deadline_ts ASC
+        """, (username,)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--per-task", type=int, default=3)
+    parser.add_argument("--lookups", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        names = _prepare(args.tasks, args.users, args.per_task)
+        probes = [random.choice(names).lower() for _ in range(args.lookups)]
+
+        for name, func in (("json в Python", _old), ("task_assignees", _new)):
+            started = time.perf_counter()
+            found = sum(len(func(u)) for u in probes)
+            elapsed = (time.perf_counter() - started) / args.lookups
+            print(f"{name:>16}: {elapsed * 1000:9.2f} мс на нажатие (найдено {found})")
+        db.pool.close()
+
+
+if __name__ == "__main__":
+    main()
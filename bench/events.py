@@ -0,0 +1,73 @@
+# bench/events.py
+"""
+Запись аудита: транзакция с коммитом на каждое событие (как было в
+scheduler.log_event) против буфера services.events.EventSink.
+
+Запуск из корня проекта:
+    python -m bench.events --events 5000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import db
+from services.events import EventSink, log_event_within_connection
+
+
+def _log_event(actor_id, action, task_id=None, meta=None):
+    with db.connection() as conn:
+        log_event_within_connection(conn, actor_id, action, task_id, meta)
+        conn.commit()
+
+
+async def _per_event(count: int):
+    for i in range(count):
+        await db.run_db(_log_event, i, "submit", i)
+    return count
+
+
+async def _sink(count: int, flush_size: int):
+    sink = EventSink(flush_size, flush_interval=1.0)
+    sink.start()
+    for i in range(count):
+        sink.emit(i, "submit", i)
+        if i % 50 == 0:
+            # Отдаём управление, как это происходит между апдейтами
+            await asyncio.sleep(0)
+    await sink.stop()
+    return sink.flushes
+
+
+def _count() -> int:
+    with db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+
+async def _run(args):
+    for name, scenario in (("коммит на событие", lambda: _per_event(args.events)),
+                           ("EventSink", lambda: _sink(args.events, args.flush_size))):
+        before = _count()
+        started = time.perf_counter()
+        commits = await scenario()
+        elapsed = time.perf_counter() - started
+        written = _count() - before
+        print(f"{name:>18}: {written / elapsed:9.0f} событий/с, записано {written}, транзакций {commits}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--flush-size", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        asyncio.run(_run(args))
+        db.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# bench/export.py
+"""
+Выгрузка задач: прежняя схема (fetchall всех строк, CSV-файл на диске) против
+потоковой записи порциями в SpooledTemporaryFile во всех форматах.
+
+Для каждого варианта печатается время, пиковая память Python (tracemalloc,
+отдельным прогоном) и размер результата. Пока идёт потоковая выгрузка, в event loop крутится
+«пульс» — корутина, которая просыпается каждые 10 мс; максимальная задержка
+пульса показывает, блокировала ли выгрузка обработку других апдейтов.
+
+Запуск из корня проекта:
+    python -m bench.export --rows 200000
+"""
+import argparse
+import asyncio
+import csv
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import db
+from services.export import export_tasks, period_range
+from utils.time import now_ts, humanize_ts
+
+
+def _legacy_export(path: str, start_ts: int) -> int:
+    """Выгрузка в том виде, в каком она была: все строки в память, затем файл."""
+    with db.connection() as conn:
+        tasks = conn.execute("""
+        SELECT
+            t.id, t.title, t.notion_url, u.username as assignee_username, t.status,
+            t.level, t.est_hours, t.deadline_ts, t.created_at, t.updated_at
+        FROM tasks t
+        LEFT JOIN users u ON t.assigned_to = u.tg_id
+        WHERE t.created_at >= ?
+        ORDER BY t.created_at DESC
+    """, (start_ts,)).fetchall()
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "title", "notion_url", "assignee_username", "status", "level", "est_hours", "deadline", "created_at", "updated_at"])
+        for task in tasks:
+            writer.writerow([
+                task['id'], task['title'], task['notion_url'],
+                task['assignee_username'] or '', task['status'], task['level'],
+                task['est_hours'],
+                humanize_ts(task['deadline_ts']) if task['deadline_ts'] else '',
+                humanize_ts(task['created_at']) if task['created_at'] else '',
+                humanize_ts(task['updated_at']) if task['updated_at'] else ''
+            ])
+    return len(tasks)
+
+
+def _seed(rows: int):
+    now = now_ts()
+    statuses = ("new", "taken", "done", "dropped", "expired")
+    with db.connection() as conn:
+        conn.executemany(
+            "INSERT INTO users(tg_id, username, full_name, role, is_active) VALUES (?, ?, ?, 'exec', 1)",
+            [(uid, f"user{uid}", f"User {uid}") for uid in range(1, 501)]
+        )
+        conn.executemany(
+            "INSERT INTO tasks(title, notion_url, level, est_hours, publish_mode, deadline_ts, status, assigned_to, "
+            "created_by, created_at, updated_at) VALUES (?, ?, 'L2', 3, 'open', ?, ?, ?, 0, ?, ?)",
+            (
+                (f"Задача {i}: {'описание ' * 5}", f"https://notion.so/bench/{i}", now + 3600,
+                 random.choice(statuses), random.randint(1, 500), created, created)
+                for i in range(rows)
+                for created in (now - random.randint(0, 360 * 86400),)
+            )
+        )
+        conn.commit()
+
+
+async def _heartbeat(stop: asyncio.Event) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - started - 0.01)
+    return worst
+
+
+async def _streaming(fmt: str):
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(stop))
+    doc, rows, size = await export_tasks(fmt, "365d")
+    # Отправка: читаем буфер так же, как его читает сессия Bot API
+    sent = 0
+    async for chunk in doc.read(None):
+        sent += len(chunk)
+    doc.close()
+    stop.set()
+    return rows, size, sent, await heartbeat
+
+
+def _measure(func, *args):
+    """Время — в отдельном прогоне: под tracemalloc всё в разы медленнее."""
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "export.db")
+        db.init_db()
+        _seed(args.rows)
+        start_ts, _ = period_range("365d")
+
+        path = os.path.join(tmp, "legacy.csv")
+        rows, elapsed, peak = _measure(_legacy_export, path, start_ts)
+        print(f"{'прежняя (csv)':<16}: {rows} строк за {elapsed:.2f} с, пик памяти {peak / 2**20:6.1f} МБ, "
+              f"файл {os.path.getsize(path) / 2**20:.1f} МБ")
+
+        for fmt in ("csv", "csvgz", "jsonl"):
+            (rows, size, sent, stall), elapsed, peak = _measure(lambda: asyncio.run(_streaming(fmt)))
+            print(f"{'поток (' + fmt + ')':<16}: {rows} строк за {elapsed:.2f} с, пик памяти {peak / 2**20:6.1f} МБ, "
+                  f"файл {size / 2**20:.1f} МБ (прочитано {sent == size}), задержка event loop до {stall * 1000:.0f} мс")
+        db.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# bench/fake_bot_api.py
+"""
+Локальная заглушка Telegram Bot API для нагрузочных замеров без сети.
+
+Отвечает на вызовы /bot<token>/<method> правдоподобными объектами, запоминает
+их и, как настоящий Telegram, возвращает 429 с retry_after, если превышены
+лимиты: общий (сообщений в секунду) и на один чат.
+
+Отдельным процессом (в config.py указать BOT_API_URL = "http://127.0.0.1:8081"):
+    python -m bench.fake_bot_api --port 8081
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+# Методы, которые создают сообщение в чате и попадают под лимиты
+_SENDING = {"sendmessage", "senddocument", "sendphoto", "copymessage", "forwardmessage"}
+
+
+class FakeBotAPI:
+    def __init__(self, global_rate: int = 30, chat_rate: int = 1, chat_burst: int = 3, latency: float = 0.0):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.latency = latency
+        self.calls: list[tuple[float, str, dict]] = []
+        self.rejected = 0
+        self._message_id = 0
+        self._global = [float(global_rate), time.monotonic()]
+        self._chats = {}
+        self._runner: web.AppRunner | None = None
+        self.port: int | None = None
+
+    def counts(self) -> dict:
+        result = defaultdict(int)
+        for _, method, _ in self.calls:
+            result[method] += 1
+        return dict(result)
+
+    @staticmethod
+    def _refill(bucket: list, rate: float, capacity: float, now: float) -> float:
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        return bucket[0]
+
+    def _limited(self, chat_id, now: float) -> bool:
+        # Ведро токенов на бота (global_rate/с) и на чат (chat_rate/с, запас chat_burst)
+        chat = self._chats.setdefault(chat_id, [float(self.chat_burst), now])
+        if (self._refill(self._global, self.global_rate, self.global_rate, now) < 1
+                or self._refill(chat, self.chat_rate, self.chat_burst, now) < 1):
+            return True
+        self._global[0] -= 1
+        chat[0] -= 1
+        return False
+
+    async def _handle(self, request: web.Request):
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        now = time.monotonic()
+        if method.lower() in _SENDING and self._limited(params.get("chat_id"), now):
+            self.rejected += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            })
+        self.calls.append((now, method, params))
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    def _result(self, method: str, params: dict):
+        method = method.lower()
+        if method == "getme":
+            return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        if method in _SENDING or method == "editmessagetext":
+            self._message_id += 1
+            chat_id = int(params.get("chat_id") or 0)
+            message = {
+                "message_id": int(params.get("message_id") or self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+            }
+            if "text" in params:
+                message["text"] = params["text"]
+            return message
+        if method == "getupdates":
+            return []
+        return True
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def _serve(args):
+    api = FakeBotAPI(args.global_rate, args.chat_rate, args.chat_burst, args.latency)
+    url = await api.start(port=args.port)
+    print(f"Fake Bot API: {url}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(json.dumps({"calls": api.counts(), "rejected_429": api.rejected}, ensure_ascii=False))
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--global-rate", type=int, default=30)
+    parser.add_argument("--chat-rate", type=int, default=1)
+    parser.add_argument("--chat-burst", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="искусственная задержка ответа, с")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
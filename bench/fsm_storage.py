@@ -0,0 +1,93 @@
+# bench/fsm_storage.py
+"""
+Пропускная способность get/set состояний FSM: MemoryStorage aiogram против
+SQLiteStorage (services/fsm_storage.py) — с тёплым кэшем и после сброса кэша,
+когда каждое первое чтение идёт в БД. Дополнительно проверяется, что
+состояния переживают «перезапуск» (новый экземпляр хранилища).
+
+Запуск из корня проекта:
+    python -m bench.fsm_storage --users 2000 --steps 10
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import db
+from services.fsm_storage import SQLiteStorage
+
+
+def _keys(users: int) -> list:
+    return [StorageKey(bot_id=1, chat_id=uid, user_id=uid) for uid in range(1, users + 1)]
+
+
+async def _wizard(storage, keys: list, steps: int) -> int:
+    """Каждый пользователь проходит мастер: на шаге читает состояние, пишет данные и новое состояние."""
+    ops = 0
+    for step in range(steps):
+        for key in keys:
+            await storage.get_state(key)
+            await storage.update_data(key, {f"field{step}": "значение", "step": step})
+            await storage.set_state(key, f"AddTask:step{step}")
+            ops += 4  # get_state, get_data и set_data внутри update_data, set_state
+    return ops
+
+
+async def _reads(storage, keys: list) -> int:
+    for key in keys:
+        await storage.get_state(key)
+        await storage.get_data(key)
+    return 2 * len(keys)
+
+
+async def _run(args):
+    keys = _keys(args.users)
+    results = []
+
+    memory = MemoryStorage()
+    started = time.perf_counter()
+    ops = await _wizard(memory, keys, args.steps)
+    results.append(("MemoryStorage", ops, time.perf_counter() - started))
+
+    storage = SQLiteStorage(flush_interval=0.5, state_ttl=3600, cache_idle=600)
+    storage.start()
+    started = time.perf_counter()
+    ops = await _wizard(storage, keys, args.steps)
+    await storage.close()
+    results.append(("SQLite, мастер + запись", ops, time.perf_counter() - started))
+
+    # Новый экземпляр: кэш пуст, как после перезапуска бота
+    cold = SQLiteStorage(flush_interval=0.5, state_ttl=3600, cache_idle=600)
+    started = time.perf_counter()
+    ops = await _reads(cold, keys)
+    results.append(("SQLite, холодное чтение", ops, time.perf_counter() - started))
+    started = time.perf_counter()
+    ops = await _reads(cold, keys)
+    results.append(("SQLite, тёплое чтение", ops, time.perf_counter() - started))
+
+    states = [await cold.get_state(key) for key in keys]
+    restored = states.count(f"AddTask:step{args.steps - 1}")
+    for name, ops, elapsed in results:
+        print(f"{name:>24}: {ops / elapsed:10.0f} операций/с")
+    print(f"состояний после перезапуска: {restored} из {len(keys)}, записано строк: {storage.written}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--steps", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        asyncio.run(_run(args))
+        db.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+# bench/load.py
+"""
+Нагрузочный прогон всего бота: настоящий Dispatcher с роутерами common, pm и
+exec получает сгенерированные апдейты через feed_update, а запросы к Bot API
+уходят в сессию-заглушку, которая ничего не отправляет и считает вызовы.
+База — временная, с теми же миграциями, пулом и фоновыми сервисами
+(outbox, буфер аудита, хранилище FSM), что и в боте.
+
+Сценарии:
+  exec_claim    — тысячи исполнителей: /start, «Открытые задачи», несколько
+                  нажатий «Принять» на случайные задачи (часть — двойным
+                  нажатием, --double-taps), «Мои задачи», снова /start;
+  pm_wizard     — PM проходят мастер добавления задачи и смотрят очередь;
+  pm_review     — исполнители сдают взятые задачи, два PM одновременно
+                  принимают или возвращают каждую, после чего исполнитель
+                  жмёт устаревшую «Отказаться», а PM — устаревшее «Вернуть»;
+  expiry_storm  — у тысяч взятых задач одновременно наступает дедлайн, пока
+                  исполнители листают свои списки; PM получают уведомления
+                  о просрочке (сводкой, если --digest-window не 0).
+
+Для каждого сценария печатается пропускная способность, перцентили времени
+обработки апдейта, SQL-запросов и вызовов Bot API на апдейт (с учётом
+отложенной записи аудита, FSM и очереди отправки) и доля попаданий в кэши
+профилей и карточек задач. После всех сценариев инкрементальная статистика
+сверяется с пересборкой из аудита (services.stats.check). С --json
+результаты пишутся в файл для сравнения между версиями.
+
+Запуск из корня проекта:
+    python -m bench.load --executors 2000 --pms 20 --json load.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods.base import Response
+from aiogram.types import Update
+
+import db
+from bot import create_dispatcher
+from config import PM_IDS
+from services import cache, stats
+from services.dedupe import callback_dedupe
+from services.digest import digest
+from services.events import events
+from services.expiry import expiry
+from services.fsm_storage import fsm_storage
+from services.outbox import outbox
+from utils.time import now_ts
+
+TOKEN = "42:fake"
+
+# Диапазоны id, чтобы пользователи разных сценариев не пересекались
+_EXECUTORS = 100_000
+_PMS = 1_000
+
+
+class RecordingSession(BaseSession):
+    """Сессия Bot API без сети: считает вызовы и отвечает правдоподобными объектами."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method, timeout=None):
+        name = method.__api_method__
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = Response[method.__returning__].model_validate(
+            {"ok": True, "result": self._result(name, method)}, context={"bot": bot}
+        )
+        return response.result
+
+    def _result(self, name: str, method):
+        if name == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Load", "username": "load_bot"}
+        if name.startswith("send") or name == "editMessageText":
+            self._message_id += 1
+            message = {
+                "message_id": getattr(method, "message_id", None) or self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(getattr(method, "chat_id", None) or 0), "type": "private"},
+            }
+            if getattr(method, "text", None):
+                message["text"] = method.text
+            return message
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+
+class SqlCounter:
+    """Считает выполненные SQL-запросы во всех соединениях пула (sqlite3 trace callback)."""
+
+    def __init__(self):
+        self.statements = 0
+        self._lock = threading.Lock()
+
+    def install(self):
+        # Пул открывает соединения через db.get_conn — подменяем до первого соединения
+        open_conn = db.get_conn
+
+        def get_conn():
+            conn = open_conn()
+            conn.set_trace_callback(self._trace)
+            return conn
+
+        db.get_conn = get_conn
+
+    def _trace(self, sql: str):
+        with self._lock:
+            self.statements += 1
+
+
+class Updates:
+    """Апдейты в формате Bot API, уже разобранные в модели aiogram."""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _user(uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": f"User{uid}", "username": f"user{uid}"}
+
+    def _message(self, uid: int, text: str) -> dict:
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"},
+            "from": self._user(uid),
+            "text": text,
+        }
+
+    def message(self, uid: int, text: str) -> Update:
+        update_id = next(self._ids)
+        return Update.model_validate(
+            {"update_id": update_id, "message": self._message(uid, text)}, context={"bot": self.bot}
+        )
+
+    def callback(self, uid: int, data: str) -> Update:
+        update_id = next(self._ids)
+        return Update.model_validate({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(uid),
+                "chat_instance": str(uid),
+                "message": self._message(uid, "menu"),
+                "data": data,
+            },
+        }, context={"bot": self.bot})
+
+
+def _seed_tasks(count: int, deadline_ts: int, assignees: list | None = None) -> list:
+    """Добавляет открытые задачи (или сразу взятые, если даны исполнители)."""
+    now = now_ts()
+    with db.connection() as conn:
+        ids = []
+        for i in range(count):
+            assignee = assignees[i % len(assignees)] if assignees else None
+            ids.append(conn.execute(
+                "INSERT INTO tasks(title, notion_url, level, publish_mode, deadline_ts, status, assigned_to, "
+                "created_by, created_at, updated_at) VALUES (?, ?, 'L2', 'open', ?, ?, ?, 0, ?, ?)",
+                (f"load task {i}", f"https://notion.so/load/{now}/{random.random()}", deadline_ts,
+                 "taken" if assignee else "new", assignee, now, now)
+            ).lastrowid)
+        conn.commit()
+    return ids
+
+
+def _hit_rate(hits: int, misses: int) -> float | None:
+    return round(hits / (hits + misses), 3) if hits + misses else None
+
+
+def _p(values: list, q: float) -> float:
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2) if values else 0.0
+
+
+class Harness:
+    def __init__(self, dp, bot: Bot, session: RecordingSession, sql: SqlCounter, concurrency: int):
+        self.dp = dp
+        self.bot = bot
+        self.session = session
+        self.sql = sql
+        self.concurrency = concurrency
+        self.updates = Updates(bot)
+        self.latency: list[float] = []
+        self.errors = 0
+
+    async def feed(self, update: Update):
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors += 1
+            if self.errors <= 3:
+                print(f"  ошибка обработки апдейта {update.update_id}: {e!r}")
+        self.latency.append(time.perf_counter() - started)
+
+    async def run(self, name: str, users: list, extra=None) -> dict:
+        """users — корутинные функции user(harness); апдейты одного пользователя идут по порядку."""
+        self.latency, self.errors = [], 0
+        calls_before = self.session.calls.copy()
+        sql_before = self.sql.statements
+        caches = {"users": cache.users, "cards": cache.task_cards}
+        lookups_before = {name: (c.hits, c.misses) for name, c in caches.items()}
+        outbox.start(self.bot)
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def one(user):
+            async with slots:
+                await user(self)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(user) for user in users))
+        elapsed = time.perf_counter() - started
+
+        # Отложенная работа, вызванная этими апдейтами, тоже относится к сценарию
+        await events.flush()
+        await fsm_storage.flush()
+        digest.flush()
+        await outbox.stop(timeout=120)
+
+        calls = self.session.calls - calls_before
+        count = len(self.latency)
+        result = {
+            "scenario": name,
+            "updates": count,
+            "errors": self.errors,
+            "seconds": round(elapsed, 3),
+            "updates_per_sec": round(count / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": _p(self.latency, 0.5),
+                "p95": _p(self.latency, 0.95),
+                "p99": _p(self.latency, 0.99),
+                "max": _p(self.latency, 1.0),
+            },
+            "sql_per_update": round((self.sql.statements - sql_before) / count, 2) if count else 0.0,
+            "api_calls_per_update": round(sum(calls.values()) / count, 2) if count else 0.0,
+            "api_calls": dict(calls.most_common()),
+            "cache_hit_rate": {
+                name: _hit_rate(c.hits - lookups_before[name][0], c.misses - lookups_before[name][1])
+                for name, c in caches.items()
+            },
+        }
+        if extra:
+            result["extra"] = await extra()
+        return result
+
+
+# --- Сценарии ---
+
+async def exec_claim(harness: Harness, args) -> dict:
+    task_ids = _seed_tasks(args.tasks, now_ts() + 24 * 3600)
+
+    def executor(uid: int):
+        async def user(h: Harness):
+            await h.feed(h.updates.message(uid, "/start"))
+            await h.feed(h.updates.callback(uid, "exec_open"))
+            for _ in range(args.takes):
+                data = f"exec_take_{random.choice(task_ids)}"
+                if random.random() < args.double_taps:
+                    await asyncio.gather(h.feed(h.updates.callback(uid, data)), h.feed(h.updates.callback(uid, data)))
+                else:
+                    await h.feed(h.updates.callback(uid, data))
+            await h.feed(h.updates.callback(uid, "exec_my"))
+            await h.feed(h.updates.message(uid, "/start"))
+        return user
+
+    async def taken():
+        row = await db.fetchone(
+            f"SELECT COUNT(*) AS n FROM tasks WHERE status='taken' AND id IN ({','.join('?' * len(task_ids))})",
+            tuple(task_ids),
+        )
+        return {"tasks": len(task_ids), "taken": row["n"], "dedupe": callback_dedupe.stats()}
+
+    executors = [executor(_EXECUTORS + i) for i in range(args.executors)]
+    return await harness.run("exec_claim", executors, taken)
+
+
+async def pm_wizard(harness: Harness, args) -> dict:
+    pm_ids = [_PMS + i for i in range(args.pms)]
+    PM_IDS.update(pm_ids)
+
+    def pm(uid: int):
+        async def user(h: Harness):
+            await h.feed(h.updates.message(uid, "/start"))
+            for n in range(args.wizards):
+                await h.feed(h.updates.callback(uid, "pm_add"))
+                await h.feed(h.updates.message(uid, f"https://notion.so/load/pm{uid}/{n}/{random.random()}"))
+                await h.feed(h.updates.message(uid, f"Задача {n} от PM {uid}"))
+                await h.feed(h.updates.callback(uid, "level_L2"))
+                await h.feed(h.updates.message(uid, "3"))
+                await h.feed(h.updates.message(uid, "6h"))
+                await h.feed(h.updates.callback(uid, "pm_pub_open"))
+            await h.feed(h.updates.callback(uid, "pm_queue"))
+        return user
+
+    async def created():
+        row = await db.fetchone(
+            f"SELECT COUNT(*) AS n FROM tasks WHERE created_by IN ({','.join('?' * len(pm_ids))})", tuple(pm_ids)
+        )
+        return {"expected": len(pm_ids) * args.wizards, "created": row["n"]}
+
+    try:
+        return await harness.run("pm_wizard", [pm(uid) for uid in pm_ids], created)
+    finally:
+        PM_IDS.difference_update(pm_ids)
+
+
+async def pm_review(harness: Harness, args) -> dict:
+    pm_ids = [_PMS + i for i in range(2)]
+    PM_IDS.update(pm_ids)
+    assignees = [_EXECUTORS + i for i in range(args.executors)]
+    task_ids = _seed_tasks(args.executors, now_ts() + 24 * 3600, assignees)
+
+    def executor(uid: int, task_id: int):
+        async def user(h: Harness):
+            await h.feed(h.updates.callback(uid, f"exec_submit_{task_id}"))
+            verdict = "accept" if task_id % 3 else "return"
+            # Оба PM жмут кнопку под одной и той же сдачей
+            await asyncio.gather(*(h.feed(h.updates.callback(pm, f"pm_{verdict}_{task_id}")) for pm in pm_ids))
+            await h.feed(h.updates.callback(uid, f"exec_drop_{task_id}"))
+            await h.feed(h.updates.callback(pm_ids[0], f"pm_return_{task_id}"))
+        return user
+
+    async def closed():
+        row = await db.fetchone(
+            f"SELECT SUM(status='done') AS done, SUM(status='dropped') AS dropped FROM tasks "
+            f"WHERE id IN ({','.join('?' * len(task_ids))})",
+            tuple(task_ids),
+        )
+        return {"tasks": len(task_ids), "done": row["done"], "dropped": row["dropped"]}
+
+    try:
+        return await harness.run("pm_review", [executor(uid, task_id) for uid, task_id in zip(assignees, task_ids)],
+                                 closed)
+    finally:
+        PM_IDS.difference_update(pm_ids)
+
+
+async def expiry_storm(harness: Harness, args) -> dict:
+    assignees = [_EXECUTORS + i for i in range(args.executors)]
+    task_ids = _seed_tasks(args.storm, now_ts(), assignees)
+    pm_ids = [_PMS + i for i in range(args.pms)]
+    PM_IDS.update(pm_ids)
+
+    def executor(uid: int):
+        async def user(h: Harness):
+            for _ in range(3):
+                await h.feed(h.updates.callback(uid, "exec_my"))
+                await h.feed(h.updates.callback(uid, "exec_open"))
+        return user
+
+    async def expired():
+        await expiry.stop()
+        row = await db.fetchone(
+            f"SELECT COUNT(*) AS n FROM tasks WHERE status='expired' AND id IN ({','.join('?' * len(task_ids))})",
+            tuple(task_ids),
+        )
+        return {"due": len(task_ids), "expired": row["n"]}
+
+    # Движок сразу найдёт все наступившие дедлайны и просрочит их, пока идут апдейты
+    await expiry.start(harness.bot)
+    try:
+        return await harness.run("expiry_storm", [executor(uid) for uid in assignees], expired)
+    finally:
+        PM_IDS.difference_update(pm_ids)
+
+
+SCENARIOS = {"exec_claim": exec_claim, "pm_wizard": pm_wizard, "pm_review": pm_review, "expiry_storm": expiry_storm}
+
+
+async def _run(args) -> list:
+    session = RecordingSession(args.api_latency_ms / 1000)
+    bot = Bot(token=TOKEN, session=session)
+    dp = create_dispatcher()
+    harness = Harness(dp, bot, session, SqlCounter(), args.concurrency)
+    harness.sql.install()
+    db.init_db()
+
+    # Замеряем обработку, а не лимиты Telegram: очередь отправки не притормаживает
+    outbox.global_rate = outbox.chat_rate = outbox.chat_burst = 1_000_000
+    events.start()
+    fsm_storage.start()
+    digest.window = args.digest_window
+    callback_dedupe.ttl = args.dedupe_ttl
+    digest.start()
+
+    results = []
+    try:
+        for name in args.scenarios:
+            result = await SCENARIOS[name](harness, args)
+            results.append(result)
+            latency = result["latency_ms"]
+            print(f"{name:<13}: {result['updates']:>6} апдейтов, {result['updates_per_sec']:8.0f}/с, "
+                  f"p50={latency['p50']:.1f}мс p95={latency['p95']:.1f}мс p99={latency['p99']:.1f}мс, "
+                  f"SQL/апдейт {result['sql_per_update']:.1f}, API/апдейт {result['api_calls_per_update']:.2f}, "
+                  f"кэш {result['cache_hit_rate']}, ошибок {result['errors']}, {result.get('extra', {})}")
+        # Инкрементальная статистика после всех сценариев должна совпадать с пересборкой из аудита
+        with db.connection() as conn:
+            mismatches = stats.check(conn)
+        print("статистика   : " + (f"расхождений с аудитом {len(mismatches)}: {mismatches[:3]}"
+                                    if mismatches else "совпадает с пересборкой из аудита"))
+    finally:
+        await events.stop()
+        await digest.stop()
+        await fsm_storage.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--executors", type=int, default=2000)
+    parser.add_argument("--tasks", type=int, default=500, help="открытых задач в exec_claim")
+    parser.add_argument("--takes", type=int, default=3, help="нажатий «Принять» на исполнителя")
+    parser.add_argument("--pms", type=int, default=20)
+    parser.add_argument("--wizards", type=int, default=5, help="задач, добавляемых каждым PM")
+    parser.add_argument("--storm", type=int, default=5000, help="задач с наступившим дедлайном в expiry_storm")
+    parser.add_argument("--double-taps", type=float, default=0.2, help="доля двойных нажатий «Принять» в exec_claim")
+    parser.add_argument("--dedupe-ttl", type=float, default=5.0,
+                        help="память повторных нажатий, с; 0 — каждый повтор проходит обработчик")
+    parser.add_argument("--digest-window", type=float, default=10.0,
+                        help="окно сводки уведомлений PM, с; 0 — сообщение на каждое событие")
+    parser.add_argument("--concurrency", type=int, default=200, help="пользователей, присылающих апдейты одновременно")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="задержка ответа заглушки Bot API")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="файл для результатов в JSON")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "load.db")
+        results = asyncio.run(_run(args))
+        db.pool.close()
+
+    if args.json:
+        report = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "args": vars(args),
+            "results": results,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# bench/outbox.py
+"""
+Всплеск уведомлений через локальную заглушку Bot API: последовательный
+`await bot.send_message` против очереди `services.outbox.Outbox`.
+
+Сценарий: несколько PM получают по пачке фоновых уведомлений (как при
+массовой просрочке), а параллельно исполнители нажимают кнопки и ждут ответа.
+
+Запуск из корня проекта:
+    python -m bench.outbox --pms 3 --per-pm 20 --users 40
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+
+from bench.fake_bot_api import FakeBotAPI
+from services.outbox import Outbox, INTERACTIVE, BACKGROUND
+
+TOKEN = "42:fake"
+
+
+def _bot(url: str) -> Bot:
+    return Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+
+
+async def _serial(bot: Bot, pms: int, per_pm: int, users: int):
+    """Как раньше: обработчик сам отправляет уведомления по одному."""
+    interactive = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(per_pm):
+        for pm_id in range(1, pms + 1):
+            try:
+                await bot.send_message(pm_id, f"⌛️ Задача #{i} просрочена.")
+            except TelegramRetryAfter:
+                errors += 1
+    for uid in range(1000, 1000 + users):
+        sent = time.perf_counter()
+        try:
+            await bot.send_message(uid, "Задача принята!")
+        except TelegramRetryAfter:
+            errors += 1
+        interactive.append(time.perf_counter() - sent + (sent - started))
+    return time.perf_counter() - started, interactive, errors
+
+
+async def _queued(bot: Bot, pms: int, per_pm: int, users: int):
+    outbox = Outbox(global_rate=30, chat_rate=1, chat_burst=3, workers=4)
+    outbox.start(bot)
+    started = time.perf_counter()
+    for i in range(per_pm):
+        for pm_id in range(1, pms + 1):
+            outbox.send_message(pm_id, f"⌛️ Задача #{i} просрочена.", priority=BACKGROUND)
+
+    async def reply(uid):
+        sent = time.perf_counter()
+        await outbox.send_message(uid, "Задача принята!", priority=INTERACTIVE)
+        return time.perf_counter() - sent
+
+    interactive = await asyncio.gather(*(reply(uid) for uid in range(1000, 1000 + users)))
+    await outbox.stop(timeout=120)
+    return time.perf_counter() - started, list(interactive), outbox.stats()["failed"]
+
+
+def _p(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+
+async def _run(args):
+    for name, scenario in (("serial await", _serial), ("outbox", _queued)):
+        api = FakeBotAPI(latency=args.latency)
+        bot = _bot(await api.start())
+        elapsed, interactive, errors = await scenario(bot, args.pms, args.per_pm, args.users)
+        await bot.session.close()
+        await api.stop()
+        print(f"{name:>13}: всего {elapsed:6.2f} с, доставлено {len(api.calls)}, "
+              f"429 от API {api.rejected}, потеряно {errors}, "
+              f"ответ пользователю p50={_p(interactive, 0.5):7.0f}мс p99={_p(interactive, 0.99):7.0f}мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pms", type=int, default=3)
+    parser.add_argument("--per-pm", type=int, default=20)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.02)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
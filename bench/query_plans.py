@@ -0,0 +1,117 @@
+# bench/query_plans.py
+"""
+Регрессионная проверка планов запросов: прогоняет EXPLAIN QUERY PLAN для
+горячих запросов обработчиков на пустой базе последней версии схемы и
+завершается с кодом 1, если какой-то из них читает таблицу целиком.
+
+Запуск из корня проекта:
+    python -m bench.query_plans
+"""
+import os
+import re
+import sys
+import tempfile
+
+import db
+from handlers.exec import ACTIVE_COUNT_SQL, CLAIM_SQL, DROP_SQL, OPEN_TASK_SQL
+from handlers.pm import ACTIVE_DUPLICATE_SQL
+from services.bulk_import import ACTIVE_DUPLICATES_SQL
+from services.expiry import EXPIRE_DUE_SQL, EXPIRE_IDS_SQL
+from services.export import export_sql
+from services.lists import _LISTS, page_sql
+from services.reminders import CANCEL_SQL, DUE_SQL, NEXT_DUE_SQL
+from services.retention import BATCH_SQL
+from services.search import search_sql
+from services.stats import TOP_EXECUTORS_SQL
+
+# (где используется, запрос, параметры); SQL берётся из модулей, которые его выполняют
+HOT_QUERIES = [
+    ("exec_take: лимит", ACTIVE_COUNT_SQL, (1,)),
+    ("exec_take: открыта ли", OPEN_TASK_SQL, (1,)),
+    ("exec_take: взятие", CLAIM_SQL, (1, 0, 0, 1, 1, 3)),
+    ("exec_drop", DROP_SQL, (0, 1, 1)),
+    ("addtask_url", ACTIVE_DUPLICATE_SQL, ("x",)),
+    ("expiry: сверка", EXPIRE_DUE_SQL, (0, 0)),
+    ("expiry: из кучи", EXPIRE_IDS_SQL.format(marks="?,?"), (0, 1, 2, 0)),
+    ("reminders: наступившие", DUE_SQL, (0, 0, 200)),
+    ("reminders: ближайшее", NEXT_DUE_SQL, ()),
+    ("reminders: отмена", CANCEL_SQL, (1,)),
+    ("events по задаче", "SELECT * FROM events WHERE task_id = ? ORDER BY ts", (1,)),
+    ("events по времени", "SELECT * FROM events WHERE ts >= ?", (0,)),
+]
+
+# Поиск PM: по релевантности и по новизне, первая страница и следующая
+HOT_QUERIES += [
+    ("pm_search: релевантность", search_sql("rank", False), ('"x"*', 21)),
+    ("pm_search: релевантность, дальше", search_sql("rank", True), ('"x"*', 0, 0, 1, 21)),
+    ("pm_search: новые", search_sql("recent", False), ('"x"*', 21)),
+    ("pm_search: новые, дальше", search_sql("recent", True), ('"x"*', 1, 21)),
+]
+
+# Страницы списков (exec_open, exec_direct, exec_my, pm_queue, pm_inprogress):
+# первая страница и листание в обе стороны
+for _kind, (_, _body, _) in _LISTS.items():
+    _args = (1,) * _body.count("?")
+    HOT_QUERIES += [
+        (f"список {_kind}", page_sql(_kind, False, False), (*_args, 11)),
+        (f"список {_kind}: вперёд", page_sql(_kind, True, False), (*_args, 0, 0, 11)),
+        (f"список {_kind}: назад", page_sql(_kind, True, True), (*_args, 0, 0, 11)),
+    ]
+
+# Выгрузка: без фильтра и со статусом
+HOT_QUERIES += [
+    ("export", export_sql(False), (0, 1)),
+    ("export: статус", export_sql(True), (0, 1, "done")),
+]
+
+# Экран статистики PM: stats_levels — по строке на уровень, её читаем целиком
+HOT_QUERIES += [
+    ("pm_stats: топ сдавших", TOP_EXECUTORS_SQL.format(column="done"), (10,)),
+    ("pm_stats: топ просрочивших", TOP_EXECUTORS_SQL.format(column="expired"), (10,)),
+]
+
+# Массовый импорт: сверка всех хэшей файла с активными задачами
+HOT_QUERIES.append(("bulk_import: дубли", ACTIVE_DUPLICATES_SQL, ('["x", "y"]',)))
+
+# Очистка аудита: пачка старейших событий
+HOT_QUERIES.append(("events_retention", BATCH_SQL, (0, 500)))
+
+# "SCAN tasks" без "USING ... INDEX" означает полный проход по таблице.
+# Проход по материализованному подзапросу (MATERIALIZE s / CO-ROUTINE s) не в счёт.
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+SUBQUERY = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\w+)")
+
+
+def check(conn) -> list:
+    failures = []
+    for name, sql, params in HOT_QUERIES:
+        plan = [row["detail"] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        subqueries = {m.group(1) for m in map(SUBQUERY.match, plan) if m}
+        scans = [
+            line for line in plan
+            if (m := FULL_SCAN.match(line.strip())) and m.group(1) not in subqueries
+        ]
+        if scans:
+            failures.append((name, plan))
+    return failures
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "plans.db")
+        db.init_db()
+        with db.connection() as conn:
+            failures = check(conn)
+        db.pool.close()
+
+    if failures:
+        for name, plan in failures:
+            print(f"FAIL {name}:")
+            for line in plan:
+                print(f"    {line}")
+        sys.exit(1)
+    print(f"OK: {len(HOT_QUERIES)} запросов используют индексы")
+
+
+if __name__ == "__main__":
+    main()
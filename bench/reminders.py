@@ -0,0 +1,177 @@
+# bench/reminders.py
+"""
+Напоминания для N взятых задач: как было (по date-задаче APScheduler на
+каждый отступ REMINDERS_MIN, в аргументах задачи — экземпляр Bot) и как
+сейчас (строки таблицы reminders и один цикл services.reminders).
+
+Для обоих вариантов замеряются память процесса (tracemalloc), время
+постановки напоминаний и отмены их у трети задач (отказы и сдачи). Для
+таблицы дополнительно:
+- сколько проходов сделает цикл за сутки при такте 1 с и REMINDER_TICK;
+- сколько стоит отправка одного напоминания: pull_due забирает наступившие
+  пачками, удаляет их и пишет события 'remind'.
+
+Дедлайны равномерно распределены на сутки вперёд.
+
+Запуск из корня проекта:
+    python -m bench.reminders --tasks 100000
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytz
+from aiogram import Bot
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+import db
+from config import REMINDERS_MIN, REMINDER_TICK
+from services.reminders import cancel_reminders, pull_due, schedule_reminders
+from utils.time import now_ts
+
+TOKEN = "42:fake"
+_EXECUTORS = 100_000
+
+
+async def _send_reminder(bot: Bot, task_id: int, user_id: int, minutes_left: int):
+    pass
+
+
+def _deadlines(count: int) -> list:
+    now = now_ts()
+    # Позже самого дальнего отступа, чтобы ставились все напоминания
+    return [now + max(REMINDERS_MIN) * 60 + random.randint(60, 86400) for _ in range(count)]
+
+
+async def _apscheduler(deadlines: list, cancel: list) -> dict:
+    bot = Bot(token=TOKEN)
+    scheduler = AsyncIOScheduler(timezone=pytz.utc)
+    scheduler.start(paused=True)
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    now = datetime.now(pytz.utc)
+    for task_id, deadline_ts in enumerate(deadlines, 1):
+        deadline = datetime.fromtimestamp(deadline_ts, tz=pytz.utc)
+        for minutes in REMINDERS_MIN:
+            remind_time = deadline - timedelta(minutes=minutes)
+            if remind_time > now:
+                scheduler.add_job(
+                    _send_reminder, "date", run_date=remind_time,
+                    args=[bot, task_id, _EXECUTORS + task_id % 1000, minutes],
+                    id=f"reminder_{task_id}_{minutes}", replace_existing=True,
+                )
+    schedule_seconds = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for task_id in cancel:
+        for minutes in REMINDERS_MIN:
+            scheduler.remove_job(f"reminder_{task_id}_{minutes}")
+    cancel_seconds = time.perf_counter() - started
+
+    scheduler.shutdown(wait=False)
+    await bot.session.close()
+    return {"memory": memory, "schedule": schedule_seconds, "cancel": cancel_seconds}
+
+
+def _seed_taken(deadlines: list):
+    now = now_ts()
+    with db.connection() as conn:
+        conn.executemany(
+            "INSERT INTO tasks(id, title, notion_url, level, publish_mode, deadline_ts, status, assigned_to, "
+            "created_by, created_at, updated_at) VALUES (?, ?, ?, 'L2', 'open', ?, 'taken', ?, 0, ?, ?)",
+            ((task_id, f"task {task_id}", f"https://notion.so/bench/{task_id}", deadline_ts,
+              _EXECUTORS + task_id % 1000, now, now)
+             for task_id, deadline_ts in enumerate(deadlines, 1))
+        )
+        conn.commit()
+
+
+def _table(deadlines: list, cancel: list) -> dict:
+    _seed_taken(deadlines)
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    with db.connection() as conn:
+        # Как при взятии: по вызову на задачу, в одной транзакции для замера самих запросов
+        for task_id in range(1, len(deadlines) + 1):
+            schedule_reminders(conn, task_id)
+        conn.commit()
+    schedule_seconds = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    with db.connection() as conn:
+        for task_id in cancel:
+            cancel_reminders(conn, [task_id])
+        conn.commit()
+    cancel_seconds = time.perf_counter() - started
+
+    with db.connection() as conn:
+        due = [row[0] for row in conn.execute("SELECT due_ts FROM reminders")]
+    passes = {tick: len({math.ceil(ts / tick) for ts in due}) for tick in (1, REMINDER_TICK)}
+
+    # Пусть первые 5000 напоминаний уже наступили — столько их приходится примерно на час
+    with db.connection() as conn:
+        conn.execute("""
+            UPDATE reminders SET due_ts = ? WHERE (task_id, minutes_left) IN (
+                SELECT task_id, minutes_left FROM reminders ORDER BY due_ts LIMIT 5000)
+        """, (now_ts() - 1,))
+        conn.commit()
+    started = time.perf_counter()
+    sent = 0
+    more = True
+    while more:
+        rows, _, more = pull_due(0)
+        sent += len(rows)
+    dispatch_seconds = time.perf_counter() - started
+
+    return {
+        "memory": memory,
+        "schedule": schedule_seconds,
+        "cancel": cancel_seconds,
+        "passes": passes,
+        "dispatch": dispatch_seconds,
+        "sent": sent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=100_000)
+    args = parser.parse_args()
+    random.seed(1)
+    deadlines = _deadlines(args.tasks)
+    cancel = random.sample(range(1, args.tasks + 1), args.tasks // 3)
+    reminders = len(deadlines) * len(REMINDERS_MIN)
+
+    result = asyncio.run(_apscheduler(deadlines, cancel))
+    print(f"APScheduler : {reminders} задач планировщика, память {result['memory'] / 2**20:.1f} МБ, "
+          f"постановка {result['schedule']:.2f} с, отмена у {len(cancel)} задач {result['cancel']:.2f} с")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "reminders.db")
+        db.init_db()
+        result = _table(deadlines, cancel)
+        db.pool.close()
+    passes = result["passes"]
+    print(f"reminders   : {reminders} строк, память {result['memory'] / 2**20:.1f} МБ, "
+          f"постановка {result['schedule']:.2f} с, отмена у {len(cancel)} задач {result['cancel']:.2f} с")
+    print(f"  проходов цикла за сутки: такт 1 с — {passes[1]}, такт {REMINDER_TICK} с — {passes[REMINDER_TICK]}; "
+          f"отправка {result['sent']} напоминаний за {result['dispatch']:.2f} с "
+          f"({result['dispatch'] / max(result['sent'], 1) * 1e6:.0f} мкс на напоминание)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# bench/retention.py
+"""
+Очистка аудита: один DELETE всех старых событий против services.retention
+(архив, дневные агрегаты и удаление пачками, затем incremental_vacuum).
+
+Пока идёт очистка, «обработчик» каждые 10 мс пишет событие и фиксирует
+транзакцию; максимальное время такой записи показывает, как долго очистка
+держала блокировку записи. Для варианта retention печатается отчёт задачи
+и размер архива.
+
+Запуск из корня проекта:
+    python -m bench.retention --events 500000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import db
+from services.events import write_events
+from services.retention import EventRetention, reclaim_space
+from utils.time import now_ts
+
+
+def _seed(events: int):
+    now = now_ts()
+    actions = ("create", "take", "remind", "submit", "done", "expire")
+    # Как в боте: события пишутся по мере наступления, id растёт вместе с ts
+    stamps = sorted(now - random.randint(0, 365 * 86400) for _ in range(events))
+    with db.connection() as conn:
+        conn.executemany(
+            "INSERT INTO events (ts, actor_id, action, task_id, meta) VALUES (?, ?, ?, ?, ?)",
+            (
+                (ts, random.randint(1, 1000), random.choice(actions), random.randint(1, 50_000), "mode: open")
+                for ts in stamps
+            )
+        )
+        conn.commit()
+
+
+async def _writer(stop: asyncio.Event) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await db.run_db(write_events, [(now_ts(), 1, "submit", 1, None)])
+        worst = max(worst, time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+    return worst
+
+
+def _single_delete(cutoff_ts: int) -> int:
+    with db.connection() as conn:
+        deleted = conn.execute("DELETE FROM events WHERE ts < ?", (cutoff_ts,)).rowcount
+        conn.commit()
+    return deleted
+
+
+async def _measure(work) -> tuple:
+    stop = asyncio.Event()
+    writer = asyncio.create_task(_writer(stop))
+    started = time.perf_counter()
+    result = await work()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return result, elapsed, await writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--days", type=int, default=180, help="срок хранения")
+    args = parser.parse_args()
+    random.seed(1)
+
+    for variant in ("один DELETE", "retention"):
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_PATH = os.path.join(tmp, "retention.db")
+            db.init_db()
+            _seed(args.events)
+            size = os.path.getsize(db.DB_PATH)
+
+            if variant == "один DELETE":
+                async def work():
+                    deleted = await db.run_db(_single_delete, now_ts() - args.days * 86400)
+                    return {"archived": deleted, "bytes_reclaimed": await reclaim_space()}
+            else:
+                job = EventRetention(args.days, os.path.join(tmp, "archive"))
+                work = job.run
+
+            report, elapsed, worst = asyncio.run(_measure(work))
+            archive = report.get("archive")
+            print(f"{variant:<12}: удалено {report['archived']} из {args.events} за {elapsed:.2f} с, "
+                  f"запись обработчика до {worst * 1000:.0f} мс, файл БД {size / 2**20:.1f} МБ, "
+                  f"освобождено {report['bytes_reclaimed'] / 2**20:.1f} МБ"
+                  + (f", архив {os.path.getsize(archive) / 2**20:.1f} МБ" if archive else ""))
+            db.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# bench/search.py
+"""
+Поиск PM по истории задач: старый LIKE '%...%' против FTS5-индекса tasks_fts.
+
+Запуск из корня проекта (заполнение 1M задач занимает около минуты):
+    python -m bench.search --tasks 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import db
+from services.search import build_match, search_tasks
+from utils.time import now_ts
+
+WORDS = ["лендинг", "редизайн", "баг", "онбординг", "отчёт", "интеграция", "api", "бот",
+         "миграция", "дашборд", "тесты", "поиск", "оплата", "профиль", "уведомления"]
+
+QUERIES = ["редиз", "api", "отчёт дашборд", "@user17", "notion.so/p-4242"]
+
+
+def _prepare(tasks: int, users: int):
+    db.init_db()
+    now = now_ts()
+    with db.connection() as conn:
+        conn.executemany(
+            "INSERT INTO users(tg_id, username, full_name, role) VALUES (?, ?, '', 'exec')",
+            [(1000 + i, f"user{i}") for i in range(users)]
+        )
+        batch = []
+        for i in range(tasks):
+            title = " ".join(random.sample(WORDS, 3)) + f" {i}"
+            batch.append((title, f"https://notion.so/p-{i}", 1000 + random.randrange(users), now - i, now - i))
+            if len(batch) == 10000:
+                _insert(conn, batch)
+                batch = []
+        if batch:
+            _insert(conn, batch)
+        conn.commit()
+
+
+def _insert(conn, batch):
+    conn.executemany(
+        "INSERT INTO tasks(title, notion_url, publish_mode, status, assigned_to, created_by, created_at, updated_at) "
+        "VALUES (?, ?, 'open', 'done', ?, 0, ?, ?)", batch
+    )
+
+
+def _like(text: str):
+    query_text = f"%{text}%"
+    with db.connection() as conn:
+        return conn.execute("""
+            SELECT t.*, u.username as assignee_username
+            FROM tasks t
+            LEFT JOIN users u ON t.assigned_to = u.tg_id
+            WHERE t.title LIKE ? OR t.notion_url LIKE ? OR u.username = ?
+            ORDER BY t.updated_at DESC
+            LIMIT 20
+        """, (query_text, query_text, text.lstrip('@'))).fetchall()
+
+
+def _fts(text: str):
+    rows, _ = search_tasks(build_match(text))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        started = time.perf_counter()
+        _prepare(args.tasks, args.users)
+        print(f"заполнение: {time.perf_counter() - started:.1f} с")
+
+        for query in QUERIES:
+            timings = []
+            for name, func in (("LIKE", _like), ("FTS5", _fts)):
+                started = time.perf_counter()
+                found = len(func(query))
+                timings.append(f"{name}={(time.perf_counter() - started) * 1000:8.1f}мс ({found})")
+            print(f"{query:>20}: " + "  ".join(timings))
+        db.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# bench/webhook.py
+"""
+Нагрузочный прогон приёма апдейтов через webhook без сети.
+
+Поднимает заглушку Bot API (bench/fake_bot_api.py) и WebhookServer на
+localhost, затем шлёт POST-запросами апдейты от множества чатов, как это
+делает Telegram. Обработчик имитирует работу (await на несколько мс) и
+запоминает порядок апдейтов в каждом чате. Печатает пропускную способность,
+задержку от отправки до обработки, максимум одновременно обрабатываемых
+апдейтов и число нарушений порядка внутри чата. Отдельно проверяется, что
+запрос без секретного токена отклоняется.
+
+Запуск из корня проекта:
+    python -m bench.webhook --updates 5000 --chats 200 --workers 1 16 64
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import aiohttp
+from aiogram import Bot, Dispatcher, Router, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from bench.fake_bot_api import FakeBotAPI
+from services.webhook import SECRET_HEADER, UpdateRunner, WebhookServer
+
+TOKEN = "42:fake"
+SECRET = "bench_secret"
+
+
+class _Recorder:
+    def __init__(self, work_ms: float):
+        self.work_ms = work_ms
+        self.order: dict[int, list] = {}
+        self.latency: list[float] = []
+        self.active = 0
+        self.max_active = 0
+
+    def router(self, sent_at: dict) -> Router:
+        router = Router()
+
+        @router.message()
+        async def on_message(message: types.Message):
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            await asyncio.sleep(random.uniform(0, 2 * self.work_ms) / 1000)
+            self.order.setdefault(message.chat.id, []).append(int(message.text))
+            self.latency.append(time.perf_counter() - sent_at[message.message_id])
+            self.active -= 1
+
+        return router
+
+
+def _update(update_id: int, chat_id: int, seq: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "U"},
+            "text": str(seq),
+        },
+    }
+
+
+def _p(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+
+async def _scenario(api_url: str, args, workers: int):
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+    recorder = _Recorder(args.work_ms)
+    sent_at: dict[int, float] = {}
+    dp = Dispatcher()
+    dp.include_router(recorder.router(sent_at))
+
+    runner = UpdateRunner(workers, args.queue)
+    runner.start(dp, bot)
+    server = WebhookServer(runner, "/webhook", SECRET)
+    url = await server.start("127.0.0.1", 0)
+    await bot.set_webhook(url, secret_token=SECRET)
+
+    updates = []
+    seq = {}
+    for update_id in range(1, args.updates + 1):
+        chat_id = random.randint(1, args.chats)
+        seq[chat_id] = seq.get(chat_id, 0) + 1
+        updates.append(_update(update_id, chat_id, seq[chat_id]))
+
+    async with aiohttp.ClientSession() as http:
+        async with http.post(url, json=updates[0]) as response:
+            unauthorized = response.status
+
+        # Telegram держит не больше max_connections запросов одновременно
+        # и шлёт апдейты одного чата по порядку: чат закреплён за соединением
+        lanes = [[] for _ in range(args.connections)]
+        for update in updates:
+            lanes[update["message"]["chat"]["id"] % args.connections].append(update)
+
+        async def connection(lane):
+            for update in lane:
+                sent_at[update["update_id"]] = time.perf_counter()
+                async with http.post(url, json=update, headers={SECRET_HEADER: SECRET}) as response:
+                    assert response.status == 200, response.status
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connection(lane) for lane in lanes))
+        await server.stop(drain_timeout=60)
+        elapsed = time.perf_counter() - started
+
+    await bot.session.close()
+    disorder = sum(1 for order in recorder.order.values() if order != sorted(order))
+    processed = sum(len(order) for order in recorder.order.values())
+    print(f"воркеров {workers:>3}: {processed / elapsed:7.0f} апдейтов/с, "
+          f"задержка p50={_p(recorder.latency, 0.5):6.1f}мс p99={_p(recorder.latency, 0.99):7.1f}мс, "
+          f"одновременно до {recorder.max_active}, чатов с нарушенным порядком {disorder}, "
+          f"без секрета -> HTTP {unauthorized}")
+
+
+async def _run(args):
+    api = FakeBotAPI()
+    api_url = await api.start()
+    for workers in args.workers:
+        await _scenario(api_url, args, workers)
+    await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--connections", type=int, default=40, help="параллельных HTTP-запросов от Telegram")
+    parser.add_argument("--work-ms", type=float, default=5.0, help="средняя длительность обработки апдейта")
+    parser.add_argument("--queue", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 16, 64])
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,249 @@
 # bot.py
 import asyncio
+import logging
+import signal
+import threading
 from aiogram import Bot, Dispatcher
-from config import BOT_TOKEN, EXPIRE_SCAN_INTERVAL
-from db import init_db
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from config import (
+    BOT_TOKEN, BOT_API_URL, BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_SECRET, UPDATE_WORKERS, UPDATE_QUEUE_SIZE, WORKERS, WORKER_SYNC_INTERVAL,
+    LOG_LEVEL, METRICS_HOST, METRICS_PORT,
+)
+from db import init_db, pool
 from handlers import common, pm, exec
-from scheduler import scheduler, check_expired_tasks, schedule_existing_tasks
+from scheduler import scheduler
+from services import cache
+from services.backup import backup
+from services.cluster import Supervisor, poll_updates
+from services.dedupe import callback_dedupe
+from services.digest import digest
+from services.expiry import expiry
+from services.leader import leader
+from services.metrics import ApiMetricsMiddleware, MetricsServer, UpdateMetricsMiddleware, registry
+from services.reminders import reminders
+from services.retention import retention
+from services.events import events
+from services.fsm_storage import fsm_storage
+from services.webhook import UpdateRunner, WebhookServer
+from services.outbox import outbox
 
-async def main():
-    init_db()
+logger = logging.getLogger(__name__)
+metrics_server = MetricsServer()
+
+def setup_logging():
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format="%(asctime)s %(levelname)s [%(processName)s] %(name)s: %(message)s",
+    )
+    # Время каждого апдейта уже есть в метриках, а медленные пишет services.metrics
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
 
-    bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
-    dp = Dispatcher()
+def create_bot() -> Bot:
+    # BOT_API_URL позволяет работать через свой Bot API сервер или локальную заглушку
+    session = AiohttpSession(api=TelegramAPIServer.from_base(BOT_API_URL)) if BOT_API_URL else None
+    bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+    # Время и ошибки каждого вызова Bot API
+    bot.session.middleware(ApiMetricsMiddleware())
+    return bot
 
+def create_dispatcher() -> Dispatcher:
+    # Состояния мастеров хранятся в SQLite и переживают перезапуск
+    dp = Dispatcher(storage=fsm_storage)
+    # Время обработки по callback_data/команде и лог медленных апдейтов
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    # Двойное нажатие кнопки, меняющей задачу, обрабатывается один раз
+    dp.callback_query.outer_middleware(callback_dedupe)
     dp.include_router(common.router)
     dp.include_router(pm.router)
     dp.include_router(exec.router)
+    return dp
+
+async def start_leader_jobs(bot: Bot):
+    """Фоновые задачи, которые должен выполнять ровно один процесс."""
+    # Движок просрочки: просыпается к ближайшему дедлайну
+    await expiry.start(bot)
+    # Напоминания хранятся в БД: цикл сам найдёт ближайшее
+    await reminders.start(bot)
+    scheduler.resume()
+
+async def stop_leader_jobs():
+    scheduler.pause()
+    await reminders.stop()
+    await expiry.stop()
+
+async def start_services(bot: Bot, metrics_port: int | None = METRICS_PORT):
+    # Очередь исходящих сообщений с учётом лимитов Telegram
+    outbox.start(bot)
+
+    # Буфер аудита: события без смены статуса пишутся пачками
+    events.start()
+    # Просрочки и отказы уходят PM сводкой раз в PM_DIGEST_WINDOW
+    digest.start()
+    fsm_storage.start()
+
+    # Планировщик стартует на паузе и работает только у лидера
+    scheduler.start(paused=True)
+    leader.start(lambda: start_leader_jobs(bot), stop_leader_jobs)
+
+    # Состояние сервисов снимается в момент запроса /metrics
+    registry.collect("outbox", outbox.stats)
+    registry.collect("events", events.stats)
+    registry.collect("fsm", fsm_storage.stats)
+    registry.collect("db_pool", pool.stats)
+    registry.collect("leader", lambda: {"is_leader": leader.is_leader})
+    registry.collect("expiry", lambda: {"expired_total": expiry.expired_total})
+    registry.collect("reminders", reminders.stats)
+    registry.collect("cache_users", cache.users.stats)
+    registry.collect("cache_cards", cache.task_cards.stats)
+    registry.collect("retention", retention.stats)
+    registry.collect("digest", digest.stats)
+    registry.collect("callback_dedupe", callback_dedupe.stats)
+    registry.collect("backup", backup.stats)
+    if metrics_port is not None:
+        logger.info("Метрики: %s", await metrics_server.start(METRICS_HOST, metrics_port))
+
+async def stop_services():
+    await metrics_server.stop()
+    await leader.stop()
+    await events.stop()
+    await digest.stop()
+    await outbox.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    pool.close()
+
+def _stop_event() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+async def run_webhook(bot: Bot, intake, allowed_updates: list):
+    """Принимает апдейты через webhook до SIGINT/SIGTERM, затем дорабатывает принятые."""
+    server = WebhookServer(intake, WEBHOOK_PATH, WEBHOOK_SECRET)
+    stop = _stop_event()
+    local_url = await server.start(WEBHOOK_HOST, WEBHOOK_PORT)
+    await bot.set_webhook(
+        WEBHOOK_URL + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=allowed_updates,
+        max_connections=UPDATE_WORKERS * WORKERS,
+    )
+    logger.info("Webhook слушает %s", local_url)
+    try:
+        await stop.wait()
+    finally:
+        await server.stop(drain_timeout=30)
+
+async def main():
+    init_db()
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    await start_services(bot)
 
-    # Запускаем фоновую задачу для проверки просрочек
-    scheduler.add_job(check_expired_tasks, "interval", seconds=EXPIRE_SCAN_INTERVAL, args=[bot])
-    
-    # При старте восстанавливаем напоминания для активных задач
-    schedule_existing_tasks(bot)
-    
-    # Запускаем планировщик
-    scheduler.start()
-
-    print("Бот запущен...")
-    
-    # Удаляем старый webhook перед запуском, чтобы избежать конфликтов
-    await bot.delete_webhook(drop_pending_updates=True)
-    
-    # Запускаем бота в режиме опроса
-    await dp.start_polling(bot)
+    logger.info("Бот запущен")
+
+    try:
+        if BOT_MODE == "webhook":
+            runner = UpdateRunner(UPDATE_WORKERS, UPDATE_QUEUE_SIZE)
+            runner.start(dp, bot, dispatcher=dp, bots=[bot])
+            registry.collect("updates", runner.stats)
+            await dp.emit_startup(bot=bot, bots=[bot], dispatcher=dp)
+            try:
+                await run_webhook(bot, runner, dp.resolve_used_update_types())
+            finally:
+                await dp.emit_shutdown(bot=bot, bots=[bot], dispatcher=dp)
+        else:
+            # Удаляем старый webhook перед запуском, чтобы избежать конфликтов
+            await bot.delete_webhook(drop_pending_updates=True)
+
+            # Запускаем бота в режиме опроса
+            await dp.start_polling(bot)
+    finally:
+        await stop_services()
+
+# --- Несколько процессов (WORKERS > 1) ---
+
+async def run_worker(index: int, count: int, updates):
+    """Воркер: обрабатывает апдейты своих чатов из очереди главного процесса."""
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    # Общий лимит отправки делится между процессами
+    outbox.global_rate = outbox.global_rate / count
+    # Задачи и напоминания создают и другие процессы: лидер чаще сверяется с БД
+    expiry.resync_interval = WORKER_SYNC_INTERVAL
+    reminders.max_sleep = WORKER_SYNC_INTERVAL
+    await start_services(bot, None if METRICS_PORT is None else METRICS_PORT + 1 + index)
+
+    runner = UpdateRunner(UPDATE_WORKERS, UPDATE_QUEUE_SIZE)
+    runner.start(dp, bot, dispatcher=dp, bots=[bot])
+    registry.collect("updates", runner.stats)
+    await dp.emit_startup(bot=bot, bots=[bot], dispatcher=dp)
+    logger.info("Воркер %s запущен", index)
+
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def read_updates():
+        # Блокирующее чтение очереди в отдельном потоке; None — сигнал остановки
+        while (data := updates.get()) is not None:
+            asyncio.run_coroutine_threadsafe(runner.submit_raw(data), loop).result()
+        loop.call_soon_threadsafe(done.set_result, None)
+
+    threading.Thread(target=read_updates, name="updates", daemon=True).start()
+    try:
+        await done
+        await runner.drain(timeout=30)
+    finally:
+        await dp.emit_shutdown(bot=bot, bots=[bot], dispatcher=dp)
+        await stop_services()
+        await bot.session.close()
+
+def worker_process(index: int, count: int, updates):
+    # Ctrl+C получает вся группа процессов; воркер останавливается по сигналу из очереди
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging()
+    asyncio.run(run_worker(index, count, updates))
+
+async def run_cluster():
+    # Миграции выполняет главный процесс до запуска воркеров
+    init_db()
+    pool.close()
+
+    bot = create_bot()
+    allowed_updates = create_dispatcher().resolve_used_update_types()
+    supervisor = Supervisor(worker_process, WORKERS)
+    supervisor.start()
+    registry.collect("supervisor", supervisor.stats)
+    if METRICS_PORT is not None:
+        logger.info("Метрики главного процесса: %s", await metrics_server.start(METRICS_HOST, METRICS_PORT))
+    logger.info("Бот запущен: %s воркеров", WORKERS)
+
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, supervisor, allowed_updates)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            stop = _stop_event()
+            polling = asyncio.create_task(poll_updates(bot, supervisor, allowed_updates))
+            await stop.wait()
+            polling.cancel()
+            await asyncio.gather(polling, return_exceptions=True)
+            await supervisor.drain(timeout=30)
+    finally:
+        await metrics_server.stop()
+        await bot.session.close()
 
 if __name__ == "__main__":
+    setup_logging()
     try:
-        asyncio.run(main())
+        asyncio.run(run_cluster() if WORKERS > 1 else main())
     except (KeyboardInterrupt, SystemExit):
-        print("Бот остановлен.")
-        if scheduler.running:
-            scheduler.shutdown()
+        pass
+    logger.info("Бот остановлен")
@@ -2,9 +2,62 @@ BOT_TOKEN = "8352066610:AAEZJwG02POlFwChovgZc1-2XLJlntm_TwA"
 PM_IDS = {2080541364}              # tg_id админов
 MAX_ACTIVE_TASKS = 1
 REMINDERS_MIN = [60, 15, 5]
-EXPIRE_SCAN_INTERVAL = 60
+REMINDER_TICK = 5                # напоминания, наступившие внутри такта, уходят одним проходом, сек
+EXPIRE_SCAN_INTERVAL = 60        # сверка просрочек с БД, сек
+EVENT_FLUSH_SIZE = 200           # буферизованные события пишутся пачкой такого размера
+EVENT_FLUSH_INTERVAL = 1.0       # ... или не реже чем раз в столько секунд
+EVENTS_RETENTION_DAYS = 180      # события старше уходят в архив; None — хранить всё
+EVENTS_ARCHIVE_DIR = "./data/archive"  # сжатые JSONL-архивы событий
+RETENTION_HOUR = 4               # во сколько (по TIMEZONE) запускается очистка аудита
+RETENTION_BATCH = 500            # событий за одну транзакцию удаления
+VACUUM_STEP_PAGES = 1000         # страниц за один шаг incremental_vacuum
+BACKUP_DIR = "./data/backups"    # сжатые снимки базы; лучше держать на другом диске
+BACKUP_INTERVAL_HOURS = 6        # как часто планировщик снимает копию
+BACKUP_KEEP = 8                  # сколько последних снимков хранить
+BACKUP_STEP_PAGES = 1024         # страниц за один шаг backup API
+BACKUP_STEP_PAUSE = 0.005        # пауза между шагами, сек
+BACKUP_MAX_RESTARTS = 3          # после стольких перезапусков копии остаток копируется одним шагом
+FSM_FLUSH_INTERVAL = 2.0         # состояния мастеров пишутся в БД раз в столько секунд
+FSM_STATE_TTL = 24 * 3600        # брошенный мастер удаляется через столько секунд
+FSM_CACHE_IDLE = 600             # запись уходит из кэша FSM после простоя, сек
+USER_CACHE_SIZE = 10000          # профилей в кэше /start
+USER_CACHE_TTL = 3600            # профиль перезаписывается в БД не реже чем раз в столько секунд
+CARD_CACHE_SIZE = 5000           # готовых карточек задач для списков исполнителя
+CARD_CACHE_TTL = 600             # сек
 DIRECT_REOPEN_POLICY = "same"    # 'same' | 'open'
 DB_PATH = "./data/bot.db"
-EXPORT_DIR = "./exports"
+DB_WORKERS = 4                   # потоки для запросов к SQLite
+DB_POOL_SIZE = 5                 # максимум одновременно открытых соединений
+DB_CACHE_SIZE_KB = 16000         # PRAGMA cache_size на соединение
+DB_MMAP_SIZE = 64 * 1024 * 1024  # PRAGMA mmap_size
+DB_CACHED_STATEMENTS = 256       # кэш подготовленных запросов на соединение
+EXPORT_CHUNK_ROWS = 1000         # строк выгрузки, читаемых из БД за раз
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024  # выгрузка больше этого уходит из памяти во временный файл ОС
+IMPORT_MAX_ROWS = 20000          # строк в одном файле массового импорта
 DEEP_LINK_SECRET = "change_me"
 TIMEZONE = "Europe/Kyiv"
+BOT_API_URL = None               # свой/локальный Bot API сервер, например "http://127.0.0.1:8081"
+SEND_GLOBAL_RATE = 30            # исходящих сообщений в секунду на бота
+SEND_CHAT_RATE = 1               # сообщений в секунду в один чат
+SEND_CHAT_BURST = 3              # сколько сообщений в чат можно отправить подряд
+SEND_WORKERS = 4                 # параллельных запросов к Bot API
+PM_DIGEST_WINDOW = 10            # просрочки и отказы копятся столько секунд и уходят PM одной сводкой; 0 — сразу
+PM_DIGEST_MAX_LINES = 20         # строк сводки на PM и вид события, остальные только считаются
+CALLBACK_DEDUPE_TTL = 5          # повтор кнопки «Принять»/«Сдать»/... в течение стольких секунд не обрабатывается; 0 — выключить
+CALLBACK_DEDUPE_SIZE = 10000     # сколько недавних нажатий помнить
+BOT_MODE = "polling"             # 'polling' | 'webhook'
+WEBHOOK_URL = "https://example.com"  # публичный адрес, на который Telegram шлёт апдейты
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_HOST = "0.0.0.0"         # где слушает локальный aiohttp-сервер
+WEBHOOK_PORT = 8080
+WEBHOOK_SECRET = "change_me"     # X-Telegram-Bot-Api-Secret-Token: A-Z, a-z, 0-9, _ и -
+UPDATE_WORKERS = 16              # апдейтов разных чатов в обработке одновременно
+UPDATE_QUEUE_SIZE = 1000         # принятых, но не обработанных апдейтов, дальше прием ждет
+WORKERS = 1                      # процессов-обработчиков; >1 — апдейты делятся между ними по chat id
+LEADER_LEASE_TTL = 15            # аренда лидера (просрочка, напоминания, планировщик), сек
+WORKER_SYNC_INTERVAL = 5         # при WORKERS > 1: как часто лидер сверяет дедлайны и напоминания с БД, сек
+LOG_LEVEL = "INFO"
+METRICS_HOST = "127.0.0.1"       # метрики Prometheus: http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_PORT = 9108              # None — не поднимать; при WORKERS > 1 воркер i слушает METRICS_PORT + 1 + i
+SLOW_UPDATE_MS = 1000            # апдейт или итерация фоновой задачи дольше этого пишется в лог с разбивкой
+SLOW_QUERY_MS = 200              # SQL-запрос дольше этого пишется в лог
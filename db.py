@@ -1,80 +1,540 @@
+import asyncio
+import contextvars
+import json
+import logging
+import queue
 import sqlite3
 import os
-from config import DB_PATH
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from config import (
+    REMINDERS_MIN, DB_PATH, DB_WORKERS, DB_POOL_SIZE, DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_CACHED_STATEMENTS,
+)
+from services.metrics import observe_db_wait, observe_sql
+
+logger = logging.getLogger(__name__)
+
+# Отдельный пул потоков для работы с SQLite. Все обращения к БД из корутин
+# идут через него, чтобы долгий запрос или ожидание блокировки не
+# останавливали event loop и обработку апдейтов других пользователей.
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Соединение, которое замеряет execute/executemany/commit для services.metrics.
+    Для SELECT замеряется время до первой строки — основная работа запроса.
+    """
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            observe_sql(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            observe_sql(sql, time.perf_counter() - started)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            observe_sql("COMMIT", time.perf_counter() - started)
 
 def get_conn():
     """
-    Устанавливает соединение с БД.
-    - timeout=15 решает проблему 'database is locked'.
-    - PRAGMA journal_mode=WAL включает режим Write-Ahead Logging для лучшей
-      производительности при одновременном доступе.
+    Открывает новое соединение с БД и настраивает его.
+    - timeout=15 / busy_timeout решают проблему 'database is locked'.
+    - journal_mode=WAL включает Write-Ahead Logging для одновременного доступа.
+    - synchronous=NORMAL в WAL-режиме безопасен и не делает fsync на каждый commit.
+    - cached_statements держит подготовленные запросы на всё время жизни соединения.
+    - TimedConnection замеряет запросы для метрик и лога медленных запросов.
+    Обработчики берут соединения из пула через `connection()`, а не открывают их сами.
     """
-    conn = sqlite3.connect(DB_PATH, timeout=15)
+    conn = sqlite3.connect(DB_PATH, timeout=15, check_same_thread=False,
+                           cached_statements=DB_CACHED_STATEMENTS, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
-    # Включаем WAL-режим. Это нужно сделать один раз для файла БД.
-    # Последующие вызовы просто подтвердят, что режим уже включен.
     conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute("PRAGMA busy_timeout=15000;")
+    conn.execute(f"PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)};")
+    conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)};")
+    conn.execute("PRAGMA temp_store=MEMORY;")
     return conn
 
-def init_db():
-    """Инициализирует таблицы в базе данных."""
-    # Убедимся, что папка data существует
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    
-    conn = get_conn()
-    cur = conn.cursor()
-
-    # Таблица для хранения информации о пользователях
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users(
-      id INTEGER PRIMARY KEY,
-      tg_id INTEGER UNIQUE NOT NULL,
-      username TEXT,
-      full_name TEXT,
-      role TEXT CHECK(role IN ('pm','exec')) NOT NULL,
-      is_active INTEGER DEFAULT 1
-    )
-    """)
 
-    # Таблица для хранения задач
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS tasks(
-      id INTEGER PRIMARY KEY,
-      title TEXT NOT NULL,
-      notion_url TEXT NOT NULL,
-      level TEXT,
-      est_hours REAL,
-      publish_mode TEXT CHECK(publish_mode IN ('open','direct')) NOT NULL,
-      deadline_ts INTEGER,
-      status TEXT CHECK(status IN ('new','taken','done','dropped','expired')) DEFAULT 'new',
-      assigned_to INTEGER,
-      created_by INTEGER NOT NULL,
-      allowed_usernames TEXT,
-      dedupe_hash TEXT,
-      created_at INTEGER,
-      updated_at INTEGER
-    )
-    """)
+class ConnectionPool:
+    """
+    Ограниченный пул долгоживущих соединений.
+    Соединения создаются лениво (не больше `size`) и настраиваются один раз
+    в `get_conn()`. Если все заняты, поток ждёт освобождения — время ожидания
+    и случаи насыщения пула учитываются в счётчиках `stats()`.
+    """
 
-    # Уникальный индекс для предотвращения дублей активных задач
-    cur.execute("""
-    CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_notion_active
-    ON tasks(dedupe_hash)
-    WHERE status IN ('new','taken')
-    """)
+    def __init__(self, size: int):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self.checkouts = 0
+        self.saturated = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+                    self.saturated += 1
+            if create:
+                try:
+                    conn = get_conn()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                conn = self._idle.get()
+                waited = time.perf_counter() - started
+                with self._lock:
+                    self.wait_time_total += waited
+                    self.wait_time_max = max(self.wait_time_max, waited)
+        with self._lock:
+            self.checkouts += 1
+            self._in_use += 1
+        return conn
+
+    def _release(self, conn):
+        # Незавершённая транзакция не должна достаться следующему владельцу
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "checkouts": self.checkouts,
+                "saturated": self.saturated,
+                "wait_time_total_ms": round(self.wait_time_total * 1000, 3),
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+            }
+
+    def close(self):
+        """Закрывает свободные соединения (при остановке бота)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+pool = ConnectionPool(DB_POOL_SIZE)
+
+def connection():
+    """Контекстный менеджер: выдаёт соединение из пула и возвращает его обратно."""
+    return pool.connection()
+
+async def run_db(func, *args, **kwargs):
+    """
+    Выполняет синхронную функцию работы с БД в пуле потоков `_executor`.
+    Контекст корутины (трасса текущего апдейта для метрик) переносится в поток.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    submitted = time.perf_counter()
 
-    # Таблица для логирования всех действий в системе (аудит)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS events(
-      id INTEGER PRIMARY KEY,
-      ts INTEGER,
-      actor_id INTEGER,
-      action TEXT,
-      task_id INTEGER,
-      meta TEXT
+    def call():
+        observe_db_wait(time.perf_counter() - submitted)
+        return func(*args, **kwargs)
+
+    return await loop.run_in_executor(_executor, context.run, call)
+
+
+def _fetchone(sql, params):
+    with connection() as conn:
+        return conn.execute(sql, params).fetchone()
+
+def _fetchall(sql, params):
+    with connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+def _execute(sql, params):
+    with connection() as conn:
+        cur = conn.execute(sql, params)
+        conn.commit()
+        return cur.lastrowid
+
+async def fetchone(sql, params=()):
+    """Асинхронно выполняет SELECT и возвращает первую строку (или None)."""
+    return await run_db(_fetchone, sql, params)
+
+async def fetchall(sql, params=()):
+    """Асинхронно выполняет SELECT и возвращает все строки."""
+    return await run_db(_fetchall, sql, params)
+
+async def execute(sql, params=()):
+    """Асинхронно выполняет изменяющий запрос с commit, возвращает lastrowid."""
+    return await run_db(_execute, sql, params)
+
+
+# --- Миграции схемы ---
+#
+# Каждая миграция — (версия, описание, шаги). Шаг — SQL-строка или функция,
+# принимающая соединение. Миграции применяются по возрастанию версии, каждая
+# в своей транзакции, а номер версии записывается в schema_version.
+# Шаги должны быть идемпотентными (IF NOT EXISTS), чтобы повторный запуск
+# на уже существующей базе ничего не ломал.
+
+MIGRATIONS = [
+    (1, "базовая схема", [
+        # Таблица для хранения информации о пользователях
+        """
+        CREATE TABLE IF NOT EXISTS users(
+          id INTEGER PRIMARY KEY,
+          tg_id INTEGER UNIQUE NOT NULL,
+          username TEXT,
+          full_name TEXT,
+          role TEXT CHECK(role IN ('pm','exec')) NOT NULL,
+          is_active INTEGER DEFAULT 1
+        )
+        """,
+        # Таблица для хранения задач
+        """
+        CREATE TABLE IF NOT EXISTS tasks(
+          id INTEGER PRIMARY KEY,
+          title TEXT NOT NULL,
+          notion_url TEXT NOT NULL,
+          level TEXT,
+          est_hours REAL,
+          publish_mode TEXT CHECK(publish_mode IN ('open','direct')) NOT NULL,
+          deadline_ts INTEGER,
+          status TEXT CHECK(status IN ('new','taken','done','dropped','expired')) DEFAULT 'new',
+          assigned_to INTEGER,
+          created_by INTEGER NOT NULL,
+          allowed_usernames TEXT,
+          dedupe_hash TEXT,
+          created_at INTEGER,
+          updated_at INTEGER
+        )
+        """,
+        # Уникальный индекс для предотвращения дублей активных задач
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_notion_active
+        ON tasks(dedupe_hash)
+        WHERE status IN ('new','taken')
+        """,
+        # Таблица для логирования всех действий в системе (аудит)
+        """
+        CREATE TABLE IF NOT EXISTS events(
+          id INTEGER PRIMARY KEY,
+          ts INTEGER,
+          actor_id INTEGER,
+          action TEXT,
+          task_id INTEGER,
+          meta TEXT
+        )
+        """,
+    ]),
+    (2, "индексы для горячих запросов", [
+        # exec_open, exec_direct: новые задачи по типу публикации и дедлайну
+        "CREATE INDEX IF NOT EXISTS idx_tasks_status_mode_deadline ON tasks(status, publish_mode, deadline_ts)",
+        # pm_inprogress и сверка просрочек services.expiry.expire_tasks: выборка по статусу и дедлайну
+        "CREATE INDEX IF NOT EXISTS idx_tasks_status_deadline ON tasks(status, deadline_ts)",
+        # pm_queue: новые задачи по времени создания
+        "CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks(status, created_at)",
+        # exec_my и проверка лимита в exec_take: частичный индекс только по
+        # взятым задачам; status в ключе делает его покрывающим для COUNT
+        """
+        CREATE INDEX IF NOT EXISTS idx_tasks_taken_assignee
+        ON tasks(assigned_to, status)
+        WHERE status='taken'
+        """,
+        # Экспорт по created_at и поиск с сортировкой по updated_at
+        "CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks(updated_at)",
+        # Аудит: история по задаче и выборки по времени
+        "CREATE INDEX IF NOT EXISTS idx_events_task ON events(task_id, ts)",
+        "CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts)",
+    ]),
+    (3, "таблица точечных назначений task_assignees", [
+        """
+        CREATE TABLE IF NOT EXISTS task_assignees(
+          task_id INTEGER NOT NULL,
+          username_lower TEXT NOT NULL,
+          tg_id INTEGER,
+          PRIMARY KEY (task_id, username_lower)
+        ) WITHOUT ROWID
+        """,
+        # exec_direct: все задачи, назначенные username
+        "CREATE INDEX IF NOT EXISTS idx_task_assignees_username ON task_assignees(username_lower, task_id)",
+        # Поиск tg_id по username без учёта регистра
+        "CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users(lower(username))",
+        # Переносим назначения из JSON-колонки allowed_usernames
+        """
+        INSERT OR IGNORE INTO task_assignees(task_id, username_lower, tg_id)
+        SELECT t.id, lower(ltrim(j.value, '@')),
+               (SELECT u.tg_id FROM users u WHERE lower(u.username) = lower(ltrim(j.value, '@')))
+        FROM tasks t, json_each(t.allowed_usernames) j
+        WHERE t.publish_mode = 'direct' AND json_valid(t.allowed_usernames)
+          AND ltrim(j.value, '@') != ''
+        """,
+    ]),
+    (4, "полнотекстовый индекс tasks_fts для поиска PM", [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+          title, notion_url, assignee,
+          tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """,
+        # Для обновления assignee при смене username
+        "CREATE INDEX IF NOT EXISTS idx_tasks_assigned_to ON tasks(assigned_to)",
+        # Триггеры держат индекс в синхронизации с tasks. Смена статуса
+        # (самое частое обновление) индекс не трогает.
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+          INSERT INTO tasks_fts(rowid, title, notion_url, assignee)
+          VALUES (new.id, new.title, new.notion_url,
+                  (SELECT username FROM users WHERE tg_id = new.assigned_to));
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF title, notion_url, assigned_to ON tasks BEGIN
+          DELETE FROM tasks_fts WHERE rowid = old.id;
+          INSERT INTO tasks_fts(rowid, title, notion_url, assignee)
+          VALUES (new.id, new.title, new.notion_url,
+                  (SELECT username FROM users WHERE tg_id = new.assigned_to));
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+          DELETE FROM tasks_fts WHERE rowid = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username ON users
+        WHEN old.username IS NOT new.username BEGIN
+          UPDATE tasks_fts SET assignee = new.username
+          WHERE rowid IN (SELECT id FROM tasks WHERE assigned_to = new.tg_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+          UPDATE tasks_fts SET assignee = new.username
+          WHERE rowid IN (SELECT id FROM tasks WHERE assigned_to = new.tg_id);
+        END
+        """,
+        # Заполняем индекс по уже существующим задачам
+        "DELETE FROM tasks_fts",
+        """
+        INSERT INTO tasks_fts(rowid, title, notion_url, assignee)
+        SELECT t.id, t.title, t.notion_url, u.username
+        FROM tasks t
+        LEFT JOIN users u ON u.tg_id = t.assigned_to
+        """,
+    ]),
+    (5, "таблица напоминаний reminders", [
+        """
+        CREATE TABLE IF NOT EXISTS reminders(
+          task_id INTEGER NOT NULL,
+          minutes_left INTEGER NOT NULL,
+          user_id INTEGER NOT NULL,
+          due_ts INTEGER NOT NULL,
+          PRIMARY KEY (task_id, minutes_left)
+        ) WITHOUT ROWID
+        """,
+        # Цикл напоминаний: ближайшие по времени
+        "CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(due_ts)",
+        # Раньше напоминания жили только в памяти планировщика: ставим их
+        # для уже взятых задач
+        lambda conn: conn.execute("""
+            INSERT OR IGNORE INTO reminders(task_id, minutes_left, user_id, due_ts)
+            SELECT t.id, m.value, t.assigned_to, t.deadline_ts - m.value * 60
+            FROM tasks t, json_each(?) m
+            WHERE t.status = 'taken' AND t.assigned_to IS NOT NULL
+              AND t.deadline_ts - m.value * 60 > ?
+        """, (json.dumps(REMINDERS_MIN), int(time.time()))),
+    ]),
+    (6, "состояния FSM fsm_states", [
+        # key — StorageKey aiogram в виде строки bot:chat:user:thread:business:destiny
+        """
+        CREATE TABLE IF NOT EXISTS fsm_states(
+          key TEXT PRIMARY KEY,
+          state TEXT,
+          data TEXT,
+          updated_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+        # Удаление брошенных мастеров по TTL
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at)",
+    ]),
+    (7, "аренда лидерства leases", [
+        # Одна строка на роль: кто из процессов её держит и до какого времени
+        """
+        CREATE TABLE IF NOT EXISTS leases(
+          name TEXT PRIMARY KEY,
+          holder TEXT NOT NULL,
+          expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (8, "сводная статистика stats_levels и stats_executors", [
+        # Время взятия задачи: от него считается время выполнения
+        lambda conn: _add_column(conn, "tasks", "taken_at", "INTEGER"),
+        """
+        UPDATE tasks SET taken_at = (
+          SELECT MAX(e.ts) FROM events e WHERE e.task_id = tasks.id AND e.action = 'take'
+        )
+        WHERE assigned_to IS NOT NULL AND taken_at IS NULL
+        """,
+        # Счётчики переходов статуса и сумма времени выполнения (в секундах)
+        """
+        CREATE TABLE IF NOT EXISTS stats_levels(
+          level TEXT PRIMARY KEY,
+          created INTEGER NOT NULL DEFAULT 0,
+          taken INTEGER NOT NULL DEFAULT 0,
+          dropped INTEGER NOT NULL DEFAULT 0,
+          done INTEGER NOT NULL DEFAULT 0,
+          returned INTEGER NOT NULL DEFAULT 0,
+          expired INTEGER NOT NULL DEFAULT 0,
+          lead_sum INTEGER NOT NULL DEFAULT 0,
+          lead_count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS stats_executors(
+          user_id INTEGER PRIMARY KEY,
+          taken INTEGER NOT NULL DEFAULT 0,
+          dropped INTEGER NOT NULL DEFAULT 0,
+          done INTEGER NOT NULL DEFAULT 0,
+          returned INTEGER NOT NULL DEFAULT 0,
+          expired INTEGER NOT NULL DEFAULT 0,
+          lead_sum INTEGER NOT NULL DEFAULT 0,
+          lead_count INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        # Экран статистики: топ исполнителей по сданным и просроченным
+        "CREATE INDEX IF NOT EXISTS idx_stats_executors_done ON stats_executors(done)",
+        "CREATE INDEX IF NOT EXISTS idx_stats_executors_expired ON stats_executors(expired)",
+        # Заполняем сводку по уже накопленному аудиту
+        lambda conn: _rebuild_stats(conn),
+    ]),
+    (9, "дневные агрегаты аудита events_daily", [
+        # Сюда сворачиваются события, ушедшие в архив (services/retention.py)
+        """
+        CREATE TABLE IF NOT EXISTS events_daily(
+          day TEXT NOT NULL,
+          action TEXT NOT NULL,
+          events INTEGER NOT NULL,
+          PRIMARY KEY (day, action)
+        ) WITHOUT ROWID
+        """,
+    ]),
+]
+
+
+def _add_column(conn, table: str, column: str, decl: str):
+    """ALTER TABLE ADD COLUMN не умеет IF NOT EXISTS."""
+    if column not in {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _rebuild_stats(conn):
+    # services.stats сам импортирует db
+    from services.stats import rebuild
+    rebuild(conn)
+
+
+def migrate(conn):
+    """Применяет недостающие миграции. Возвращает итоговую версию схемы."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version(
+      version INTEGER PRIMARY KEY,
+      description TEXT,
+      applied_at INTEGER
     )
     """)
-
     conn.commit()
-    conn.close()
-    print(f"База инициализирована в {DB_PATH}")
+    current = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_version(version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, int(time.time()))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Применена миграция %s: %s", version, description)
+        current = version
+
+    # Обновляем статистику планировщика запросов для новых индексов
+    conn.execute("PRAGMA optimize;")
+    return current
+
+
+def enable_incremental_vacuum(conn):
+    """
+    auto_vacuum=INCREMENTAL нужен, чтобы очистка аудита возвращала место
+    шагами. На новой базе включается сразу, на существующей — только полным
+    VACUUM, который выполняется один раз.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        logger.info("Перестраиваем базу для incremental_vacuum (один раз)")
+        conn.execute("VACUUM")
+
+
+def init_db():
+    """Создаёт базу и доводит схему до последней версии."""
+    # Убедимся, что папка data существует
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+
+    with connection() as conn:
+        enable_incremental_vacuum(conn)
+        version = migrate(conn)
+    logger.info("База инициализирована в %s (схема v%s)", DB_PATH, version)
@@ -4,9 +4,10 @@ from aiogram.filters import Command, CommandStart, CommandObject
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from config import PM_IDS
-from db import get_conn
+from db import execute, fetchone
 from utils.time import now_ts, humanize_ts
 from keyboards import pm_menu, exec_menu
+from services.cache import users
 from services.direct import validate_token
 
 router = Router()
@@ -19,20 +20,22 @@ async def cmd_start(message: types.Message, command: CommandObject):
     full_name = message.from_user.full_name or ""
     role = "pm" if tg_id in PM_IDS else "exec"
 
-    conn = get_conn()
-    conn.execute("""
-    INSERT INTO users(tg_id, username, full_name, role, is_active) VALUES (?, ?, ?, ?, 1)
-    ON CONFLICT(tg_id) DO UPDATE SET
-        username=excluded.username, full_name=excluded.full_name, role=excluded.role, is_active=1
-    """, (tg_id, username, full_name, role))
-    conn.commit()
-    
+    # Повторный /start с тем же профилем не пишет в БД
+    profile = (username, full_name, role)
+    if users.get(tg_id) != profile:
+        await execute("""
+        INSERT INTO users(tg_id, username, full_name, role, is_active) VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT(tg_id) DO UPDATE SET
+            username=excluded.username, full_name=excluded.full_name, role=excluded.role, is_active=1
+        """, (tg_id, *profile))
+        users.set(tg_id, profile)
+
     # ОБРАБОТКА DEEPLINK
     if command.args and command.args.startswith("claim_"):
         token = command.args.replace("claim_", "")
         task_id = validate_token(token)
         if task_id:
-            task = conn.execute("SELECT * FROM tasks WHERE id = ? AND status = 'new'", (task_id,)).fetchone()
+            task = await fetchone("SELECT * FROM tasks WHERE id = ? AND status = 'new'", (task_id,))
             if task:
                 text = (f"<b>Вам предложена задача #{task['id']}</b>: {task['title']}\n\n"
                         f"Уровень: {task['level']}\n"
@@ -45,10 +48,8 @@ async def cmd_start(message: types.Message, command: CommandObject):
                 await message.answer("Эта задача уже недоступна (взята другим исполнителем или удалена).")
         else:
             await message.answer("Ссылка недействительна или ее срок истек.")
-        conn.close()
         return
 
-    conn.close()
     # Стандартное приветствие
     if role == "pm":
         await message.answer(f"Привет, {full_name}! Вы вошли как PM.", reply_markup=pm_menu())
@@ -1,156 +1,252 @@
 # exec.py
+import logging
+from contextlib import suppress
+
 from aiogram import Router, types, F
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-import json
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from config import MAX_ACTIVE_TASKS, PM_IDS
-from db import get_conn
-from keyboards import pm_review_kb
+from db import connection, fetchone, run_db
+from keyboards import pm_review_kb, list_page_kb
 from utils.time import now_ts, humanize_ts
-from scheduler import schedule_reminders_for_task, log_event
+from services.cache import task_cards
+from services.digest import digest
+from services.outbox import outbox
+from services.expiry import expiry
+from services.lists import fetch_page, parse_page_callback
+from services.reminders import reminders, schedule_reminders, cancel_reminders
+from services.events import events, log_event_within_connection
+from services.stats import record_transition
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
 
-def task_card_kb(task_id: int, mode: str):
+def task_action_rows(task_id: int, mode: str) -> list:
     """
-    Создает клавиатуру для карточки задачи в зависимости от ее статуса.
+    Кнопки действий с задачей в списке в зависимости от ее статуса.
     """
     if mode == "open" or mode == "direct":
-        return InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🖐 Принять", callback_data=f"exec_take_{task_id}")]
-        ])
-    elif mode == "taken":
-        return InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Сдать", callback_data=f"exec_submit_{task_id}")],
-            [InlineKeyboardButton(text="🚫 Отказаться", callback_data=f"exec_drop_{task_id}")]
-        ])
-    return None
+        return [[InlineKeyboardButton(text=f"🖐 Принять #{task_id}", callback_data=f"exec_take_{task_id}")]]
+    elif mode == "my":
+        return [[
+            InlineKeyboardButton(text=f"✅ Сдать #{task_id}", callback_data=f"exec_submit_{task_id}"),
+            InlineKeyboardButton(text=f"🚫 Отказаться #{task_id}", callback_data=f"exec_drop_{task_id}")
+        ]]
+    return []
+
+
+def task_card(task, kind: str) -> tuple[str, list]:
+    """Текст задачи в списке kind и её кнопки; из кэша, пока задача не менялась."""
+    key = (kind, task['id'])
+    card = task_cards.get(key, task['updated_at'])
+    if card is None:
+        card = (
+            f"<b>#{task['id']} — {task['title']}</b>\n"
+            f"Уровень: {task['level']}\n"
+            f"Дедлайн: {humanize_ts(task['deadline_ts'])}",
+            task_action_rows(task['id'], kind),
+        )
+        task_cards.set(key, card, task['updated_at'])
+    return card
+
+
+# Вид списка -> (заголовок, текст для пустого списка)
+_LISTS = {
+    "open": ("<b>Доступные открытые задачи:</b>", "Нет доступных открытых задач."),
+    "direct": ("<b>Задачи, назначенные вам:</b>", "Нет назначенных вам задач."),
+    "my": ("<b>Ваши активные задачи:</b>", "У вас нет активных задач."),
+}
+
+
+async def show_list(callback: types.CallbackQuery, kind: str, cursor: list | None = None, backward: bool = False):
+    """
+    Показывает страницу списка одним сообщением. Из меню список приходит
+    новым сообщением, листание редактирует его на месте.
+    """
+    if kind == "direct":
+        username = (callback.from_user.username or "").lower()
+        if not username:
+            await callback.message.answer("У вас нет username в Telegram, прямые назначения недоступны.")
+            return
+        args = (username,)
+    elif kind == "my":
+        args = (callback.from_user.id,)
+    else:
+        args = ()
+
+    tasks, prev_cursor, next_cursor = await run_db(fetch_page, kind, args, cursor, backward)
+    if not tasks and cursor:
+        # Пока пользователь листал, задачи этой страницы разобрали: начинаем сначала
+        tasks, prev_cursor, next_cursor = await run_db(fetch_page, kind, args)
+
+    title, empty = _LISTS[kind]
+    if not tasks:
+        text, markup = empty, None
+    else:
+        cards = [task_card(t, kind) for t in tasks]
+        text = title + "\n\n" + "\n\n".join(card_text for card_text, _ in cards)
+        actions = [row for _, rows in cards for row in rows]
+        markup = list_page_kb(kind, actions, prev_cursor, next_cursor)
+
+    if cursor is None:
+        await callback.message.answer(text, reply_markup=markup)
+    else:
+        with suppress(TelegramBadRequest):  # страница не изменилась
+            await callback.message.edit_text(text, reply_markup=markup)
+
+
+async def remove_task_actions(callback: types.CallbackQuery, task_id: int):
+    """
+    Убирает из сообщения списка кнопки действий с задачей. Остальные
+    карточки страницы и листание остаются на месте; результат действия
+    исполнитель видит в ответе на нажатие.
+    """
+    markup = callback.message.reply_markup if callback.message else None
+    if not markup:
+        return
+    actions = ("exec_take_", "exec_submit_", "exec_drop_")
+    rows = [
+        row for row in markup.inline_keyboard
+        if not any((button.callback_data or "").startswith(actions)
+                   and button.callback_data.rsplit("_", 1)[1] == str(task_id) for button in row)
+    ]
+    if len(rows) == len(markup.inline_keyboard):
+        return
+    with suppress(TelegramBadRequest):  # сообщение уже изменено или слишком старое
+        await callback.message.edit_reply_markup(reply_markup=InlineKeyboardMarkup(inline_keyboard=rows))
+
 
 # --- Обработчики меню ---
 
 @router.callback_query(F.data == "exec_open")
 async def exec_open(callback: types.CallbackQuery):
     """Показывает список открытых задач, доступных для всех."""
-    conn = get_conn()
-    tasks = conn.execute("""
-        SELECT * FROM tasks
-        WHERE status='new' AND publish_mode='open'
-        ORDER BY deadline_ts ASC
-    """).fetchall()
-    conn.close()
-
-    if not tasks:
-        await callback.message.answer("Нет доступных открытых задач.")
-    else:
-        await callback.message.answer("<b>Доступные открытые задачи:</b>")
-        for t in tasks:
-            text = (f"<b>#{t['id']} — {t['title']}</b>\n"
-                    f"Уровень: {t['level']}\n"
-                    f"Дедлайн: {humanize_ts(t['deadline_ts'])}")
-            await callback.message.answer(text, reply_markup=task_card_kb(t['id'], "open"))
+    await show_list(callback, "open")
     await callback.answer()
 
 
 @router.callback_query(F.data == "exec_direct")
 async def exec_direct(callback: types.CallbackQuery):
     """Показывает задачи, адресованные конкретному исполнителю."""
-    username = (callback.from_user.username or "").lower()
-    if not username:
-        await callback.message.answer("У вас нет username в Telegram, прямые назначения недоступны.")
-        return await callback.answer()
-
-    conn = get_conn()
-    all_tasks = conn.execute("""
-        SELECT * FROM tasks
-        WHERE status='new' AND publish_mode='direct'
-    """).fetchall()
-    conn.close()
-
-    my_tasks = []
-    for t in all_tasks:
-        try:
-            allowed = json.loads(t["allowed_usernames"] or "[]")
-            if username in [a.lower() for a in allowed]:
-                my_tasks.append(t)
-        except:
-            continue
-
-    if not my_tasks:
-        await callback.message.answer("Нет назначенных вам задач.")
-    else:
-        await callback.message.answer("<b>Задачи, назначенные вам:</b>")
-        for t in my_tasks:
-            text = (f"<b>#{t['id']} — {t['title']}</b>\n"
-                    f"Уровень: {t['level']}\n"
-                    f"Дедлайн: {humanize_ts(t['deadline_ts'])}")
-            await callback.message.answer(text, reply_markup=task_card_kb(t['id'], "direct"))
+    await show_list(callback, "direct")
     await callback.answer()
 
 
 @router.callback_query(F.data == "exec_my")
 async def exec_my(callback: types.CallbackQuery):
     """Показывает задачи, которые исполнитель уже взял в работу."""
-    uid = callback.from_user.id
-    conn = get_conn()
-    tasks = conn.execute("SELECT * FROM tasks WHERE status='taken' AND assigned_to=?", (uid,)).fetchall()
-    conn.close()
+    await show_list(callback, "my")
+    await callback.answer()
 
-    if not tasks:
-        await callback.message.answer("У вас нет активных задач.")
-    else:
-        await callback.message.answer("<b>Ваши активные задачи:</b>")
-        for t in tasks:
-            text = (f"<b>#{t['id']} — {t['title']}</b>\n"
-                    f"Уровень: {t['level']}\n"
-                    f"Дедлайн: {humanize_ts(t['deadline_ts'])}")
-            await callback.message.answer(text, reply_markup=task_card_kb(t['id'], "taken"))
+
+@router.callback_query(F.data.regexp(r"^list_(open|direct|my)_"))
+async def exec_list_page(callback: types.CallbackQuery):
+    """Листает список исполнителя в том же сообщении."""
+    kind, cursor, backward = parse_page_callback(callback.data)
+    await show_list(callback, kind, cursor, backward)
     await callback.answer()
 
 
 # --- Обработчики действий ---
 
+ACTIVE_COUNT_SQL = "SELECT COUNT(*) FROM tasks WHERE status='taken' AND assigned_to=?"
+OPEN_TASK_SQL = "SELECT 1 FROM tasks WHERE id=? AND status='new'"
+
+# Взятие: статус и лимит проверяются в самом UPDATE
+CLAIM_SQL = """
+    UPDATE tasks SET status='taken', assigned_to=?, taken_at=?, updated_at=?
+    WHERE id=? AND status='new'
+      AND (SELECT COUNT(*) FROM tasks WHERE status='taken' AND assigned_to=?) < ?
+    RETURNING *
+"""
+
+DROP_SQL = """
+    UPDATE tasks SET status='dropped', updated_at=? WHERE id=? AND assigned_to=? AND status='taken'
+    RETURNING id, title, level
+"""
+
+
+def _claim_blocker(conn, task_id: int, uid: int):
+    """Причина, по которой задачу сейчас не взять: 'limit', 'gone' или None."""
+    active_count = conn.execute(ACTIVE_COUNT_SQL, (uid,)).fetchone()[0]
+    if active_count >= MAX_ACTIVE_TASKS:
+        return "limit"
+    if not conn.execute(OPEN_TASK_SQL, (task_id,)).fetchone():
+        return "gone"
+    return None
+
+
+def _take_task(task_id: int, uid: int):
+    """
+    Синхронная часть взятия задачи, выполняется в пуле потоков БД.
+    Статус и лимит MAX_ACTIVE_TASKS проверяет сам UPDATE, поэтому гонка
+    нескольких нажатий не может выдать задачу дважды или превысить лимит.
+    Возвращает пару (результат, задача): 'limit', 'gone' или 'ok'.
+    """
+    with connection() as conn:
+        # Дешёвая проверка без блокировки записи: в гонке за одной задачей
+        # проигравшие уходят здесь и не встают в очередь за BEGIN IMMEDIATE
+        result = _claim_blocker(conn, task_id, uid)
+        if result:
+            return result, None
+
+        conn.execute("BEGIN IMMEDIATE")
+        now = now_ts()
+        claimed = conn.execute(CLAIM_SQL, (uid, now, now, task_id, uid, MAX_ACTIVE_TASKS)).fetchall()
+        if not claimed:
+            result = _claim_blocker(conn, task_id, uid) or "gone"
+            conn.rollback()
+            return result, None
+
+        schedule_reminders(conn, task_id)
+        log_event_within_connection(conn, uid, "take", task_id)
+        record_transition(conn, "take", uid, claimed[0]['level'])
+        conn.commit()
+        task_cards.invalidate([task_id])
+        return "ok", claimed[0]
+
+
 @router.callback_query(F.data.startswith("exec_take_"))
 async def exec_take(callback: types.CallbackQuery):
     """Обрабатывает взятие задачи, проверяет лимиты и ставит напоминания."""
     task_id = int(callback.data.split("_")[2])
     uid = callback.from_user.id
 
-    conn = get_conn()
-    cur = conn.cursor()
+    try:
+        result, task = await run_db(_take_task, task_id, uid)
+    except Exception:
+        await callback.answer("Произошла ошибка при взятии задачи.", show_alert=True)
+        logger.exception("Ошибка при взятии задачи %s пользователем %s", task_id, uid)
+        return
 
-    active_count = cur.execute("SELECT COUNT(*) FROM tasks WHERE status='taken' AND assigned_to=?", (uid,)).fetchone()[0]
-    if active_count >= MAX_ACTIVE_TASKS:
-        conn.close()
+    if result == "limit":
         await callback.answer(f"У вас уже максимум активных задач ({MAX_ACTIVE_TASKS}).", show_alert=True)
         return
+    if result == "gone":
+        await callback.answer("Задача уже недоступна или была взята другим исполнителем.", show_alert=True)
+        return
 
-    try:
-        cur.execute("BEGIN IMMEDIATE")
-        task = cur.execute("SELECT * FROM tasks WHERE id=? AND status='new'", (task_id,)).fetchone()
-        
-        if not task:
-            conn.rollback()
-            await callback.answer("Задача уже недоступна или была взята другим исполнителем.", show_alert=True)
-            await callback.message.delete()
-            return
+    expiry.track(task['id'], task['deadline_ts'])
+    reminders.wake(task['deadline_ts'])
+
+    await remove_task_actions(callback, task_id)
+    await callback.answer(f"✅ Вы взяли задачу «{task['title']}».", show_alert=True)
 
-        cur.execute("UPDATE tasks SET status='taken', assigned_to=?, updated_at=? WHERE id=?", (uid, now_ts(), task_id))
+
+def _drop_task(task_id: int, uid: int):
+    """Синхронная часть отказа от задачи. Возвращает задачу или None, если она не взята этим исполнителем."""
+    with connection() as conn:
+        task = conn.execute(DROP_SQL, (now_ts(), task_id, uid)).fetchone()
+        if task:
+            cancel_reminders(conn, [task_id])
+            log_event_within_connection(conn, uid, "drop", task_id)
+            record_transition(conn, "drop", uid, task['level'])
         conn.commit()
-        
-        log_event(uid, "take", task_id)
-        
-        updated_task = cur.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
-        schedule_reminders_for_task(callback.bot, updated_task)
-        
-        await callback.message.edit_text(f"✅ Вы взяли задачу: «{task['title']}»")
-        await callback.answer("Задача принята!", show_alert=True)
-    except Exception as e:
-        conn.rollback()
-        await callback.answer("Произошла ошибка при взятии задачи.", show_alert=True)
-        print(f"Error in exec_take: {e}")
-    finally:
-        conn.close()
+    task_cards.invalidate([task_id])
+    return task
 
 
 @router.callback_query(F.data.startswith("exec_drop_"))
@@ -158,31 +254,22 @@ async def exec_drop(callback: types.CallbackQuery):
     """Обрабатывает отказ от задачи."""
     task_id = int(callback.data.split("_")[2])
     uid = callback.from_user.id
-    
-    conn = get_conn()
-    task = conn.execute("SELECT id, title FROM tasks WHERE id=? AND assigned_to=?", (task_id, uid)).fetchone()
 
+    task = await run_db(_drop_task, task_id, uid)
     if not task:
-        conn.close()
-        await callback.answer("Не удалось найти эту задачу.", show_alert=True)
+        await callback.answer("Задача уже не в работе у вас.", show_alert=True)
         return
-
-    conn.execute("UPDATE tasks SET status='dropped', updated_at=? WHERE id=? AND assigned_to=? AND status='taken'", (now_ts(), task_id, uid))
-    conn.commit()
-    conn.close()
-
-    log_event(uid, "drop", task_id)
+    expiry.discard(task_id)
 
     username = callback.from_user.username or 'пользователь'
-    text = f"🚫 Исполнитель @{username} отказался от задачи #{task['id']}.\nЗаголовок: {task['title']}"
-    for pm_id in PM_IDS:
-        try:
-            await callback.bot.send_message(pm_id, text)
-        except Exception as e:
-            print(f"Не удалось отправить уведомление PM {pm_id}: {e}")
+    digest.notify(
+        "dropped",
+        f"#{task['id']} «{task['title']}» — @{username}",
+        f"🚫 Исполнитель @{username} отказался от задачи #{task['id']}.\nЗаголовок: {task['title']}",
+    )
 
-    await callback.message.edit_text(f"Вы отказались от задачи #{task['id']}.")
-    await callback.answer("Вы отказались от задачи.", show_alert=True)
+    await remove_task_actions(callback, task_id)
+    await callback.answer(f"Вы отказались от задачи #{task['id']}.", show_alert=True)
 
 
 @router.callback_query(F.data.startswith("exec_submit_"))
@@ -191,24 +278,19 @@ async def exec_submit(callback: types.CallbackQuery):
     task_id = int(callback.data.split("_")[2])
     uid = callback.from_user.id
 
-    conn = get_conn()
-    task = conn.execute("SELECT id, title FROM tasks WHERE id=? AND assigned_to=? AND status='taken'", (task_id, uid)).fetchone()
-    conn.close()
+    task = await fetchone("SELECT id, title FROM tasks WHERE id=? AND assigned_to=? AND status='taken'", (task_id, uid))
 
     if not task:
         await callback.answer("Невозможно сдать эту задачу.", show_alert=True)
         return
-        
-    log_event(uid, "submit", task_id)
+
+    events.emit(uid, "submit", task_id)
 
     username = callback.from_user.username or 'пользователь'
     text_for_pm = f"📥 Сдача задачи #{task['id']} от @{username}\nЗаголовок: {task['title']}\n\nПринять или вернуть?"
     
     for pm_id in PM_IDS:
-        try:
-            await callback.bot.send_message(pm_id, text_for_pm, reply_markup=pm_review_kb(task['id']))
-        except Exception as e:
-            print(f"Не удалось отправить уведомление PM {pm_id}: {e}")
+        outbox.send_message(pm_id, text_for_pm, reply_markup=pm_review_kb(task['id']))
 
-    await callback.message.edit_text(f"✅ Задача «{task['title']}» отправлена на проверку.")
-    await callback.answer("Задача отправлена на проверку PM.", show_alert=True)
+    await remove_task_actions(callback, task_id)
+    await callback.answer(f"✅ Задача «{task['title']}» отправлена на проверку PM.", show_alert=True)
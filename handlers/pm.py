@@ -1,24 +1,43 @@
 # pm.py
+import logging
+from contextlib import suppress
+
 from aiogram import Router, types, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, FSInputFile
+from aiogram.types import BufferedInputFile, InlineKeyboardButton, InlineKeyboardMarkup
 import json
-import os
-from datetime import datetime, timedelta
-import pytz
 
-from config import PM_IDS, TIMEZONE
-from db import get_conn
+from config import PM_IDS
+from db import connection, fetchone, run_db
 from utils.hash import dedupe_hash
-from utils.time import now_ts, humanize_ts
-from keyboards import pm_menu, direct_assign_menu
-from services.export import generate_csv_for_last_week
-from services.direct import generate_token
-from scheduler import log_event
+from utils.time import now_ts, humanize_ts, parse_deadline
+from keyboards import (
+    pm_menu, direct_assign_menu, search_more_kb, list_page_kb,
+    export_period_kb, export_status_kb, export_format_kb,
+)
+from services.export import (
+    FORMATS, STATUSES, UPLOAD_LIMIT, export_tasks, parse_period_text, period_label, period_range,
+)
+from services.bulk_import import import_tasks, render_report, report_summary
+from services.cache import task_cards
+from services.direct import generate_token, save_assignees
+from services.search import build_match, search_tasks
+from services.lists import fetch_page, parse_page_callback
+from services.outbox import outbox, INTERACTIVE
+from services.expiry import expiry
+from services.reminders import reminders, schedule_reminders, cancel_reminders
+from services.events import log_event_within_connection
+from services.stats import load_stats, record_transition
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
+# Антидубль мастера: активная задача с тем же нормализованным URL
+ACTIVE_DUPLICATE_SQL = "SELECT id, title FROM tasks WHERE dedupe_hash=? AND status IN ('new','taken')"
+
 # --- FSM ---
 class AddTask(StatesGroup):
     notion_url = State()
@@ -33,94 +52,141 @@ class AddTask(StatesGroup):
 class SearchTask(StatesGroup):
     query = State()
 
+class ExportRange(StatesGroup):
+    dates = State()
+
+class ImportTasks(StatesGroup):
+    file = State()
+
 
 # --- Вспомогательные функции ---
 
 def save_task(data, creator_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-    INSERT INTO tasks(title, notion_url, level, est_hours, publish_mode, deadline_ts,
-                      status, created_by, allowed_usernames,
-                      dedupe_hash, created_at, updated_at)
-    VALUES (?, ?, ?, ?, ?, ?, 'new', ?, ?, ?, ?, ?)
-    """, (
-        data["title"], data["notion_url"], data.get("level"), data.get("est_hours"),
-        data["publish_mode"], data["deadline_ts"], creator_id,
-        data.get("allowed_usernames"), data["dedupe_hash"], now_ts(), now_ts()
-    ))
-    task_id = cur.lastrowid
-    conn.commit()
-    conn.close()
-    log_event(creator_id, "create", task_id, f"mode: {data['publish_mode']}")
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+        INSERT INTO tasks(title, notion_url, level, est_hours, publish_mode, deadline_ts,
+                          status, created_by, allowed_usernames,
+                          dedupe_hash, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, 'new', ?, ?, ?, ?, ?)
+        """, (
+            data["title"], data["notion_url"], data.get("level"), data.get("est_hours"),
+            data["publish_mode"], data["deadline_ts"], creator_id,
+            data.get("allowed_usernames"), data["dedupe_hash"], now_ts(), now_ts()
+        ))
+        task_id = cur.lastrowid
+        save_assignees(conn, task_id, data.get("allowed_usernames"))
+        log_event_within_connection(conn, creator_id, "create", task_id, f"mode: {data['publish_mode']}")
+        record_transition(conn, "create", None, data.get("level"))
+        conn.commit()
+    # id удалённой задачи может достаться новой
+    task_cards.invalidate([task_id])
     return task_id
 
-async def display_task_list(message: types.Message, tasks: list, title: str):
+async def add_task(data, creator_id):
+    """Сохраняет задачу и ставит её дедлайн в движок просрочки."""
+    task_id = await run_db(save_task, data, creator_id)
+    expiry.track(task_id, data["deadline_ts"])
+    return task_id
+
+def render_task_list(tasks: list, title: str) -> str:
+    """Текст одного сообщения со списком задач."""
     if not tasks:
-        return await message.answer(f"Нет задач в категории «{title}».")
+        return f"Нет задач в категории «{title}»."
 
-    await message.answer(f"<b>{title}:</b>")
+    lines = [f"<b>{title}:</b>"]
     for t in tasks:
         assignee_info = f"Исполнитель: @{t['assignee_username']}\n" if 'assignee_username' in t.keys() and t['assignee_username'] else ""
-        text = (f"<b>#{t['id']} — {t['title']}</b>\n"
-                f"Статус: <code>{t['status']}</code>\n{assignee_info}"
-                f"Уровень: {t['level']}\n"
-                f"Дедлайн: {humanize_ts(t['deadline_ts']) if t['deadline_ts'] else 'Не указан'}")
-        await message.answer(text)
+        lines.append(f"<b>#{t['id']} — {t['title']}</b>\n"
+                     f"Статус: <code>{t['status']}</code>\n{assignee_info}"
+                     f"Уровень: {t['level']}\n"
+                     f"Дедлайн: {humanize_ts(t['deadline_ts']) if t['deadline_ts'] else 'Не указан'}")
+    return "\n\n".join(lines)
+
+
+_LIST_TITLES = {
+    "queue": "📋 Задачи в очереди",
+    "inprog": "⏳ Задачи в работе",
+}
+
+
+async def show_list(callback: types.CallbackQuery, kind: str, cursor: list | None = None, backward: bool = False):
+    """Страница списка PM одним сообщением; листание редактирует его на месте."""
+    tasks, prev_cursor, next_cursor = await run_db(fetch_page, kind, (), cursor, backward)
+    if not tasks and cursor:
+        tasks, prev_cursor, next_cursor = await run_db(fetch_page, kind)
+
+    text = render_task_list(tasks, _LIST_TITLES[kind])
+    markup = list_page_kb(kind, [], prev_cursor, next_cursor)
+    if cursor is None:
+        await callback.message.answer(text, reply_markup=markup)
+    else:
+        with suppress(TelegramBadRequest):  # страница не изменилась
+            await callback.message.edit_text(text, reply_markup=markup)
 
 
 # --- Обработчики меню PM ---
 
 @router.callback_query(F.data == "pm_queue")
 async def pm_queue(callback: types.CallbackQuery):
-    conn = get_conn()
-    tasks = conn.execute("SELECT * FROM tasks WHERE status = 'new' ORDER BY created_at ASC").fetchall()
-    conn.close()
-    await display_task_list(callback.message, tasks, "📋 Задачи в очереди")
+    await show_list(callback, "queue")
     await callback.answer()
 
 
 
 @router.callback_query(F.data == "pm_inprogress")
 async def pm_inprogress(callback: types.CallbackQuery):
-    conn = get_conn()
-    tasks = conn.execute("""
-        SELECT t.*, u.username as assignee_username
-        FROM tasks t
-        JOIN users u ON t.assigned_to = u.tg_id
-        WHERE t.status = 'taken'
-        ORDER BY t.deadline_ts ASC
-    """).fetchall()
-    conn.close()
-    await display_task_list(callback.message, tasks, "⏳ Задачи в работе")
+    await show_list(callback, "inprog")
+    await callback.answer()
+
+
+@router.callback_query(F.data.regexp(r"^list_(queue|inprog)_"))
+async def pm_list_page(callback: types.CallbackQuery):
+    kind, cursor, backward = parse_page_callback(callback.data)
+    await show_list(callback, kind, cursor, backward)
     await callback.answer()
 
 
 @router.callback_query(F.data == "pm_search")
 async def pm_search_start(callback: types.CallbackQuery, state: FSMContext):
     await state.set_state(SearchTask.query)
-    await callback.message.answer("Введите текст для поиска (по заголовку, URL или @username исполнителя):")
+    await callback.message.answer("Введите текст для поиска (по заголовку, URL или @username исполнителя, можно начало слова):")
     await callback.answer()
 
 
 @router.message(SearchTask.query)
 async def pm_search_process(message: types.Message, state: FSMContext):
     await state.clear()
-    query_text = f"%{message.text.strip()}%"
-    username_query = message.text.strip().lstrip('@')
-
-    conn = get_conn()
-    tasks = conn.execute("""
-        SELECT t.*, u.username as assignee_username
-        FROM tasks t
-        LEFT JOIN users u ON t.assigned_to = u.tg_id
-        WHERE t.title LIKE ? OR t.notion_url LIKE ? OR u.username = ?
-        ORDER BY t.updated_at DESC
-        LIMIT 20
-    """, (query_text, query_text, username_query)).fetchall()
-    conn.close()
-    
-    await display_task_list(message, tasks, f"🔎 Результаты поиска по «{message.text}»")
+    match = build_match(message.text or "")
+    if not match:
+        return await message.answer("Введите хотя бы одно слово для поиска.")
+
+    tasks, cursor = await run_db(search_tasks, match)
+    title = f"🔎 Результаты поиска по «{message.text}»"
+    if cursor:
+        # Запрос и курсор храним в данных FSM, чтобы кнопка «Ещё» продолжила выдачу
+        await state.update_data(search_match=match, search_cursor=cursor, search_title=title)
+    await message.answer(render_task_list(tasks, title), reply_markup=search_more_kb() if cursor else None)
+
+
+@router.callback_query(F.data == "pm_search_more")
+async def pm_search_more(callback: types.CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    match, cursor = data.get("search_match"), data.get("search_cursor")
+    if not match or not cursor:
+        return await callback.answer("Поиск устарел, начните новый.", show_alert=True)
+
+    tasks, cursor = await run_db(search_tasks, match, cursor)
+    if cursor:
+        await state.update_data(search_cursor=cursor)
+    else:
+        await state.update_data(search_match=None, search_cursor=None)
+    # Следующая страница выдачи заменяет предыдущую в том же сообщении
+    await callback.message.edit_text(
+        render_task_list(tasks, data.get("search_title") or "🔎 Продолжение поиска"),
+        reply_markup=search_more_kb() if cursor else None
+    )
+    await callback.answer()
 
 
 # --- Мастер добавления задачи ---
@@ -137,9 +203,7 @@ async def pm_add_start(callback: types.CallbackQuery, state: FSMContext):
 async def addtask_url(message: types.Message, state: FSMContext):
     url = message.text.strip()
     h = dedupe_hash(url)
-    conn = get_conn()
-    row = conn.execute("SELECT id, title FROM tasks WHERE dedupe_hash=? AND status IN ('new','taken')", (h,)).fetchone()
-    conn.close()
+    row = await fetchone(ACTIVE_DUPLICATE_SQL, (h,))
     if row:
         await message.answer(f"❗ Такая задача уже есть: #{row['id']} — {row['title']}")
         return await state.clear()
@@ -186,30 +250,7 @@ async def addtask_hours(message: types.Message, state: FSMContext):
 
 @router.message(AddTask.deadline)
 async def addtask_deadline(message: types.Message, state: FSMContext):
-    txt = message.text.strip().lower() # Приводим к нижнему регистру
-    deadline_ts = None
-    tz = pytz.timezone(TIMEZONE)
-
-    # Убираем необязательный '+' в начале
-    if txt.startswith("+"):
-        txt = txt[1:]
-
-    if txt.endswith("h"):
-        try:
-            hours = int(txt[:-1])
-            deadline_ts = now_ts() + hours * 3600
-        except: pass
-    elif txt.endswith("m"):
-        try:
-            mins = int(txt[:-1])
-            deadline_ts = now_ts() + mins * 60
-        except: pass
-    else:
-        try:
-            dt = datetime.strptime(message.text.strip(), "%Y-%m-%d %H:%M")
-            deadline_ts = int(tz.localize(dt).timestamp())
-        except: pass
-
+    deadline_ts = parse_deadline(message.text)
     if not deadline_ts:
         return await message.answer("Неверный формат. Пример: `6h`, `30m` или `2025-08-12 15:00`")
 
@@ -230,7 +271,7 @@ async def addtask_pubmode(callback: types.CallbackQuery, state: FSMContext):
         await callback.message.edit_text("Выберите способ точечного назначения:", reply_markup=direct_assign_menu())
     else: # open
         data = await state.get_data()
-        save_task(data, callback.from_user.id)
+        await add_task(data, callback.from_user.id)
         await state.clear()
         await callback.message.edit_text("✅ Открытая задача создана", reply_markup=pm_menu())
     await callback.answer()
@@ -243,7 +284,7 @@ async def addtask_direct_type(callback: types.CallbackQuery, state: FSMContext):
         await callback.message.edit_text("Введите @username исполнителей через пробел:")
     else: # deeplink
         data = await state.get_data()
-        task_id = save_task(data, callback.from_user.id)
+        task_id = await add_task(data, callback.from_user.id)
         token = generate_token(task_id)
         bot_info = await callback.bot.get_me()
         link = f"https://t.me/{bot_info.username}?start=claim_{token}"
@@ -260,62 +301,244 @@ async def addtask_direct_usernames(message: types.Message, state: FSMContext):
     usernames = [u.strip().lstrip("@") for u in message.text.split() if u.strip()]
     await state.update_data(allowed_usernames=json.dumps(usernames))
     data = await state.get_data()
-    save_task(data, message.from_user.id)
+    await add_task(data, message.from_user.id)
     await state.clear()
     await message.answer("✅ Задача создана (точечная)", reply_markup=pm_menu())
 
 
+# --- Массовый импорт ---
+
+# Bot API отдаёт боту файлы не больше 20 МБ
+_DOWNLOAD_LIMIT = 20 * 1024 * 1024
+
+@router.callback_query(F.data == "pm_import")
+async def pm_import_start(callback: types.CallbackQuery, state: FSMContext):
+    if callback.from_user.id not in PM_IDS:
+        return await callback.answer("Нет доступа", show_alert=True)
+    await state.set_state(ImportTasks.file)
+    await callback.message.answer(
+        "Пришлите файл .csv, .json или .jsonl с колонками:\n"
+        "<code>notion_url, title, level, est_hours, deadline, publish_mode, usernames</code>\n"
+        "deadline — 6h, 30m или YYYY-MM-DD HH:MM; publish_mode — open или direct."
+    )
+    await callback.answer()
+
+@router.message(ImportTasks.file, F.document)
+async def pm_import_file(message: types.Message, state: FSMContext):
+    document = message.document
+    if document.file_size and document.file_size > _DOWNLOAD_LIMIT:
+        return await message.answer("❌ Файл больше 20 МБ, разбейте его на части.")
+    await state.clear()
+
+    data = await message.bot.download(document)
+    try:
+        report, created = await run_db(import_tasks, data.read(), document.file_name or "", message.from_user.id)
+    except ValueError as e:
+        return await message.answer(f"❌ Не удалось прочитать файл: {e}")
+    except Exception:
+        logger.exception("Ошибка импорта %s", document.file_name)
+        return await message.answer("❌ Произошла ошибка при импорте, задачи не созданы.")
+
+    for task_id, deadline_ts in created:
+        expiry.track(task_id, deadline_ts)
+    accepted, rejected = report_summary(report)
+    await message.answer_document(
+        BufferedInputFile(render_report(report), filename="import_report.csv"),
+        caption=f"📥 Импорт: принято {accepted}, отклонено {rejected}.",
+        reply_markup=pm_menu(),
+    )
+
+@router.message(ImportTasks.file)
+async def pm_import_not_file(message: types.Message):
+    await message.answer("Ожидаю файл .csv, .json или .jsonl документом.")
+
+
 # --- Обработчики других действий PM ---
 
+# --- Выгрузка: период -> статус -> формат ---
+
+def _avg_lead(row) -> str:
+    if not row['lead_count']:
+        return "—"
+    hours = row['lead_sum'] / row['lead_count'] / 3600
+    return f"{hours:.1f} ч" if hours >= 1 else f"{hours * 60:.0f} мин"
+
+def render_stats(stats: dict) -> str:
+    """Экран статистики по готовой сводке services.stats."""
+    if not stats["levels"]:
+        return "📈 Статистики пока нет."
+
+    lines = ["<b>📈 По уровням</b>"]
+    for row in stats["levels"]:
+        # Доля просроченных среди завершённых: сданных, просроченных и брошенных
+        closed = row['done'] + row['expired'] + row['dropped']
+        rate = f"{row['expired'] / closed:.0%}" if closed else "—"
+        lines.append(f"<b>{row['level']}</b>: создано {row['created']}, сдано {row['done']}, "
+                     f"просрочено {row['expired']} ({rate}), отказов {row['dropped']}, "
+                     f"в среднем {_avg_lead(row)}")
+
+    if stats["top_done"]:
+        lines.append("\n<b>🏆 Больше всего сдали</b>")
+        for row in stats["top_done"]:
+            lines.append(f"@{row['username'] or row['user_id']}: сдано {row['done']} из {row['taken']}, "
+                         f"возвратов {row['returned']}, в среднем {_avg_lead(row)}")
+    if stats["top_expired"]:
+        lines.append("\n<b>⌛️ Чаще всего просрочивают</b>")
+        for row in stats["top_expired"]:
+            lines.append(f"@{row['username'] or row['user_id']}: просрочено {row['expired']} из {row['taken']}, "
+                         f"отказов {row['dropped']}")
+    return "\n".join(lines)
+
+@router.callback_query(F.data == "pm_stats")
+async def pm_stats(callback: types.CallbackQuery):
+    if callback.from_user.id not in PM_IDS:
+        return await callback.answer("Нет доступа", show_alert=True)
+    stats = await run_db(load_stats)
+    await callback.message.answer(render_stats(stats))
+    await callback.answer()
+
 @router.callback_query(F.data == "pm_export")
-async def pm_export_csv(callback: types.CallbackQuery):
-    await callback.answer("Начинаю формировать отчет за неделю...")
+async def pm_export_menu(callback: types.CallbackQuery):
+    if callback.from_user.id not in PM_IDS:
+        return await callback.answer("Нет доступа", show_alert=True)
+    await callback.message.answer("📊 За какой период выгрузить задачи?", reply_markup=export_period_kb())
+    await callback.answer()
+
+@router.callback_query(F.data == "exp_custom")
+async def pm_export_custom(callback: types.CallbackQuery, state: FSMContext):
+    if callback.from_user.id not in PM_IDS:
+        return await callback.answer("Нет доступа", show_alert=True)
+    await state.set_state(ExportRange.dates)
+    await callback.message.edit_text("Введите период (даты включительно): <code>2025-01-01 2025-03-31</code>")
+    await callback.answer()
+
+@router.message(ExportRange.dates)
+async def pm_export_dates(message: types.Message, state: FSMContext):
     try:
-        file_path = generate_csv_for_last_week()
-        doc = FSInputFile(file_path)
-        await callback.message.answer_document(doc, caption="📊 Ваш отчет по задачам за последнюю неделю.")
-        os.remove(file_path)
-    except Exception as e:
+        period = parse_period_text(message.text or "")
+    except ValueError:
+        return await message.answer("Неверный формат. Пример: <code>2025-01-01 2025-03-31</code>")
+    await state.clear()
+    await message.answer(f"Какие задачи выгрузить {period_label(period)}?", reply_markup=export_status_kb(period))
+
+@router.callback_query(F.data.startswith("exp_p_"))
+async def pm_export_period(callback: types.CallbackQuery):
+    if callback.from_user.id not in PM_IDS:
+        return await callback.answer("Нет доступа", show_alert=True)
+    period = callback.data.replace("exp_p_", "")
+    await callback.message.edit_text(f"Какие задачи выгрузить {period_label(period)}?", reply_markup=export_status_kb(period))
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("exp_s_"))
+async def pm_export_status(callback: types.CallbackQuery):
+    if callback.from_user.id not in PM_IDS:
+        return await callback.answer("Нет доступа", show_alert=True)
+    period, status = callback.data.replace("exp_s_", "").split("_")
+    await callback.message.edit_text("В каком формате?", reply_markup=export_format_kb(period, status))
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("exp_f_"))
+async def pm_export_run(callback: types.CallbackQuery):
+    if callback.from_user.id not in PM_IDS:
+        return await callback.answer("Нет доступа", show_alert=True)
+    try:
+        period, status, fmt = callback.data.replace("exp_f_", "").split("_")
+        period_range(period)
+        if fmt not in FORMATS or (status != "all" and status not in STATUSES):
+            raise ValueError(callback.data)
+    except ValueError:
+        return await callback.answer("Некорректные параметры выгрузки", show_alert=True)
+
+    label = period_label(period)
+    await callback.answer("Начинаю формировать отчет...")
+    await callback.message.edit_text(f"⏳ Формирую отчет {label}...")
+    doc = None
+    try:
+        doc, rows, size = await export_tasks(fmt, period, None if status == "all" else status)
+        if size > UPLOAD_LIMIT:
+            await callback.message.edit_text(
+                f"❌ Файл получился больше {UPLOAD_LIMIT // 1024 // 1024} МБ. Выберите CSV.gz или период короче."
+            )
+            return
+        await callback.message.answer_document(doc, caption=f"📊 Задачи {label}: {rows}")
+        await callback.message.edit_text(f"✅ Отчет {label} готов.")
+    except Exception:
         await callback.message.answer("❌ Произошла ошибка при формировании отчета.")
-        print(f"Error generating CSV: {e}")
+        logger.exception("Ошибка при формировании выгрузки %s", callback.data)
+    finally:
+        if doc:
+            doc.close()
+
+def _accept_task(task_id, pm_id) -> bool:
+    """
+    Синхронная часть приёмки задачи: статус, напоминания и событие одной транзакцией.
+    False, если задача уже закрыта (её принял другой PM, она просрочена и т.п.).
+    """
+    with connection() as conn:
+        now = now_ts()
+        task = conn.execute(
+            "UPDATE tasks SET status='done', updated_at=? WHERE id=? AND status='taken' RETURNING assigned_to, level, taken_at",
+            (now, task_id)
+        ).fetchone()
+        if task:
+            cancel_reminders(conn, [task_id])
+            log_event_within_connection(conn, pm_id, "done", task_id)
+            lead = now - task['taken_at'] if task['taken_at'] else None
+            record_transition(conn, "done", task['assigned_to'], task['level'], lead)
+        conn.commit()
+    task_cards.invalidate([task_id])
+    return task is not None
 
 @router.callback_query(F.data.startswith("pm_accept_"))
 async def pm_accept(callback: types.CallbackQuery):
     task_id = int(callback.data.split("_")[2])
-    conn = get_conn()
-    conn.execute("UPDATE tasks SET status='done', updated_at=? WHERE id=? AND status='taken'", (now_ts(), task_id))
-    conn.commit()
-    conn.close()
-    log_event(callback.from_user.id, "done", task_id)
+    if not await run_db(_accept_task, task_id, callback.from_user.id):
+        await callback.answer("Задача уже закрыта.", show_alert=True)
+        return
+    expiry.discard(task_id)
     await callback.answer("Задача принята!", show_alert=True)
     await callback.message.edit_text(f"✅ Задача #{task_id} — принята.")
 
+def _return_task(task_id, pm_id):
+    """
+    Синхронная часть возврата задачи на доработку. Сданная задача остаётся
+    взятой, поэтому вернуть можно только её. Возвращает задачу или None,
+    если задача уже закрыта (принята, просрочена, отказ).
+    """
+    with connection() as conn:
+        task = conn.execute(
+            "UPDATE tasks SET updated_at=? WHERE id=? AND status='taken' AND assigned_to IS NOT NULL "
+            "RETURNING title, assigned_to, deadline_ts, level",
+            (now_ts(), task_id)
+        ).fetchone()
+        if task:
+            schedule_reminders(conn, task_id)
+            log_event_within_connection(conn, pm_id, "return", task_id)
+            record_transition(conn, "return", task['assigned_to'], task['level'])
+        conn.commit()
+    task_cards.invalidate([task_id])
+    return task
+
 @router.callback_query(F.data.startswith("pm_return_"))
 async def pm_return(callback: types.CallbackQuery):
     task_id = int(callback.data.split("_")[2])
-    conn = get_conn()
-    task = conn.execute("SELECT title, assigned_to FROM tasks WHERE id=?", (task_id,)).fetchone()
+    task = await run_db(_return_task, task_id, callback.from_user.id)
 
-    if not task or not task['assigned_to']:
-        conn.close()
-        await callback.answer("Не удалось найти задачу или исполнителя.", show_alert=True)
+    if not task:
+        await callback.answer("Задача уже закрыта.", show_alert=True)
         return
-
-    conn.execute("UPDATE tasks SET status='taken', updated_at=? WHERE id=?", (now_ts(), task_id))
-    conn.commit()
-    conn.close()
-    log_event(callback.from_user.id, "return", task_id)
+    expiry.track(task_id, task['deadline_ts'])
+    reminders.wake(task['deadline_ts'])
 
     executor_id = task['assigned_to']
-    try:
-        await callback.bot.send_message(
-            executor_id,
-            f"❌ <b>Задача возвращена на доработку</b>\n\n"
-            f"Ваша задача «{task['title']}» была возвращена PM. "
-            f"Проверьте комментарии в Notion или свяжитесь с PM для уточнений."
-        )
-    except Exception as e:
-        print(f"Не удалось уведомить исполнителя {executor_id} о возврате задачи {task_id}: {e}")
+    delivered = await outbox.send_message(
+        executor_id,
+        f"❌ <b>Задача возвращена на доработку</b>\n\n"
+        f"Ваша задача «{task['title']}» была возвращена PM. "
+        f"Проверьте комментарии в Notion или свяжитесь с PM для уточнений.",
+        priority=INTERACTIVE
+    )
+    if delivered is None:
         await callback.message.answer(f"⚠️ Не удалось уведомить исполнителя о возврате задачи #{task_id}.")
 
     await callback.answer("Задача возвращена исполнителю.", show_alert=True)
@@ -3,9 +3,11 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 def pm_menu():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="➕ Добавить", callback_data="pm_add")],
+        [InlineKeyboardButton(text="📥 Импорт из файла", callback_data="pm_import")],
         [InlineKeyboardButton(text="📋 Очередь", callback_data="pm_queue")],
         [InlineKeyboardButton(text="⏳ В работе", callback_data="pm_inprogress")],
         [InlineKeyboardButton(text="🔎 Поиск", callback_data="pm_search")],
+        [InlineKeyboardButton(text="📈 Статистика", callback_data="pm_stats")],
         [InlineKeyboardButton(text="📊 Экспорт", callback_data="pm_export")]
     ])
 
@@ -22,8 +24,46 @@ def pm_review_kb(task_id: int):
         [InlineKeyboardButton(text="❌ Вернуть", callback_data=f"pm_return_{task_id}")]
     ])
 
+def list_page_kb(kind: str, action_rows: list, prev_cursor, next_cursor):
+    """Кнопки действий по задачам страницы и листание списка kind."""
+    rows = list(action_rows)
+    nav = []
+    if prev_cursor:
+        nav.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"list_{kind}_p_{prev_cursor[0]}_{prev_cursor[1]}"))
+    if next_cursor:
+        nav.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"list_{kind}_n_{next_cursor[0]}_{next_cursor[1]}"))
+    if nav:
+        rows.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+
+def search_more_kb():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="➡️ Ещё", callback_data="pm_search_more")]
+    ])
+
 # Клавиатура для выбора способа точечного назначения
 def direct_assign_menu():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="По @username", callback_data="direct_type_username")]
     ])
+
+# --- Выгрузка задач: период -> статус -> формат ---
+def export_period_kb():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="7 дней", callback_data="exp_p_7d"), InlineKeyboardButton(text="30 дней", callback_data="exp_p_30d")],
+        [InlineKeyboardButton(text="90 дней", callback_data="exp_p_90d"), InlineKeyboardButton(text="Год", callback_data="exp_p_365d")],
+        [InlineKeyboardButton(text="📅 Свой период", callback_data="exp_custom")]
+    ])
+
+def export_status_kb(period: str):
+    statuses = [("Все", "all"), ("Новые", "new"), ("В работе", "taken"),
+                ("Выполненные", "done"), ("Отказ", "dropped"), ("Просроченные", "expired")]
+    buttons = [InlineKeyboardButton(text=text, callback_data=f"exp_s_{period}_{status}") for text, status in statuses]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+def export_format_kb(period: str, status: str):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="CSV", callback_data=f"exp_f_{period}_{status}_csv"),
+         InlineKeyboardButton(text="CSV.gz", callback_data=f"exp_f_{period}_{status}_csvgz"),
+         InlineKeyboardButton(text="JSON Lines", callback_data=f"exp_f_{period}_{status}_jsonl")]
+    ])
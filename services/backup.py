@@ -0,0 +1,301 @@
+# services/backup.py
+"""
+Резервные копии базы без остановки бота.
+
+Копировать файл DB_PATH на ходу нельзя: в WAL-режиме часть данных лежит в
+bot.db-wal, а страницы меняются посреди копирования. Снимок делается через
+online backup API SQLite (`sqlite3.Connection.backup`):
+1. страницы копируются во временный файл шагами по BACKUP_STEP_PAGES с
+   паузой BACKUP_STEP_PAUSE; шаг держит только чтение, а в WAL чтение не
+   мешает записи обработчиков;
+2. если базу меняют чаще, чем копия успевает дойти до конца, SQLite
+   начинает копию заново. После BACKUP_MAX_RESTARTS перезапусков остаток
+   копируется одним шагом из согласованного снимка;
+3. копия проверяется `PRAGMA quick_check`, сжимается в
+   BACKUP_DIR/bot_<дата>_<время>.db.gz, рядом пишется .sha256 в формате
+   sha256sum; оба файла появляются атомарно (os.replace);
+4. остаются BACKUP_KEEP последних снимков.
+
+Задача стоит в планировщике (работает только у лидера). Вручную:
+    python -m services.backup create
+    python -m services.backup list
+    python -m services.backup verify data/backups/bot_20240101_040000.db.gz
+    python -m services.backup restore data/backups/bot_20240101_040000.db.gz
+restore выполняется при остановленном боте: снимок проверяется (контрольная
+сумма, gzip, quick_check), текущая база откладывается в <DB_PATH>.before-restore,
+и на её место встаёт восстановленная.
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+import db
+from config import (
+    BACKUP_DIR, BACKUP_KEEP, BACKUP_STEP_PAGES, BACKUP_STEP_PAUSE, BACKUP_MAX_RESTARTS,
+)
+from services.metrics import job_timer
+from utils.time import now_ts, tz
+
+logger = logging.getLogger(__name__)
+
+_CHUNK = 1024 * 1024
+
+
+class _Restarted(Exception):
+    """Копию слишком часто начинали заново из-за записи в базу."""
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fsync_replace(tmp: str, path: str):
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _quick_check(path: str):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise ValueError(f"снимок повреждён: {result}")
+
+
+def copy_database(dest: str, step_pages: int = BACKUP_STEP_PAGES, pause: float = BACKUP_STEP_PAUSE,
+                  max_restarts: int = BACKUP_MAX_RESTARTS) -> dict:
+    """
+    Копирует базу в файл dest через backup API. Возвращает число страниц,
+    шагов и перезапусков копии.
+    """
+    progress = {"pages": 0, "steps": 0, "restarts": 0}
+    remaining_before = None
+
+    def on_step(status, remaining, total):
+        nonlocal remaining_before
+        progress["steps"] += 1
+        progress["pages"] = total
+        # Осталось больше, чем на прошлом шаге — SQLite начал копию заново
+        if remaining_before is not None and remaining > remaining_before:
+            progress["restarts"] += 1
+            if progress["restarts"] > max_restarts:
+                raise _Restarted
+        remaining_before = remaining
+
+    # Своё соединение, а не из пула: копия может идти дольше обычного запроса
+    src = sqlite3.connect(db.DB_PATH, timeout=15)
+    try:
+        dst = sqlite3.connect(dest)
+        try:
+            try:
+                src.backup(dst, pages=step_pages, progress=on_step, sleep=pause)
+            except _Restarted:
+                # Одним шагом: одна транзакция чтения, запись в WAL она не блокирует
+                src.backup(dst, pages=-1)
+                progress["steps"] += 1
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    return progress
+
+
+def create_snapshot(backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+                    step_pages: int = BACKUP_STEP_PAGES) -> dict:
+    """Снимает, проверяет, сжимает и ротирует резервную копию. Возвращает отчёт."""
+    started = time.perf_counter()
+    os.makedirs(backup_dir, exist_ok=True)
+    name = f"bot_{datetime.now(tz):%Y%m%d_%H%M%S}.db.gz"
+    path = os.path.join(backup_dir, name)
+    raw = path[:-len(".gz")] + ".tmp"
+    try:
+        progress = copy_database(raw, step_pages)
+        _quick_check(raw)
+        with open(raw, "rb") as f_in, gzip.open(path + ".tmp", "wb", compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, _CHUNK)
+        checksum = _sha256(path + ".tmp")
+        _fsync_replace(path + ".tmp", path)
+        with open(path + ".sha256.tmp", "w") as f:
+            f.write(f"{checksum}  {name}\n")
+        _fsync_replace(path + ".sha256.tmp", path + ".sha256")
+        db_size = os.path.getsize(raw)
+    finally:
+        for leftover in (raw, path + ".tmp", path + ".sha256.tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    removed = rotate(backup_dir, keep)
+    return {
+        "path": path,
+        "pages": progress["pages"],
+        "steps": progress["steps"],
+        "restarts": progress["restarts"],
+        "db_bytes": db_size,
+        "bytes": os.path.getsize(path),
+        "sha256": checksum,
+        "removed": removed,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def list_snapshots(backup_dir: str = BACKUP_DIR) -> list[str]:
+    """Снимки от старых к новым (имя содержит дату и время)."""
+    return sorted(glob.glob(os.path.join(backup_dir, "bot_*.db.gz")))
+
+
+def rotate(backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> int:
+    """Удаляет снимки сверх keep последних. Возвращает, сколько удалено."""
+    old = list_snapshots(backup_dir)[:-keep] if keep > 0 else []
+    for path in old:
+        os.remove(path)
+        if os.path.exists(path + ".sha256"):
+            os.remove(path + ".sha256")
+    return len(old)
+
+
+def verify_snapshot(path: str, dest: str | None = None) -> str:
+    """
+    Проверяет снимок: контрольную сумму, целостность gzip и базы. Распаковывает
+    в dest (по умолчанию во временный файл рядом, который удаляется) и
+    возвращает путь к распакованной базе или ''. ValueError, если снимок испорчен.
+    """
+    with open(path + ".sha256") as f:
+        expected = f.read().split()[0]
+    if _sha256(path) != expected:
+        raise ValueError("контрольная сумма не совпадает")
+
+    target = dest or path[:-len(".gz")] + ".verify"
+    try:
+        with gzip.open(path, "rb") as f_in, open(target, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, _CHUNK)
+        _quick_check(target)
+    except (OSError, EOFError, sqlite3.DatabaseError) as e:
+        if os.path.exists(target):
+            os.remove(target)
+        raise ValueError(f"снимок не читается: {e}")
+    except ValueError:
+        os.remove(target)
+        raise
+    if dest is None:
+        os.remove(target)
+        return ""
+    return target
+
+
+def restore_snapshot(path: str, db_path: str | None = None) -> str:
+    """
+    Восстанавливает базу из снимка; бот должен быть остановлен. Текущая база
+    (с WAL) откладывается в <db_path>.before-restore. Возвращает путь к ней или ''.
+    """
+    db_path = db_path or db.DB_PATH
+    tmp = db_path + ".restore"
+    verify_snapshot(path, tmp)
+    # Снимок снят с WAL-базы: переводим его в обычный журнал, чтобы в файле было всё
+    conn = sqlite3.connect(tmp)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+
+    aside = ""
+    if os.path.exists(db_path):
+        # Прежняя база вместе с WAL, чтобы можно было откатить восстановление
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        aside = db_path + ".before-restore"
+        os.replace(db_path, aside)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    _fsync_replace(tmp, db_path)
+    return aside
+
+
+class DatabaseBackup:
+    def __init__(self, backup_dir: str, keep: int):
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.snapshots_total = 0
+        self.failures_total = 0
+        self.last_run_ts = 0
+        self.last_seconds = 0.0
+        self.last_pages = 0
+        self.last_bytes = 0
+
+    async def run(self) -> dict:
+        # Отдельный поток, а не пул БД: копия не должна занимать потоки обработчиков
+        report = await asyncio.to_thread(create_snapshot, self.backup_dir, self.keep)
+        self.snapshots_total += 1
+        self.last_run_ts = now_ts()
+        self.last_seconds = report["seconds"]
+        self.last_pages = report["pages"]
+        self.last_bytes = report["bytes"]
+        logger.info("Резервная копия %s: %s страниц за %s с (%s шагов, перезапусков %s), %.1f МБ",
+                    report["path"], report["pages"], report["seconds"], report["steps"],
+                    report["restarts"], report["bytes"] / 2**20)
+        return report
+
+    async def job(self):
+        """Задача планировщика."""
+        with job_timer("db_backup"):
+            try:
+                await self.run()
+            except Exception:
+                self.failures_total += 1
+                logger.exception("Ошибка резервного копирования")
+
+    def stats(self) -> dict:
+        return {
+            "snapshots_total": self.snapshots_total,
+            "failures_total": self.failures_total,
+            "last_run_ts": self.last_run_ts,
+            "last_seconds": self.last_seconds,
+            "last_pages": self.last_pages,
+            "last_bytes": self.last_bytes,
+        }
+
+
+backup = DatabaseBackup(BACKUP_DIR, BACKUP_KEEP)
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Резервные копии базы")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create", help="снять снимок сейчас")
+    commands.add_parser("list", help="показать снимки")
+    verify = commands.add_parser("verify", help="проверить снимок")
+    verify.add_argument("snapshot")
+    restore = commands.add_parser("restore", help="восстановить базу из снимка (бот остановлен)")
+    restore.add_argument("snapshot")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        print(asyncio.run(backup.run()))
+    elif args.command == "list":
+        for path in list_snapshots():
+            print(f"{path}  {os.path.getsize(path) / 2**20:.1f} МБ")
+    elif args.command == "verify":
+        verify_snapshot(args.snapshot)
+        print("Снимок в порядке")
+    else:
+        aside = restore_snapshot(args.snapshot)
+        print(f"База восстановлена в {db.DB_PATH}" + (f", прежняя сохранена в {aside}" if aside else ""))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    _main()
@@ -0,0 +1,247 @@
+# services/bulk_import.py
+"""
+Массовый импорт задач из CSV или JSON вместо мастера AddTask.
+
+Колонки (они же ключи объектов JSON):
+    notion_url, title          — обязательные;
+    level, est_hours           — как в мастере;
+    deadline                   — '6h', '30m' или 'YYYY-MM-DD HH:MM', либо deadline_ts (unix);
+    publish_mode               — open (по умолчанию) или direct;
+    usernames                  — для direct: @username через пробел или запятую.
+Лишние колонки игнорируются, поэтому CSV из выгрузки можно загрузить обратно.
+JSON — массив объектов или JSON Lines (по объекту в строке).
+
+Строки проверяются в памяти, дубли внутри файла отсекаются по dedupe_hash,
+а с активными задачами в БД все хэши сверяются одним запросом по
+idx_tasks_notion_active. Прошедшие проверку задачи, их назначения, события
+create и счётчики статистики пишутся одной транзакцией пачками executemany.
+Результат — отчёт по каждой строке: принята (id задачи) или отклонена (причина).
+
+Из командной строки:
+    python -m services.bulk_import tasks.csv --pm <tg_id> [--report report.csv]
+"""
+import argparse
+import csv
+import io
+import json
+import re
+
+from config import IMPORT_MAX_ROWS
+from db import connection, init_db
+from services.cache import task_cards
+from services.stats import record_transitions
+from utils.hash import dedupe_hash, normalize_url
+from utils.time import now_ts, parse_deadline
+
+REPORT_COLUMNS = ["row", "result", "task_id", "reason", "notion_url"]
+
+_INSERT = """
+    INSERT INTO tasks(title, notion_url, level, est_hours, publish_mode, deadline_ts,
+                      status, created_by, allowed_usernames, dedupe_hash, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, 'new', ?, ?, ?, ?, ?)
+"""
+
+# Активные задачи с теми же хэшами — один запрос на весь файл. Без подсказки
+# планировщик выбирает индекс по статусу и читает все новые задачи
+ACTIVE_DUPLICATES_SQL = """
+    SELECT t.id, t.dedupe_hash
+    FROM json_each(?) j
+    CROSS JOIN tasks t INDEXED BY idx_tasks_notion_active
+      ON t.dedupe_hash = j.value AND t.status IN ('new','taken')
+"""
+
+_ASSIGNEES = """
+    INSERT OR IGNORE INTO task_assignees(task_id, username_lower, tg_id)
+    SELECT ?, lower(ltrim(j.value, '@')),
+           (SELECT u.tg_id FROM users u WHERE lower(u.username) = lower(ltrim(j.value, '@')))
+    FROM json_each(?) j
+    WHERE ltrim(j.value, '@') != ''
+"""
+
+
+def read_rows(data: bytes, filename: str) -> list[dict]:
+    """
+    Байты файла -> список словарей. CSV по расширению .csv, иначе JSON или JSON Lines.
+    ValueError, если файл целиком не разобрать.
+    """
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("файл не в UTF-8")
+
+    if filename.lower().endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or "notion_url" not in reader.fieldnames:
+            raise ValueError("в CSV нет колонки notion_url")
+        rows = list(reader)
+    else:
+        stripped = text.lstrip()
+        try:
+            if stripped.startswith("["):
+                rows = json.loads(stripped)
+            else:
+                rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            raise ValueError(f"некорректный JSON: {e}")
+        if not all(isinstance(row, dict) for row in rows):
+            raise ValueError("ожидался массив объектов JSON")
+
+    if len(rows) > IMPORT_MAX_ROWS:
+        raise ValueError(f"больше {IMPORT_MAX_ROWS} строк")
+    return rows
+
+
+def _text(row: dict, key: str) -> str:
+    value = row.get(key)
+    return "" if value is None else str(value).strip()
+
+
+def parse_task(row: dict, now: int) -> dict:
+    """Строка файла -> поля задачи. ValueError с причиной отказа."""
+    url = _text(row, "notion_url")
+    if not url:
+        raise ValueError("нет notion_url")
+    if not normalize_url(url).split("://", 1)[1]:
+        raise ValueError("notion_url — не ссылка")
+    title = _text(row, "title")
+    if not title:
+        raise ValueError("нет title")
+
+    hours = _text(row, "est_hours")
+    try:
+        est_hours = float(hours) if hours else None
+    except ValueError:
+        raise ValueError("est_hours — не число")
+
+    if _text(row, "deadline_ts"):
+        try:
+            deadline_ts = int(float(_text(row, "deadline_ts")))
+        except ValueError:
+            raise ValueError("deadline_ts — не число")
+    else:
+        deadline_ts = parse_deadline(_text(row, "deadline"))
+        if not deadline_ts:
+            raise ValueError("дедлайн не указан или не разобран")
+    if deadline_ts <= now:
+        raise ValueError("дедлайн уже прошёл")
+
+    mode = _text(row, "publish_mode").lower() or "open"
+    if mode not in ("open", "direct"):
+        raise ValueError("publish_mode — open или direct")
+    usernames = [u.lstrip("@") for u in re.split(r"[\s,;]+", _text(row, "usernames")) if u.lstrip("@")]
+    if mode == "direct" and not usernames:
+        raise ValueError("для direct нужны usernames")
+
+    return {
+        "title": title,
+        "notion_url": url,
+        "level": _text(row, "level") or None,
+        "est_hours": est_hours or None,
+        "publish_mode": mode,
+        "deadline_ts": deadline_ts,
+        "allowed_usernames": json.dumps(usernames) if mode == "direct" else None,
+        "dedupe_hash": dedupe_hash(url),
+    }
+
+
+def import_tasks(data: bytes, filename: str, creator_id: int) -> tuple[list, list]:
+    """
+    Импортирует задачи из файла. Возвращает (отчёт, созданные задачи):
+    отчёт — строки REPORT_COLUMNS по каждой строке файла (нумерация с 1, как
+    в таблице без заголовка), созданные — (id, deadline_ts) для движка просрочки.
+    ValueError, если файл целиком не разобрать.
+    """
+    rows = read_rows(data, filename)
+    now = now_ts()
+    report = [None] * len(rows)
+    accepted = {}  # dedupe_hash -> (номер строки, задача)
+
+    for i, row in enumerate(rows):
+        try:
+            task = parse_task(row, now)
+        except ValueError as e:
+            report[i] = [i + 1, "rejected", "", str(e), _text(row, "notion_url")]
+            continue
+        first = accepted.get(task["dedupe_hash"])
+        if first:
+            report[i] = [i + 1, "rejected", "", f"дубль строки {first[0] + 1}", task["notion_url"]]
+            continue
+        accepted[task["dedupe_hash"]] = (i, task)
+
+    created = []
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Сверка в той же транзакции: мастер не успеет создать такую же задачу между проверкой и вставкой
+            existing = conn.execute(ACTIVE_DUPLICATES_SQL, (json.dumps(list(accepted)),)).fetchall()
+            for row in existing:
+                i, task = accepted.pop(row['dedupe_hash'])
+                report[i] = [i + 1, "rejected", row['id'], f"уже есть активная задача #{row['id']}", task["notion_url"]]
+
+            tasks = [task for _, task in accepted.values()]
+            conn.executemany(_INSERT, [
+                (t["title"], t["notion_url"], t["level"], t["est_hours"], t["publish_mode"], t["deadline_ts"],
+                 creator_id, t["allowed_usernames"], t["dedupe_hash"], now, now)
+                for t in tasks
+            ])
+            # dedupe_hash уникален среди активных задач, поэтому id находятся однозначно
+            ids = {
+                row['dedupe_hash']: row['id']
+                for row in conn.execute(ACTIVE_DUPLICATES_SQL, (json.dumps(list(accepted)),))
+            }
+            conn.executemany(_ASSIGNEES, [
+                (ids[t["dedupe_hash"]], t["allowed_usernames"]) for t in tasks if t["allowed_usernames"]
+            ])
+            conn.executemany(
+                "INSERT INTO events (ts, actor_id, action, task_id, meta) VALUES (?, ?, 'create', ?, ?)",
+                [(now, creator_id, ids[t["dedupe_hash"]], f"mode: {t['publish_mode']}, import") for t in tasks]
+            )
+            record_transitions(conn, "create", [(None, t["level"]) for t in tasks])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    for i, task in accepted.values():
+        task_id = ids[task["dedupe_hash"]]
+        report[i] = [i + 1, "accepted", task_id, "", task["notion_url"]]
+        created.append((task_id, task["deadline_ts"]))
+    # id удалённых задач могут достаться новым
+    task_cards.invalidate([task_id for task_id, _ in created])
+    return report, created
+
+
+def render_report(report: list) -> bytes:
+    """Отчёт импорта в CSV."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(REPORT_COLUMNS)
+    writer.writerows(report)
+    return out.getvalue().encode("utf-8")
+
+
+def report_summary(report: list) -> tuple[int, int]:
+    """(принято, отклонено)."""
+    accepted = sum(1 for row in report if row[1] == "accepted")
+    return accepted, len(report) - accepted
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Импорт задач из CSV/JSON")
+    parser.add_argument("file")
+    parser.add_argument("--pm", type=int, required=True, help="tg_id PM, от имени которого создаются задачи")
+    parser.add_argument("--report", help="куда записать отчёт по строкам (CSV)")
+    args = parser.parse_args()
+
+    init_db()
+    with open(args.file, "rb") as f:
+        report, _ = import_tasks(f.read(), args.file, args.pm)
+    if args.report:
+        with open(args.report, "wb") as f:
+            f.write(render_report(report))
+    accepted, rejected = report_summary(report)
+    print(f"Принято {accepted}, отклонено {rejected}")
+
+
+if __name__ == "__main__":
+    _main()
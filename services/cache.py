@@ -0,0 +1,98 @@
+# services/cache.py
+"""
+Кэш в памяти процесса с ограничением размера, вытеснением давно не
+использованных записей (LRU) и временем жизни (TTL).
+
+- `users` — профиль пользователя (username, full_name, role) в том виде, в
+  каком он записан в users. /start пишет в БД, только если профиль изменился.
+- `task_cards` — готовый текст карточки задачи и её кнопки для списков
+  исполнителя. Запись хранит updated_at задачи и отдаётся, только если он
+  совпадает с прочитанным из БД; обработчики, меняющие задачу, дополнительно
+  сбрасывают её карточки (`invalidate`), потому что updated_at меняется
+  раз в секунду.
+
+Кэш свой у каждого процесса. Чужие изменения задачи видны по updated_at,
+профиль в худшем случае будет записан лишний раз.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL, CARD_CACHE_SIZE, CARD_CACHE_TTL
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Словарь с вытеснением по LRU и TTL. Запись можно сохранить с версией:
+    get с другой версией считается промахом. Потокобезопасен — сбрасывается
+    и из пула потоков БД.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()  # ключ -> (истекает, версия, значение)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version=None, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires, stored_version, value = entry
+            if stored_version != version or (expires is not None and expires <= time.monotonic()):
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, version=None):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires, version, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TaskCards(LRUCache):
+    """Карточки задач: ключ (вид списка, task_id), версия — updated_at."""
+
+    KINDS = ("open", "direct", "my")
+
+    def invalidate(self, task_ids):
+        """Сбрасывает карточки задач во всех списках."""
+        for task_id in task_ids:
+            for kind in self.KINDS:
+                self.pop((kind, task_id))
+
+
+users = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+task_cards = TaskCards(CARD_CACHE_SIZE, CARD_CACHE_TTL)
@@ -0,0 +1,135 @@
+# services/cluster.py
+"""
+Режим нескольких процессов (WORKERS > 1).
+
+Главный процесс — `Supervisor` — только принимает апдейты (long polling или
+webhook) и раздаёт их процессам-воркерам по chat id: все апдейты одного
+чата попадают в один воркер, поэтому там сохраняется их порядок, а кэши
+FSM и очереди отправки остаются согласованными. Воркеры работают с общей
+SQLite-базой; фоновые задачи выполняет только воркер с арендой лидера
+(services/leader.py). Упавший воркер перезапускается, его аренду через
+LEADER_LEASE_TTL забирает другой.
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+import time
+
+from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+# Сколько апдейтов ждут в очереди одного воркера, прежде чем приём притормозит
+_WORKER_QUEUE_SIZE = 1000
+
+
+def raw_chat_key(data: dict) -> int:
+    """Chat id апдейта в формате Bot API (иначе id пользователя или апдейта) без разбора в модели."""
+    for name, event in data.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+    return data.get("update_id", 0)
+
+
+class Supervisor:
+    def __init__(self, target, count: int):
+        """target(index, count, queue) — функция процесса-воркера."""
+        self.target = target
+        self.count = count
+        self._ctx = multiprocessing.get_context("spawn")
+        self._queues = [self._ctx.Queue(_WORKER_QUEUE_SIZE) for _ in range(count)]
+        self._processes: list = [None] * count
+        self._watch: asyncio.Task | None = None
+        self.accepting = False
+        self.routed = 0
+        self.restarts = 0
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(
+            target=self.target, args=(index, self.count, self._queues[index]),
+            name=f"worker-{index}", daemon=False,
+        )
+        process.start()
+        self._processes[index] = process
+
+    def start(self):
+        for index in range(self.count):
+            self._spawn(index)
+        self.accepting = True
+        self._watch = asyncio.create_task(self._watchdog())
+
+    async def submit_raw(self, data: dict):
+        """Отдаёт апдейт воркеру его чата; ждёт, если очередь воркера заполнена."""
+        worker_queue = self._queues[raw_chat_key(data) % self.count]
+        while True:
+            try:
+                worker_queue.put_nowait(data)
+                break
+            except queue.Full:
+                await asyncio.sleep(0.01)
+        self.routed += 1
+
+    async def drain(self, timeout: float):
+        """Перестаёт принимать апдейты, просит воркеры доработать очередь и ждёт их завершения."""
+        self.accepting = False
+        if self._watch:
+            self._watch.cancel()
+            await asyncio.gather(self._watch, return_exceptions=True)
+        deadline = time.monotonic() + timeout
+        for worker_queue in self._queues:
+            # Блокирующий put остановил бы event loop, пока воркер разбирает полную очередь
+            while True:
+                try:
+                    worker_queue.put_nowait(None)
+                    break
+                except queue.Full:
+                    if time.monotonic() >= deadline:
+                        # Воркер не успел: ниже его join истечёт и процесс будет остановлен
+                        break
+                    await asyncio.sleep(0.01)
+
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("%s не завершился за %s с, останавливаем принудительно", process.name, timeout)
+                process.terminate()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.count,
+            "alive": sum(1 for p in self._processes if p and p.is_alive()),
+            "routed": self.routed,
+            "restarts": self.restarts,
+        }
+
+    async def _watchdog(self):
+        while True:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.error("%s завершился с кодом %s, перезапускаем", process.name, process.exitcode)
+                    self.restarts += 1
+                    self._spawn(index)
+
+
+async def poll_updates(bot: Bot, intake, allowed_updates: list, timeout: int = 30):
+    """Long polling в главном процессе: забирает апдейты и отдаёт их intake до отмены."""
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.warning("Ошибка получения апдейтов: %s", e)
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            await intake.submit_raw(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+            offset = update.update_id + 1
@@ -0,0 +1,79 @@
+# services/dedupe.py
+"""
+Повторные нажатия inline-кнопок, меняющих задачу.
+
+Двойное нажатие «Принять», «Отказаться», «Сдать», «Принять/Вернуть» у PM
+или выгрузки присылает два callback с одинаковыми (пользователь,
+callback_data). Без защиты второй заново проходит обработчик: лишняя
+транзакция, лишняя строка аудита, у сдачи — повторное сообщение каждому PM.
+
+`CallbackDedupeMiddleware` — внешний middleware callback_query:
+- пока первый callback обрабатывается, такой же ждёт его окончания и
+  получает пустой ответ (снимает «часики» у кнопки) — обработчик не
+  запускается второй раз;
+- после успешной обработки ключ ещё CALLBACK_DEDUPE_TTL секунд лежит в
+  ограниченном LRU-кэше, и повтор так же отвечается пустым ответом.
+Если обработчик упал, ключ не запоминается — повторное нажатие сработает.
+
+Состояние своё у каждого процесса: в режиме нескольких воркеров апдейты
+одного чата всегда попадают в один воркер.
+"""
+import asyncio
+import logging
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+from config import CALLBACK_DEDUPE_TTL, CALLBACK_DEDUPE_SIZE
+from services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Кнопки, повтор которых меняет данные или шлёт сообщения; навигация по спискам не трогается
+DEDUPE_PREFIXES = ("exec_take_", "exec_drop_", "exec_submit_", "pm_accept_", "pm_return_", "exp_f_")
+
+
+class CallbackDedupeMiddleware(BaseMiddleware):
+    def __init__(self, ttl: float, maxsize: int, prefixes: tuple = DEDUPE_PREFIXES):
+        self.ttl = ttl
+        self.prefixes = prefixes
+        self._inflight: dict[tuple, asyncio.Future] = {}  # (user_id, data) -> окончание обработки
+        self._done = LRUCache(maxsize, ttl)
+        self.collapsed = 0
+        self.repeated = 0
+
+    async def __call__(self, handler, event: CallbackQuery, data: dict):
+        if not self.ttl or not (event.data or "").startswith(self.prefixes):
+            return await handler(event, data)
+
+        key = (event.from_user.id, event.data)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.collapsed += 1
+            # shield: отмена повтора не должна отменять ожидание остальных
+            await asyncio.shield(inflight)
+            return await event.answer()
+        if self._done.get(key):
+            self.repeated += 1
+            return await event.answer()
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await handler(event, data)
+            self._done.set(key, True)
+            return result
+        finally:
+            del self._inflight[key]
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "remembered": self._done.stats()["size"],
+            "collapsed": self.collapsed,
+            "repeated": self.repeated,
+        }
+
+
+callback_dedupe = CallbackDedupeMiddleware(CALLBACK_DEDUPE_TTL, CALLBACK_DEDUPE_SIZE)
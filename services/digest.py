@@ -0,0 +1,138 @@
+# services/digest.py
+"""
+Сводка уведомлений PM вместо сообщения на каждое событие.
+
+Просрочки и отказы от задач копятся для каждого PM в течение
+PM_DIGEST_WINDOW секунд после первого события и уходят одним сообщением
+на PM за окно («⌛️ Просрочено задач: 12» со списком). Если за окно
+случилось одно событие, PM получает его обычный текст. Массовая просрочка
+тысячи задач — одно сообщение на PM вместо тысячи.
+
+Память ограничена: на PM и вид события хранится не больше
+PM_DIGEST_MAX_LINES последних строк, остальные только считаются
+(«… и ещё 980»). Сдачи на проверку сюда не попадают: им нужны кнопки
+pm_review_kb, и обработчик шлёт их сразу.
+"""
+import asyncio
+import logging
+from collections import deque
+
+from config import PM_IDS, PM_DIGEST_WINDOW, PM_DIGEST_MAX_LINES
+from services.outbox import outbox
+
+logger = logging.getLogger(__name__)
+
+# Вид события -> заголовок раздела сводки
+KINDS = {
+    "expired": "⌛️ <b>Просрочено задач: {count}</b>",
+    "dropped": "🚫 <b>Отказов от задач: {count}</b>",
+}
+
+# Лимит Telegram на текст сообщения — 4096 символов, оставляем запас
+_MAX_TEXT = 3900
+
+
+class _Section:
+    __slots__ = ("count", "lines", "text")
+
+    def __init__(self, max_lines: int):
+        self.count = 0
+        self.lines = deque(maxlen=max_lines)
+        self.text = ""
+
+
+class PMDigest:
+    def __init__(self, window: float, max_lines: int):
+        self.window = window
+        self.max_lines = max_lines
+        self._queues: dict[int, dict[str, _Section]] = {}  # pm_id -> вид события -> раздел
+        self._pending = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.events = 0
+        self.digests = 0
+        self.overflow = 0
+
+    def notify(self, kind: str, line: str, text: str):
+        """
+        Событие для всех PM: line — строка в сводке, text — сообщение,
+        если событие за окно единственное.
+        """
+        if self._task is None or not self.window:
+            for pm_id in PM_IDS:
+                outbox.send_message(pm_id, text)
+            return
+        for pm_id in PM_IDS:
+            sections = self._queues.setdefault(pm_id, {})
+            section = sections.get(kind)
+            if section is None:
+                section = sections[kind] = _Section(self.max_lines)
+            if len(section.lines) == self.max_lines:
+                self.overflow += 1
+            section.count += 1
+            section.lines.append(line)
+            section.text = text
+            self.events += 1
+        self._pending.set()
+
+    def flush(self):
+        """Отдаёт накопленное в outbox: одно сообщение на PM."""
+        queues, self._queues = self._queues, {}
+        for pm_id, sections in queues.items():
+            outbox.send_message(pm_id, render(sections))
+            self.digests += 1
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_pms": len(self._queues),
+            "events": self.events,
+            "digests": self.digests,
+            "overflow": self.overflow,
+        }
+
+    async def _run(self):
+        while True:
+            await self._pending.wait()
+            # Окно отсчитывается от первого события
+            await asyncio.sleep(self.window)
+            self._pending.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Ошибка отправки сводки PM")
+
+
+def render(sections: dict) -> str:
+    """Текст сводки для одного PM; одиночное событие — его обычный текст."""
+    if sum(section.count for section in sections.values()) == 1:
+        return next(iter(sections.values())).text
+
+    parts = []
+    size = 0
+    for kind, header in KINDS.items():
+        section = sections.get(kind)
+        if section is None:
+            continue
+        lines = [header.format(count=section.count)]
+        size += len(lines[0])
+        for line in section.lines:
+            if size + len(line) > _MAX_TEXT:
+                break
+            lines.append(line)
+            size += len(line) + 1
+        if section.count > len(lines) - 1:
+            lines.append(f"… и ещё {section.count - len(lines) + 1}")
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts)
+
+
+digest = PMDigest(PM_DIGEST_WINDOW, PM_DIGEST_MAX_LINES)
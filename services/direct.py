@@ -58,3 +58,19 @@ def validate_token(token: str) -> int | None:
             
     except Exception:
         return None
+
+
+def save_assignees(conn, task_id: int, allowed_usernames: str | None):
+    """
+    Раскладывает JSON-список username точечной задачи в таблицу task_assignees.
+    Не коммитит: вызывается внутри транзакции, создающей задачу.
+    """
+    if not allowed_usernames:
+        return
+    conn.execute("""
+        INSERT OR IGNORE INTO task_assignees(task_id, username_lower, tg_id)
+        SELECT ?, lower(ltrim(j.value, '@')),
+               (SELECT u.tg_id FROM users u WHERE lower(u.username) = lower(ltrim(j.value, '@')))
+        FROM json_each(?) j
+        WHERE ltrim(j.value, '@') != ''
+    """, (task_id, allowed_usernames))
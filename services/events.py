@@ -0,0 +1,102 @@
+# services/events.py
+"""
+Запись аудита в таблицу events.
+
+Два режима:
+- `log_event_within_connection` — синхронный: событие пишется в уже
+  открытую транзакцию и фиксируется вместе с изменением статуса задачи
+  (create, take, drop, done, return, expire, remind).
+- `events.emit` — буферизованный: для событий, которые не меняют состояние
+  (например, submit). Событие кладётся в память, а `EventSink` пишет
+  накопленное одной транзакцией `executemany`, когда набралось
+  EVENT_FLUSH_SIZE событий или прошло EVENT_FLUSH_INTERVAL секунд.
+  При остановке бота буфер сбрасывается полностью.
+"""
+import asyncio
+import logging
+
+from config import EVENT_FLUSH_SIZE, EVENT_FLUSH_INTERVAL
+from db import connection, run_db
+from services.metrics import job_timer
+from utils.time import now_ts
+
+logger = logging.getLogger(__name__)
+
+_INSERT = "INSERT INTO events (ts, actor_id, action, task_id, meta) VALUES (?, ?, ?, ?, ?)"
+
+
+def log_event_within_connection(conn, actor_id, action, task_id=None, meta=None):
+    """
+    Логирование внутри уже открытой транзакции.
+    ВАЖНО: Использует переданное соединение и НЕ коммитит изменения.
+    """
+    conn.execute(_INSERT, (now_ts(), actor_id, action, task_id, meta))
+
+
+def write_events(batch: list):
+    """Записывает пачку событий (ts, actor_id, action, task_id, meta) одной транзакцией."""
+    with connection() as conn:
+        conn.executemany(_INSERT, batch)
+        conn.commit()
+
+
+class EventSink:
+    def __init__(self, flush_size: int, flush_interval: float):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer: list = []
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self.written = 0
+        self.flushes = 0
+
+    def emit(self, actor_id, action, task_id=None, meta=None):
+        """Ставит событие в буфер. Время берётся в момент вызова, а не записи."""
+        self._buffer.append((now_ts(), actor_id, action, task_id, meta))
+        if len(self._buffer) >= self.flush_size:
+            self._full.set()
+
+    async def flush(self):
+        """Записывает всё накопленное. Если запись не удалась, события остаются в буфере."""
+        async with self._lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            try:
+                with job_timer("events_flush"):
+                    await run_db(write_events, batch)
+            except Exception:
+                self._buffer[:0] = batch
+                raise
+            self.written += len(batch)
+            self.flushes += 1
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"buffered": len(self._buffer), "written": self.written, "flushes": self.flushes}
+
+    async def _run(self):
+        while True:
+            self._full.clear()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                # Остановка не должна прервать запись уже взятой из буфера пачки
+                await asyncio.shield(self.flush())
+            except Exception:
+                logger.exception("Ошибка записи событий (%s в буфере)", len(self._buffer))
+
+
+events = EventSink(EVENT_FLUSH_SIZE, EVENT_FLUSH_INTERVAL)
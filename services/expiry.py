@@ -0,0 +1,185 @@
+# services/expiry.py
+"""
+Просрочка задач по событию, а не по периодическому сканированию.
+
+Движок держит в памяти кучу (deadline_ts, task_id) активных задач, которая
+строится из БД при старте и обновляется обработчиками (`track`/`discard`).
+Он просыпается ровно к ближайшему дедлайну, одним UPDATE переводит все
+наступившие задачи в 'expired', фиксирует транзакцию и только потом отдаёт
+уведомления в очередь `outbox`. Раз в EXPIRE_SCAN_INTERVAL дополнительно
+проверяется БД — на случай задач, о которых движок не узнал.
+"""
+import asyncio
+import heapq
+import logging
+import time
+
+from aiogram import Bot
+
+from config import EXPIRE_SCAN_INTERVAL
+from db import connection, run_db
+from services.cache import task_cards
+from services.digest import digest
+from services.metrics import job_timer
+from services.outbox import outbox
+from services.reminders import cancel_reminders
+from services.stats import record_transitions
+from utils.time import now_ts
+
+logger = logging.getLogger(__name__)
+
+# Сколько id передавать в одном UPDATE ... WHERE id IN (...)
+_BATCH = 500
+
+# Сверка с БД: все активные задачи с наступившим дедлайном
+EXPIRE_DUE_SQL = """
+    UPDATE tasks SET status = 'expired', updated_at = ?
+    WHERE status IN ('new', 'taken') AND deadline_ts <= ?
+    RETURNING id, title, assigned_to, level
+"""
+
+# Задачи из кучи движка; {marks} — по «?» на id
+EXPIRE_IDS_SQL = """
+    UPDATE tasks SET status = 'expired', updated_at = ?
+    WHERE id IN ({marks}) AND status IN ('new', 'taken') AND deadline_ts <= ?
+    RETURNING id, title, assigned_to, level
+"""
+
+
+def expire_tasks(actor_id: int, task_ids: list | None = None) -> list:
+    """
+    Переводит в 'expired' задачи с наступившим дедлайном одной транзакцией.
+    Если task_ids не задан, берёт все такие задачи из БД.
+    Возвращает строки (id, title, assigned_to, level) реально просроченных задач.
+    """
+    now = now_ts()
+    expired = []
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if task_ids is None:
+            expired = conn.execute(EXPIRE_DUE_SQL, (now, now)).fetchall()
+        else:
+            for i in range(0, len(task_ids), _BATCH):
+                chunk = task_ids[i:i + _BATCH]
+                marks = ",".join("?" * len(chunk))
+                expired += conn.execute(EXPIRE_IDS_SQL.format(marks=marks), (now, *chunk, now)).fetchall()
+        cancel_reminders(conn, [task['id'] for task in expired])
+        conn.executemany(
+            "INSERT INTO events (ts, actor_id, action, task_id, meta) VALUES (?, ?, 'expire', ?, NULL)",
+            [(now, actor_id, task['id']) for task in expired]
+        )
+        record_transitions(conn, "expire", [(task['assigned_to'], task['level']) for task in expired])
+        conn.commit()
+    task_cards.invalidate([task['id'] for task in expired])
+    return expired
+
+
+def notify_expired(tasks: list):
+    """Ставит уведомления о просрочке в очередь отправки, не дожидаясь доставки; PM — сводкой."""
+    for task in tasks:
+        if task['assigned_to']:
+            outbox.send_message(task['assigned_to'], f"⌛️ <b>Время вышло!</b> Задача «{task['title']}» просрочена.")
+
+        digest.notify(
+            "expired",
+            f"#{task['id']} «{task['title']}»",
+            f"⌛️ Задача #{task['id']} «{task['title']}» просрочена.",
+        )
+
+
+def _load_active() -> list:
+    with connection() as conn:
+        return conn.execute(
+            "SELECT id, deadline_ts FROM tasks WHERE status IN ('new', 'taken') AND deadline_ts IS NOT NULL"
+        ).fetchall()
+
+
+class ExpiryEngine:
+    def __init__(self, resync_interval: float):
+        self.resync_interval = resync_interval
+        self._heap: list = []                  # (deadline_ts, task_id), устаревшие записи удаляются лениво
+        self._deadlines: dict[int, int] = {}   # task_id -> актуальный дедлайн активной задачи
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.expired_total = 0
+
+    def track(self, task_id: int, deadline_ts: int | None):
+        """Задача активна (создана, взята, возвращена) и должна просрочиться в deadline_ts."""
+        # Движок работает только в процессе-лидере; остальные задачи подхватит его сверка с БД
+        if self._task is None or deadline_ts is None or self._deadlines.get(task_id) == deadline_ts:
+            return
+        self._deadlines[task_id] = deadline_ts
+        heapq.heappush(self._heap, (deadline_ts, task_id))
+        if self._heap[0] == (deadline_ts, task_id):
+            self._wakeup.set()
+        self._compact()
+
+    def discard(self, task_id: int):
+        """Задача больше не активна (сдана, отказ, просрочена)."""
+        self._deadlines.pop(task_id, None)
+
+    async def start(self, bot: Bot):
+        rows = await run_db(_load_active)
+        self._deadlines = {row['id']: row['deadline_ts'] for row in rows}
+        self._heap = [(deadline, task_id) for task_id, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
+        logger.info("Движок просрочки: отслеживается %s активных задач", len(self._heap))
+        self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _compact(self):
+        # Ленивое удаление оставляет в куче устаревшие записи; перестраиваем, когда их много
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(d, t) for t, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_due(self, now: int) -> list:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, task_id = heapq.heappop(self._heap)
+            if self._deadlines.get(task_id) == deadline:
+                del self._deadlines[task_id]
+                due.append(task_id)
+        return due
+
+    async def _run(self, bot: Bot):
+        last_scan = time.monotonic()
+        while True:
+            timeout = self.resync_interval - (time.monotonic() - last_scan)
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - time.time())
+            if timeout > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due = self._pop_due(now_ts())
+            if time.monotonic() - last_scan >= self.resync_interval:
+                # Сверка с БД покрывает и всё, что лежало в куче
+                last_scan = time.monotonic()
+                due = None
+            elif not due:
+                continue
+
+            with job_timer("expiry"):
+                try:
+                    expired = await run_db(expire_tasks, bot.id, due)
+                except Exception:
+                    # Не потеряем задачи: их подберёт ближайшая сверка с БД
+                    logger.exception("Ошибка при просрочке задач")
+                    continue
+                for task in expired:
+                    self._deadlines.pop(task['id'], None)
+                self.expired_total += len(expired)
+                notify_expired(expired)
+
+
+expiry = ExpiryEngine(EXPIRE_SCAN_INTERVAL)
@@ -1,46 +1,167 @@
 # services/export.py
+"""
+Выгрузка задач за любой период с фильтром по статусу в CSV, CSV.gz или JSON Lines.
+
+Строки читаются курсором порциями по EXPORT_CHUNK_ROWS и сразу пишутся в
+SpooledTemporaryFile: до EXPORT_SPOOL_BYTES файл живёт в памяти, больше —
+во временном файле ОС, поэтому память не растёт с числом строк. Запись идёт
+в отдельном потоке (не в пуле потоков БД), чтобы годовая выгрузка не
+задерживала ни event loop, ни запросы других пользователей. Готовый буфер
+отправляется в Telegram через `SpooledInputFile`, без файлов в папке проекта.
+"""
+import asyncio
 import csv
-import os
+import gzip
+import io
+import json
+import tempfile
 from datetime import datetime, timedelta
 
-from db import get_conn
-from config import EXPORT_DIR
-from utils.time import now_ts, humanize_ts
+from aiogram import Bot
+from aiogram.types import InputFile
+
+from config import EXPORT_CHUNK_ROWS, EXPORT_SPOOL_BYTES
+from db import connection
+from utils.time import now_ts, humanize_ts, tz
+
+# Формат в callback_data -> расширение файла
+FORMATS = {"csv": "csv", "csvgz": "csv.gz", "jsonl": "jsonl"}
+STATUSES = ("new", "taken", "done", "dropped", "expired")
+# Скользящие периоды в днях; свой период задаётся как YYYYMMDD-YYYYMMDD
+PERIODS = {"7d": 7, "30d": 30, "90d": 90, "365d": 365}
+
+# Telegram не принимает от бота файлы больше 50 МБ
+UPLOAD_LIMIT = 50 * 1024 * 1024
 
-def generate_csv_for_last_week() -> str:
-    """Генерирует CSV-отчет за последние 7 дней и возвращает путь к файлу."""
-    end_ts = now_ts()
-    start_ts = int((datetime.now() - timedelta(days=7)).timestamp())
+_COLUMNS = ["id", "title", "notion_url", "assignee_username", "status", "level", "est_hours",
+            "deadline", "created_at", "updated_at"]
 
-    conn = get_conn()
-    # Запрос для получения задач с именем исполнителя
-    tasks = conn.execute("""
+# Одна выгрузка за раз: у каждой на всё время чтения занято соединение из пула
+_running = asyncio.Semaphore(1)
+
+
+def export_sql(by_status: bool) -> str:
+    """Запрос выгрузки; индексы idx_tasks_created_at и idx_tasks_status_created отдают строки уже по порядку."""
+    status = "AND t.status = ?" if by_status else ""
+    return f"""
         SELECT
-            t.id, t.title, t.notion_url, u.username as assignee_username, t.status,
+            t.id, t.title, t.notion_url, u.username AS assignee_username, t.status,
             t.level, t.est_hours, t.deadline_ts, t.created_at, t.updated_at
         FROM tasks t
         LEFT JOIN users u ON t.assigned_to = u.tg_id
-        WHERE t.created_at >= ?
+        WHERE t.created_at >= ? AND t.created_at < ? {status}
         ORDER BY t.created_at DESC
-    """, (start_ts,)).fetchall()
-    conn.close()
-
-    os.makedirs(EXPORT_DIR, exist_ok=True)
-    file_path = os.path.join(EXPORT_DIR, f"report_{now_ts()}.csv")
-
-    headers = ["id", "title", "notion_url", "assignee_username", "status", "level", "est_hours", "deadline", "created_at", "updated_at"]
-
-    with open(file_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(headers)
-        for task in tasks:
-            writer.writerow([
-                task['id'], task['title'], task['notion_url'],
-                task['assignee_username'] or '', task['status'], task['level'],
-                task['est_hours'],
-                humanize_ts(task['deadline_ts']) if task['deadline_ts'] else '',
-                humanize_ts(task['created_at']) if task['created_at'] else '',
-                humanize_ts(task['updated_at']) if task['updated_at'] else ''
-            ])
-            
-    return file_path
\ No newline at end of file
+    """
+
+
+def _parse_day(value: str) -> datetime:
+    return datetime.strptime(value, "%Y%m%d")
+
+
+def period_range(period: str) -> tuple[int, int]:
+    """'30d' или '20250101-20251231' (включительно, в TIMEZONE) -> [start_ts, end_ts). ValueError, если не разобрать."""
+    if period in PERIODS:
+        end_ts = now_ts() + 1
+        return end_ts - PERIODS[period] * 86400, end_ts
+    start, end = (_parse_day(day) for day in period.split("-"))
+    if end < start:
+        raise ValueError("конец периода раньше начала")
+    # Границы — местные полуночи; в день перевода часов сутки не равны 86400 с
+    return int(tz.localize(start).timestamp()), int(tz.localize(end + timedelta(days=1)).timestamp())
+
+
+def parse_period_text(text: str) -> str:
+    """'2025-01-01 2025-12-31' -> '20250101-20251231'. ValueError, если не разобрать."""
+    start, end = text.split()
+    period = "-".join(datetime.strptime(day, "%Y-%m-%d").strftime("%Y%m%d") for day in (start, end))
+    period_range(period)
+    return period
+
+
+def period_label(period: str) -> str:
+    if period in PERIODS:
+        return f"за {PERIODS[period]} дн."
+    start, end = (_parse_day(day).strftime("%d.%m.%Y") for day in period.split("-"))
+    return f"с {start} по {end}"
+
+
+def _csv_row(task) -> list:
+    return [
+        task['id'], task['title'], task['notion_url'],
+        task['assignee_username'] or '', task['status'], task['level'],
+        task['est_hours'],
+        humanize_ts(task['deadline_ts']) if task['deadline_ts'] else '',
+        humanize_ts(task['created_at']) if task['created_at'] else '',
+        humanize_ts(task['updated_at']) if task['updated_at'] else '',
+    ]
+
+
+def _json_row(task) -> str:
+    # Для машинной обработки время остаётся unix timestamp
+    return json.dumps({
+        "id": task['id'], "title": task['title'], "notion_url": task['notion_url'],
+        "assignee_username": task['assignee_username'], "status": task['status'],
+        "level": task['level'], "est_hours": task['est_hours'], "deadline_ts": task['deadline_ts'],
+        "created_at": task['created_at'], "updated_at": task['updated_at'],
+    }, ensure_ascii=False) + "\n"
+
+
+def write_export(out, fmt: str, start_ts: int, end_ts: int, status: str | None = None) -> int:
+    """Пишет выгрузку в бинарный файловый объект out порциями строк. Возвращает число строк."""
+    raw = gzip.GzipFile(fileobj=out, mode="wb") if fmt == "csvgz" else out
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    rows = 0
+    try:
+        writer = csv.writer(text) if fmt != "jsonl" else None
+        if writer:
+            writer.writerow(_COLUMNS)
+        params = (start_ts, end_ts, status) if status else (start_ts, end_ts)
+        with connection() as conn:
+            cursor = conn.execute(export_sql(bool(status)), params)
+            while chunk := cursor.fetchmany(EXPORT_CHUNK_ROWS):
+                if writer:
+                    writer.writerows(_csv_row(task) for task in chunk)
+                else:
+                    text.writelines(_json_row(task) for task in chunk)
+                rows += len(chunk)
+    finally:
+        # out остаётся открытым: его читает SpooledInputFile
+        text.flush()
+        text.detach()
+        if raw is not out:
+            raw.close()
+    return rows
+
+
+class SpooledInputFile(InputFile):
+    """Файл для отправки в Telegram из SpooledTemporaryFile; читается порциями вне event loop."""
+
+    def __init__(self, buffer, filename: str):
+        super().__init__(filename=filename)
+        self.buffer = buffer
+
+    async def read(self, bot: Bot):
+        await asyncio.to_thread(self.buffer.seek, 0)
+        while chunk := await asyncio.to_thread(self.buffer.read, self.chunk_size):
+            yield chunk
+
+    def close(self):
+        self.buffer.close()
+
+
+async def export_tasks(fmt: str, period: str, status: str | None = None) -> tuple[SpooledInputFile, int, int]:
+    """
+    Строит выгрузку и возвращает (файл, число строк, размер в байтах).
+    Файл нужно закрыть после отправки.
+    """
+    start_ts, end_ts = period_range(period)
+    buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    try:
+        async with _running:
+            rows = await asyncio.to_thread(write_export, buffer, fmt, start_ts, end_ts, status)
+    except BaseException:
+        buffer.close()
+        raise
+    size = buffer.tell()
+    filename = f"tasks_{period}_{status or 'all'}.{FORMATS[fmt]}"
+    return SpooledInputFile(buffer, filename), rows, size
@@ -0,0 +1,187 @@
+# services/fsm_storage.py
+"""
+Хранилище FSM aiogram в таблице fsm_states нашей SQLite-базы.
+
+Незаконченные мастера AddTask и SearchTask переживают перезапуск бота.
+Чтение и запись идут через кэш в памяти: состояние пользователя читается
+из БД один раз, изменения помечаются «грязными» и пишутся пачкой раз в
+FSM_FLUSH_INTERVAL секунд (и обязательно при остановке диспетчера).
+Состояния, которых не касались FSM_STATE_TTL секунд, считаются брошенными
+и удаляются; из памяти записи уходят после FSM_CACHE_IDLE секунд простоя.
+Чтение тоже продлевает жизнь состояния: если строка в БД записана больше
+половины FSM_STATE_TTL назад, запись снова помечается грязной, иначе
+очистка удалила бы состояние, которым мастер ещё пользуется из кэша.
+
+Кэш принадлежит процессу, поэтому при нескольких воркерах апдейты одного
+чата должен обрабатывать один и тот же воркер.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Mapping
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from config import FSM_FLUSH_INTERVAL, FSM_STATE_TTL, FSM_CACHE_IDLE
+from db import connection, run_db
+from services.metrics import job_timer
+
+logger = logging.getLogger(__name__)
+
+
+def _load_state(key: str, min_updated: int):
+    with connection() as conn:
+        return conn.execute(
+            "SELECT state, data, updated_at FROM fsm_states WHERE key = ? AND updated_at >= ?", (key, min_updated)
+        ).fetchone()
+
+
+def _save_states(rows: list, expired_before: int):
+    """Пишет пачку (key, state, data, updated_at) и удаляет брошенные состояния."""
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "DELETE FROM fsm_states WHERE key = ?",
+            [(key,) for key, state, data, _ in rows if state is None and data is None]
+        )
+        conn.executemany("""
+            INSERT INTO fsm_states(key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                state=excluded.state, data=excluded.data, updated_at=excluded.updated_at
+        """, [row for row in rows if row[1] is not None or row[2] is not None])
+        conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (expired_before,))
+        conn.commit()
+
+
+class _Entry:
+    __slots__ = ("state", "data", "touched", "saved")
+
+    def __init__(self, state: str | None, data: dict, saved: float = 0):
+        self.state = state
+        self.data = data
+        self.touched = time.time()
+        self.saved = saved  # updated_at строки в БД
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, flush_interval: float, state_ttl: int, cache_idle: float):
+        self.flush_interval = flush_interval
+        self.state_ttl = state_ttl
+        self.cache_idle = cache_idle
+        self._cache: dict[str, _Entry] = {}
+        self._dirty: set[str] = set()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.written = 0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return (f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:"
+                f"{key.business_connection_id or ''}:{key.destiny}")
+
+    async def _entry(self, key: StorageKey) -> tuple[str, _Entry]:
+        k = self._key(key)
+        now = time.time()
+        entry = self._cache.get(k)
+        if entry is None:
+            self.misses += 1
+            row = await run_db(_load_state, k, int(now - self.state_ttl))
+            if row:
+                loaded = _Entry(row['state'], json.loads(row['data'] or "{}"), row['updated_at'])
+            else:
+                loaded = _Entry(None, {})
+            # Пока шло чтение, запись могла появиться из другого апдейта
+            entry = self._cache.setdefault(k, loaded)
+        else:
+            self.hits += 1
+            if now - entry.touched > self.state_ttl:
+                entry.state, entry.data = None, {}
+                self._dirty.add(k)
+        entry.touched = now
+        if (entry.state is not None or entry.data) and now - entry.saved > self.state_ttl / 2:
+            # Продлеваем строку в БД, пока состояние читают
+            self._dirty.add(k)
+        return k, entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k, entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._dirty.add(k)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        _, entry = await self._entry(key)
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        k, entry = await self._entry(key)
+        entry.data = data.copy()
+        self._dirty.add(k)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, entry = await self._entry(key)
+        return entry.data.copy()
+
+    async def flush(self):
+        """Пишет изменённые состояния одной транзакцией. При ошибке они останутся грязными."""
+        async with self._lock:
+            keys, self._dirty = self._dirty, set()
+            try:
+                rows, entries = [], []
+                for k in keys:
+                    entry = self._cache.get(k)
+                    if entry is not None:
+                        data = json.dumps(entry.data, ensure_ascii=False) if entry.data else None
+                        rows.append((k, entry.state, data, int(entry.touched)))
+                        entries.append(entry)
+                if rows:
+                    with job_timer("fsm_flush"):
+                        await run_db(_save_states, rows, int(time.time() - self.state_ttl))
+            except Exception:
+                self._dirty |= keys
+                raise
+            for entry, row in zip(entries, rows):
+                entry.saved = row[3]
+            self.written += len(rows)
+
+            # Из памяти убираем давно не тронутые и уже сохранённые записи
+            idle_before = time.time() - self.cache_idle
+            for k in [k for k, e in self._cache.items() if e.touched < idle_before and k not in self._dirty]:
+                del self._cache[k]
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "written": self.written,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                # Остановка не должна прервать запись уже взятой пачки
+                await asyncio.shield(self.flush())
+            except Exception:
+                logger.exception("Ошибка сохранения состояний FSM (%s не записано)", len(self._dirty))
+
+
+fsm_storage = SQLiteStorage(FSM_FLUSH_INTERVAL, FSM_STATE_TTL, FSM_CACHE_IDLE)
@@ -0,0 +1,115 @@
+# services/leader.py
+"""
+Аренда лидерства в БД: из всех процессов бота, работающих с одной базой,
+фоновые задачи (просрочка, напоминания, задания планировщика) выполняет
+ровно один — тот, кто держит строку в таблице leases.
+
+Лидер продлевает аренду каждые LEADER_LEASE_TTL / 3 секунд. Если процесс
+умер или завис, аренда истекает и её забирает следующий претендент. Если
+лидер не смог продлить аренду до её истечения, он сам слагает полномочия,
+чтобы два процесса не работали лидерами одновременно. Если задачи лидера не
+запустились, процесс тоже слагает полномочия и отдаёт аренду, а попытка
+повторяется на следующем круге.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+
+from config import LEADER_LEASE_TTL
+from db import connection, run_db
+
+logger = logging.getLogger(__name__)
+
+
+def _try_acquire(name: str, holder: str, ttl: float) -> bool:
+    """Берёт или продлевает аренду, если она свободна, истекла или уже наша."""
+    now = time.time()
+    with connection() as conn:
+        held = conn.execute("""
+            INSERT INTO leases(name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires_at=excluded.expires_at
+            WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+            RETURNING holder
+        """, (name, holder, now + ttl, now)).fetchall()
+        conn.commit()
+    return bool(held)
+
+
+def _release(name: str, holder: str):
+    with connection() as conn:
+        conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+        conn.commit()
+
+
+class LeaderLease:
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._on_acquire = None
+        self._on_release = None
+        self._renewed_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self, on_acquire, on_release):
+        """on_acquire/on_release — корутинные функции без аргументов."""
+        self._on_acquire = on_acquire
+        self._on_release = on_release
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновые задачи лидера и освобождает аренду для других процессов."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            await self._step_down()
+            await self._release()
+
+    async def _release(self):
+        try:
+            await run_db(_release, self.name, self.holder)
+        except Exception as e:
+            logger.warning("Не удалось освободить аренду %s: %s", self.name, e)
+
+    async def _step_down(self):
+        self.is_leader = False
+        try:
+            await self._on_release()
+        except Exception:
+            logger.exception("Ошибка при остановке задач лидера")
+
+    async def _run(self):
+        while True:
+            try:
+                held = await run_db(_try_acquire, self.name, self.holder, self.ttl)
+                if held:
+                    self._renewed_at = time.monotonic()
+            except Exception as e:
+                logger.warning("Ошибка продления аренды %s: %s", self.name, e)
+                # Пока аренда не истекла, она наша; дальше её может забрать другой
+                held = self.is_leader and time.monotonic() - self._renewed_at < self.ttl
+
+            if held and not self.is_leader:
+                logger.info("Процесс %s стал лидером (%s)", self.holder, self.name)
+                self.is_leader = True
+                try:
+                    await self._on_acquire()
+                except Exception:
+                    # Иначе процесс числился бы лидером без задач, а аренду после TTL взял бы другой
+                    logger.exception("Не удалось запустить задачи лидера, слагаем полномочия")
+                    await self._step_down()
+                    await self._release()
+            elif not held and self.is_leader:
+                logger.warning("Процесс %s потерял лидерство (%s)", self.holder, self.name)
+                await self._step_down()
+
+            await asyncio.sleep(self.ttl / 3)
+
+
+leader = LeaderLease("scheduler", LEADER_LEASE_TTL)
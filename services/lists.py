@@ -0,0 +1,87 @@
+# services/lists.py
+"""
+Постраничные списки задач для меню исполнителя и PM.
+
+Список показывается одним сообщением, которое редактируется кнопками
+«Назад»/«Вперёд». Страницы выбираются по курсору (ключ сортировки, id)
+последней или первой показанной строки, без OFFSET и без выборки всего
+списка, поэтому стоимость страницы не зависит от её номера и длины списка.
+"""
+from db import connection
+
+# Задач на одной странице списка
+LIST_PAGE_SIZE = 10
+
+# Вид списка -> (колонки, FROM/WHERE с параметрами, колонка сортировки)
+_LISTS = {
+    "open": (
+        "t.*",
+        "FROM tasks t WHERE t.status='new' AND t.publish_mode='open'",
+        "deadline_ts",
+    ),
+    # CROSS JOIN фиксирует порядок: сначала индекс по username, потом задачи по id
+    "direct": (
+        "t.*",
+        "FROM task_assignees a CROSS JOIN tasks t ON t.id = a.task_id "
+        "WHERE a.username_lower = ? AND t.status='new' AND t.publish_mode='direct'",
+        "deadline_ts",
+    ),
+    # Взятых задач у исполнителя не больше MAX_ACTIVE_TASKS: частичный индекс
+    # по исполнителю всегда лучше прохода по всем взятым задачам в порядке дедлайна
+    "my": (
+        "t.*",
+        "FROM tasks t INDEXED BY idx_tasks_taken_assignee WHERE t.status='taken' AND t.assigned_to=?",
+        "deadline_ts",
+    ),
+    "queue": (
+        "t.*",
+        "FROM tasks t WHERE t.status = 'new'",
+        "created_at",
+    ),
+    "inprog": (
+        "t.*, u.username AS assignee_username",
+        "FROM tasks t JOIN users u ON t.assigned_to = u.tg_id WHERE t.status = 'taken'",
+        "deadline_ts",
+    ),
+}
+
+
+def page_sql(kind: str, cursor: bool, backward: bool) -> str:
+    """SQL страницы списка kind; параметры: (*аргументы WHERE, [ключ, id], лимит)."""
+    columns, body, key = _LISTS[kind]
+    where = ""
+    if cursor:
+        where = f" AND (t.{key}, t.id) {'<' if backward else '>'} (?, ?)"
+    order = "DESC" if backward else "ASC"
+    return f"SELECT {columns} {body}{where} ORDER BY t.{key} {order}, t.id {order} LIMIT ?"
+
+
+def fetch_page(kind: str, args: tuple = (), cursor: list | None = None, backward: bool = False,
+               limit: int = LIST_PAGE_SIZE):
+    """
+    Выбирает страницу списка kind после курсора (или перед ним, если backward).
+    Возвращает (строки, курсор предыдущей страницы, курсор следующей);
+    курсор — [значение ключа сортировки, id] или None, если страницы нет.
+    """
+    params = [*args, *(cursor or ()), limit + 1]
+    with connection() as conn:
+        rows = conn.execute(page_sql(kind, cursor is not None, backward), params).fetchall()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    if not rows:
+        return rows, None, None
+
+    key = _LISTS[kind][2]
+    has_prev, has_next = (more, cursor is not None) if backward else (cursor is not None, more)
+    prev_cursor = [rows[0][key], rows[0]['id']] if has_prev else None
+    next_cursor = [rows[-1][key], rows[-1]['id']] if has_next else None
+    return rows, prev_cursor, next_cursor
+
+
+def parse_page_callback(data: str):
+    """Разбирает callback_data кнопки листания: 'list_<вид>_<n|p>_<ключ>_<id>'."""
+    _, kind, direction, key, task_id = data.split("_")
+    return kind, [int(key), int(task_id)], direction == "p"
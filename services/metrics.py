@@ -0,0 +1,342 @@
+# services/metrics.py
+"""
+Метрики бота в текстовом формате Prometheus и разбивка времени апдейта.
+
+Счётчики и гистограммы живут в памяти процесса (`registry`) и отдаются
+`MetricsServer` по адресу METRICS_HOST:METRICS_PORT/metrics. Состояние
+сервисов (очередь отправки, пул соединений, буферы) снимается в момент
+запроса через `registry.collect()`.
+
+Время каждого апдейта делится на SQLite (запросы замеряет db.TimedConnection,
+ожидание свободного потока БД — db.run_db), Bot API (`ApiMetricsMiddleware`
+на сессии бота) и прочее — код обработчиков и ожидание в очередях. Разбивка
+копится в `Trace` текущего апдейта (contextvar), и апдейт дольше
+SLOW_UPDATE_MS пишется в лог вместе с самыми долгими шагами. Так же
+замеряются фоновые задачи (`job_timer`): просрочка, напоминания, сброс буферов.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Update
+from aiohttp import web
+
+from config import SLOW_UPDATE_MS, SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Сколько разных меток обработчиков учитывать; остальные попадают в "other"
+_MAX_HANDLER_LABELS = 200
+# Сколько шагов трассы хранить для лога медленных апдейтов
+_MAX_STEPS = 50
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *values, amount: float = 1.0):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labels, values)} {value:g}" for values, value in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = _BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values: dict[tuple, list] = {}   # метки -> [счётчики корзин..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *values):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            state = self._values.get(values)
+            if state is None:
+                state = self._values[values] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += seconds
+            state[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((values, list(state)) for values, state in self._values.items())
+        for values, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {state[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {state[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {state[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: dict = {}
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: tuple = ()) -> Histogram:
+        metric = Histogram(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self, prefix: str, stats):
+        """stats() -> dict; числовые значения отдаются как gauge bot_<prefix>_<ключ>."""
+        self._collectors[prefix] = stats
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for prefix, stats in self._collectors.items():
+            try:
+                values = stats()
+            except Exception:
+                logger.exception("Не удалось снять метрики %s", prefix)
+                continue
+            for key, value in values.items():
+                if isinstance(value, (bool, int, float)):
+                    name = f"bot_{prefix}_{key}"
+                    lines += [f"# TYPE {name} gauge", f"{name} {float(value):g}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+updates_total = registry.counter("bot_updates_total", "Обработанные апдейты", ("handler", "status"))
+update_seconds = registry.histogram("bot_update_seconds", "Время обработки апдейта", ("handler",))
+slow_updates_total = registry.counter("bot_slow_updates_total", "Апдейты дольше SLOW_UPDATE_MS", ("handler",))
+sql_seconds = registry.histogram("bot_sql_seconds", "Время SQL-запроса до первой строки", ("op",))
+db_wait_seconds = registry.histogram("bot_db_wait_seconds", "Ожидание свободного потока БД")
+api_seconds = registry.histogram("bot_api_seconds", "Время вызова Bot API", ("method",))
+api_errors_total = registry.counter("bot_api_errors_total", "Ошибки вызовов Bot API", ("method", "error"))
+job_seconds = registry.histogram("bot_job_seconds", "Время итерации фоновой задачи", ("job",))
+
+
+class Trace:
+    """Разбивка времени одного апдейта или итерации фоновой задачи."""
+    __slots__ = ("kind", "label", "started", "sql_count", "sql_time", "db_wait", "api_count", "api_time", "steps")
+
+    def __init__(self, kind: str, label: str):
+        self.kind = kind
+        self.label = label
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.db_wait = 0.0
+        self.api_count = 0
+        self.api_time = 0.0
+        self.steps: list = []
+
+    def step(self, kind: str, name: str, seconds: float):
+        if len(self.steps) < _MAX_STEPS:
+            self.steps.append((seconds, kind, name))
+
+    def report(self, elapsed: float) -> str:
+        other = max(0.0, elapsed - self.sql_time - self.db_wait - self.api_time)
+        lines = [
+            f"{self.kind} {self.label}: {elapsed * 1000:.1f} мс — "
+            f"SQLite {self.sql_count} запр. {self.sql_time * 1000:.1f} мс, "
+            f"ожидание потока БД {self.db_wait * 1000:.1f} мс, "
+            f"Bot API {self.api_count} выз. {self.api_time * 1000:.1f} мс, "
+            f"прочее {other * 1000:.1f} мс"
+        ]
+        for seconds, kind, name in sorted(self.steps, reverse=True)[:10]:
+            lines.append(f"  {kind} {seconds * 1000:8.1f} мс  {name}")
+        return "\n".join(lines)
+
+
+_trace: contextvars.ContextVar = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def _compact_sql(sql: str) -> str:
+    return " ".join(sql.split())[:200]
+
+
+def observe_sql(sql: str, seconds: float):
+    """Вызывается из потоков БД для каждого запроса (db.TimedConnection)."""
+    head = sql.lstrip()[:8].split(None, 1)
+    sql_seconds.observe(seconds, head[0].upper() if head else "")
+    trace = _trace.get()
+    if trace is not None:
+        trace.sql_count += 1
+        trace.sql_time += seconds
+        trace.step("sql", _compact_sql(sql), seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning("Медленный запрос %.1f мс: %s", seconds * 1000, _compact_sql(sql))
+
+
+def observe_db_wait(seconds: float):
+    """Сколько задание db.run_db ждало свободного потока."""
+    db_wait_seconds.observe(seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.db_wait += seconds
+
+
+def _finish(trace: Trace, histogram: Histogram) -> float:
+    elapsed = time.perf_counter() - trace.started
+    histogram.observe(elapsed, trace.label)
+    if elapsed * 1000 >= SLOW_UPDATE_MS:
+        logger.warning("Медленно: %s", trace.report(elapsed))
+    return elapsed
+
+
+@contextmanager
+def job_timer(name: str):
+    """Замеряет итерацию фоновой задачи; можно оборачивать и код с await."""
+    trace = Trace("задача", name)
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+        _finish(trace, job_seconds)
+
+
+def _callback_key(data: str) -> str:
+    """exec_take_15 -> exec_take, list_open_n_1700000000_15 -> list_open_n: без id в метке."""
+    parts = []
+    for part in data.split("_"):
+        if any(ch.isdigit() for ch in part):
+            break
+        parts.append(part)
+    return "_".join(parts) or "other"
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: время обработки по callback_data или команде."""
+
+    def __init__(self):
+        self._labels: set = set()
+
+    def _label(self, update: Update, raw_state) -> str:
+        if update.callback_query:
+            label = "cb:" + _callback_key(update.callback_query.data or "")
+        elif update.message:
+            text = update.message.text or ""
+            if text.startswith("/"):
+                label = "cmd:" + text.split(maxsplit=1)[0].split("@")[0]
+            else:
+                label = f"msg:{raw_state}" if raw_state else "msg"
+        else:
+            label = update.event_type
+        # Метки от пользовательского ввода (неизвестные команды) не должны расти без предела
+        if label not in self._labels:
+            if len(self._labels) >= _MAX_HANDLER_LABELS:
+                return "other"
+            self._labels.add(label)
+        return label
+
+    async def __call__(self, handler, event: Update, data: dict):
+        # Зарегистрирован после FSM-middleware диспетчера, поэтому состояние уже известно
+        trace = Trace("апдейт", self._label(event, data.get("raw_state")))
+        token = _trace.set(trace)
+        status = "ok"
+        try:
+            result = await handler(event, data)
+            if result is UNHANDLED:
+                status = "unhandled"
+            return result
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            _trace.reset(token)
+            elapsed = _finish(trace, update_seconds)
+            updates_total.inc(trace.label, status)
+            if elapsed * 1000 >= SLOW_UPDATE_MS:
+                slow_updates_total.inc(trace.label)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время и ошибки каждого вызова Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            api_errors_total.inc(name, "retry_after")
+            raise
+        except Exception as e:
+            api_errors_total.inc(name, type(e).__name__)
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            api_seconds.observe(seconds, name)
+            trace = _trace.get()
+            if trace is not None:
+                trace.api_count += 1
+                trace.api_time += seconds
+                trace.step("api", name, seconds)
+
+
+class MetricsServer:
+    """Отдаёт registry по HTTP в текстовом формате Prometheus."""
+
+    def __init__(self, path: str = "/metrics"):
+        self.path = path
+        self._app_runner: web.AppRunner | None = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self, host: str, port: int) -> str:
+        app = web.Application()
+        app.router.add_get(self.path, self.handle)
+        self._app_runner = web.AppRunner(app, access_log=None)
+        await self._app_runner.setup()
+        site = web.TCPSite(self._app_runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}{self.path}"
+
+    async def stop(self):
+        if self._app_runner:
+            await self._app_runner.cleanup()
+            self._app_runner = None
@@ -0,0 +1,209 @@
+# services/outbox.py
+"""
+Центральная очередь исходящих сообщений.
+
+Все рассылки идут через `outbox`: обработчик ставит сообщение в очередь и не
+ждёт доставки. Очередь соблюдает лимиты Telegram — общий (~30 сообщений/с)
+и на чат (~1 сообщение/с с небольшим запасом на всплеск) — через token bucket,
+повторяет отправку после RetryAfter и отправляет ответы пользователю раньше
+фоновых уведомлений. Порядок сообщений внутри одного чата сохраняется.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше — раньше
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Списывает токен и возвращает 0, либо возвращает, сколько ждать до следующего."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Outgoing:
+    __slots__ = ("priority", "method", "kwargs", "future")
+
+    def __init__(self, priority, method, kwargs, future):
+        self.priority = priority
+        self.method = method
+        self.kwargs = kwargs
+        self.future = future
+
+
+class Outbox:
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, workers: int):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.bot: Bot | None = None
+        self._seq = itertools.count()
+        self._global = TokenBucket(global_rate, global_rate)
+        self._buckets: dict[int, TokenBucket] = {}
+        self._chats: dict[int, list] = {}    # chat_id -> куча (приоритет, seq, сообщение)
+        self._ready: list = []               # куча (приоритет, seq, chat_id) готовых к отправке чатов
+        self._scheduled: set[int] = set()    # чаты, которые уже в _ready, ждут токен или отправляются
+        self._has_ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._pending = 0
+        self._paused_until = 0.0
+        self._tasks: list[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    def start(self, bot: Bot):
+        self.bot = bot
+        self._global = TokenBucket(self.global_rate, self.global_rate)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10):
+        """Дожидается отправки уже поставленных сообщений и останавливает воркеры."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Outbox: не отправлено %s сообщений при остановке", self._pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Неотправленные сообщения: ждущие результата получают None, как при ошибке отправки
+        for queue in self._chats.values():
+            for _, _, item in queue:
+                self._finish(item, None)
+        self._chats.clear()
+        self._ready.clear()
+        self._scheduled.clear()
+
+    def send_message(self, chat_id: int, text: str, *, priority: int = BACKGROUND, **kwargs) -> asyncio.Future:
+        """Ставит сообщение в очередь. Future вернёт Message или None, если отправить не удалось."""
+        return self.call("send_message", chat_id, priority=priority, text=text, **kwargs)
+
+    def call(self, method: str, chat_id: int, *, priority: int = BACKGROUND, **kwargs) -> asyncio.Future:
+        """Ставит в очередь произвольный метод Bot, адресованный чату."""
+        future = asyncio.get_running_loop().create_future()
+        item = _Outgoing(priority, method, kwargs, future)
+        heapq.heappush(self._chats.setdefault(chat_id, []), (priority, next(self._seq), item))
+        self._pending += 1
+        self._idle.clear()
+        if chat_id not in self._scheduled:
+            self._scheduled.add(chat_id)
+            self._schedule(chat_id)
+        return future
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._pending,
+            "chats": len(self._chats),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+    def _schedule(self, chat_id: int):
+        """Переводит чат в готовые, как только у него появится токен."""
+        if chat_id not in self._chats:
+            # Очередь сброшена при остановке, пока чат ждал токен
+            return
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        wait = bucket.delay()
+        if wait:
+            asyncio.get_running_loop().call_later(wait, self._schedule, chat_id)
+            return
+        priority, seq, _ = self._chats[chat_id][0]
+        heapq.heappush(self._ready, (priority, seq, chat_id))
+        self._has_ready.set()
+
+    async def _take_global_token(self):
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            wait = self._global.delay()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def _worker(self):
+        while True:
+            while not self._ready:
+                self._has_ready.clear()
+                await self._has_ready.wait()
+            _, _, chat_id = heapq.heappop(self._ready)
+            queue = self._chats[chat_id]
+            _, seq, item = heapq.heappop(queue)
+
+            try:
+                await self._take_global_token()
+                result = await getattr(self.bot, item.method)(chat_id=chat_id, **item.kwargs)
+            except TelegramRetryAfter as e:
+                # Telegram просит подождать: возвращаем сообщение на его место
+                # в очереди чата и притормаживаем всю отправку
+                self.retries += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                heapq.heappush(queue, (item.priority, seq, item))
+            except asyncio.CancelledError:
+                # Остановка посреди отправки
+                self._finish(item, None)
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Outbox: не удалось выполнить %s для чата %s: %s", item.method, chat_id, e)
+                self._finish(item, None)
+            else:
+                self.sent += 1
+                self._finish(item, result)
+
+            if queue:
+                self._schedule(chat_id)
+            else:
+                del self._chats[chat_id]
+                self._scheduled.discard(chat_id)
+                # Ведро чата нужно, пока оно не наполнится снова, потом его можно забыть
+                asyncio.get_running_loop().call_later(
+                    self.chat_burst / self.chat_rate, self._forget_bucket, chat_id
+                )
+
+    def _forget_bucket(self, chat_id: int):
+        if chat_id not in self._chats:
+            self._buckets.pop(chat_id, None)
+
+    def _finish(self, item: _Outgoing, result):
+        if not item.future.done():
+            item.future.set_result(result)
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+
+
+outbox = Outbox(SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_WORKERS)
@@ -0,0 +1,165 @@
+# services/reminders.py
+"""
+Напоминания о дедлайнах хранятся в таблице reminders (одна строка на
+задачу и отступ из REMINDERS_MIN) и переживают перезапуск бота.
+
+Строки пишутся в той же транзакции, что и взятие задачи, и удаляются при
+любом переходе статуса (отказ, сдача, просрочка). Один цикл `ReminderLoop`
+спит до ближайшего due_ts, забирает из БД пачку наступивших напоминаний,
+удаляет их и отдаёт сообщения в `outbox`. После рестарта ничего не
+восстанавливается: цикл просто читает MIN(due_ts) по индексу.
+
+Цикл просыпается на границе такта REMINDER_TICK секунд, следующей за
+ближайшим due_ts: всё, что наступило внутри такта, забирается одним
+проходом, а не отдельной транзакцией на каждую секунду. Напоминание
+опаздывает не больше чем на такт.
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+
+from aiogram import Bot
+
+from config import REMINDERS_MIN, REMINDER_TICK
+from db import connection, run_db
+from services.metrics import job_timer
+from services.outbox import outbox
+from utils.time import now_ts
+
+logger = logging.getLogger(__name__)
+
+# Сколько напоминаний забирать из БД за один проход
+_BATCH = 200
+
+# Максимальный сон цикла: страховка от пропущенного wake()
+_MAX_SLEEP = 300
+
+# Наступившие напоминания по idx_reminders_due; active — задача ещё в работе
+DUE_SQL = """
+    SELECT r.task_id, r.minutes_left, r.user_id, t.title,
+           t.status = 'taken' AND t.deadline_ts > ? AS active
+    FROM reminders r
+    LEFT JOIN tasks t ON t.id = r.task_id
+    WHERE r.due_ts <= ?
+    ORDER BY r.due_ts
+    LIMIT ?
+"""
+NEXT_DUE_SQL = "SELECT MIN(due_ts) FROM reminders"
+CANCEL_SQL = "DELETE FROM reminders WHERE task_id = ?"
+
+
+def schedule_reminders(conn, task_id: int):
+    """
+    Ставит напоминания для взятой задачи в открытой транзакции conn.
+    Прошедшие отступы пропускаются, уже стоящие перезаписываются.
+    """
+    conn.execute("""
+        INSERT OR REPLACE INTO reminders(task_id, minutes_left, user_id, due_ts)
+        SELECT t.id, m.value, t.assigned_to, t.deadline_ts - m.value * 60
+        FROM tasks t, json_each(?) m
+        WHERE t.id = ? AND t.status = 'taken' AND t.assigned_to IS NOT NULL
+          AND t.deadline_ts - m.value * 60 > ?
+    """, (json.dumps(REMINDERS_MIN), task_id, now_ts()))
+
+
+def cancel_reminders(conn, task_ids):
+    """Удаляет напоминания задач в открытой транзакции conn."""
+    conn.executemany(CANCEL_SQL, [(task_id,) for task_id in task_ids])
+
+
+def pull_due(actor_id: int, limit: int = _BATCH):
+    """
+    Забирает наступившие напоминания одной транзакцией: удаляет их из
+    таблицы и пишет события 'remind'. Напоминания по уже неактивным задачам
+    или с прошедшим дедлайном удаляются без отправки.
+    Возвращает (строки для отправки, ближайший due_ts оставшихся или None,
+    признак того, что пачка заполнена и в БД могут быть ещё наступившие).
+    """
+    now = now_ts()
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(DUE_SQL, (now, now, limit)).fetchall()
+        conn.executemany(
+            "DELETE FROM reminders WHERE task_id = ? AND minutes_left = ?",
+            [(row['task_id'], row['minutes_left']) for row in rows]
+        )
+        due = [row for row in rows if row['active']]
+        conn.executemany(
+            "INSERT INTO events (ts, actor_id, action, task_id, meta) VALUES (?, ?, 'remind', ?, ?)",
+            [(now, actor_id, row['task_id'], f"{row['minutes_left']} min left") for row in due]
+        )
+        conn.commit()
+        next_due = conn.execute(NEXT_DUE_SQL).fetchone()[0]
+    return due, next_due, len(rows) == limit
+
+
+class ReminderLoop:
+    def __init__(self, tick: float = REMINDER_TICK, max_sleep: float = _MAX_SLEEP):
+        self.tick = tick
+        self.max_sleep = max_sleep
+        self._next_due: float | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.sent_total = 0
+        self.passes_total = 0
+
+    def tick_end(self, due_ts: float) -> float:
+        """Граница такта, на которой будет отправлено напоминание с этим due_ts."""
+        if self.tick <= 1:
+            return due_ts
+        return math.ceil(due_ts / self.tick) * self.tick
+
+    def wake(self, deadline_ts: int):
+        """Для задачи с этим дедлайном записаны напоминания; будим цикл, если они раньше ожидаемого."""
+        now = time.time()
+        upcoming = [deadline_ts - minutes * 60 for minutes in REMINDERS_MIN if deadline_ts - minutes * 60 > now]
+        if upcoming and (self._next_due is None or min(upcoming) < self._next_due):
+            self._wakeup.set()
+
+    async def start(self, bot: Bot):
+        self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, bot: Bot):
+        while True:
+            self._wakeup.clear()
+            with job_timer("reminders"):
+                try:
+                    due, next_due, more = await run_db(pull_due, bot.id)
+                except Exception:
+                    logger.exception("Ошибка при отправке напоминаний")
+                    due, next_due, more = [], None, False
+
+                for row in due:
+                    outbox.send_message(
+                        row['user_id'],
+                        f"❗️ <b>Напоминание</b>: до дедлайна задачи «{row['title']}» "
+                        f"осталось {row['minutes_left']} минут."
+                    )
+                self.sent_total += len(due)
+                self.passes_total += 1
+            if more:
+                continue
+
+            self._next_due = next_due
+            timeout = self.max_sleep
+            if next_due is not None:
+                timeout = min(timeout, self.tick_end(next_due) - time.time())
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stats(self) -> dict:
+        return {"sent_total": self.sent_total, "passes_total": self.passes_total}
+
+
+reminders = ReminderLoop()
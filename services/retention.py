@@ -0,0 +1,204 @@
+# services/retention.py
+"""
+Срок хранения аудита: события старше EVENTS_RETENTION_DAYS уходят из events.
+
+Задача идёт пачками по RETENTION_BATCH событий в порядке ts:
+1. пачка читается по idx_events_ts без блокировки записи;
+2. дописывается в сжатый архив EVENTS_ARCHIVE_DIR/events_<дата>.jsonl.gz,
+   архив сбрасывается на диск (fsync) до удаления из БД;
+3. одной короткой транзакцией счётчики пачки добавляются в дневные
+   агрегаты events_daily (день в TIMEZONE, действие), а строки удаляются.
+Между пачками другие запросы успевают взять блокировку записи. Если процесс
+упадёт между архивом и удалением, пачка попадёт в архив повторно при
+следующем запуске — событие не теряется.
+
+Затем `PRAGMA incremental_vacuum` шагами по VACUUM_STEP_PAGES страниц (с той
+же паузой между шагами) возвращает освободившееся место файловой системе, а
+checkpoint обрезает WAL. Если база не в auto_vacuum=INCREMENTAL (разовый
+VACUUM в db.enable_incremental_vacuum не прошёл), место не возвращается.
+Задача стоит в планировщике (работает только у лидера); вручную:
+    python -m services.retention
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime
+
+from config import EVENTS_RETENTION_DAYS, EVENTS_ARCHIVE_DIR, RETENTION_BATCH, VACUUM_STEP_PAGES
+from db import connection, init_db, run_db
+from services.metrics import job_timer
+from utils.time import now_ts, tz
+
+logger = logging.getLogger(__name__)
+
+# Пауза между пачками: даёт обработчикам взять блокировку записи
+_PAUSE = 0.01
+
+BATCH_SQL = "SELECT id, ts, actor_id, action, task_id, meta FROM events WHERE ts < ? ORDER BY ts, id LIMIT ?"
+
+_DAILY_UPSERT = """
+    INSERT INTO events_daily(day, action, events) VALUES (?, ?, ?)
+    ON CONFLICT(day, action) DO UPDATE SET events = events + excluded.events
+"""
+
+
+class ArchiveFile:
+    """Архив JSON Lines в gzip; файл создаётся при первой записи и дописывается."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._raw = None
+        self._gz = None
+
+    def write(self, rows: list):
+        if self._gz is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._raw = open(self.path, "ab")
+            self._gz = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        self._gz.writelines(json.dumps(dict(row), ensure_ascii=False).encode() + b"\n" for row in rows)
+        # Пачка должна быть на диске раньше, чем удалится из БД
+        self._gz.flush()
+        os.fsync(self._raw.fileno())
+
+    def close(self):
+        if self._gz is not None:
+            self._gz.close()
+            self._raw.close()
+
+
+def archive_batch(archive: ArchiveFile, cutoff_ts: int, limit: int = RETENTION_BATCH) -> int:
+    """Архивирует, сворачивает в events_daily и удаляет одну пачку событий старше cutoff_ts."""
+    with connection() as conn:
+        rows = conn.execute(BATCH_SQL, (cutoff_ts, limit)).fetchall()
+        if not rows:
+            return 0
+        archive.write(rows)
+
+        daily = Counter((datetime.fromtimestamp(row['ts'], tz).strftime("%Y-%m-%d"), row['action']) for row in rows)
+        marks = ",".join("?" * len(rows))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_DAILY_UPSERT, [(day, action, count) for (day, action), count in daily.items()])
+            conn.execute(f"DELETE FROM events WHERE id IN ({marks})", [row['id'] for row in rows])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return len(rows)
+
+
+def _auto_vacuum() -> int:
+    with connection() as conn:
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+
+def vacuum_step(step_pages: int = VACUUM_STEP_PAGES) -> int:
+    """Один шаг incremental_vacuum. Возвращает, на сколько байт уменьшился файл БД."""
+    with connection() as conn:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            return 0
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        before = conn.execute("PRAGMA page_count").fetchone()[0]
+        # sqlite3 делает у прагмы без результата один sqlite3_step, а он
+        # освобождает одну страницу — поэтому шаг из отдельных выполнений
+        # в одной короткой транзакции
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for _ in range(min(free, step_pages)):
+                conn.execute("PRAGMA incremental_vacuum(1)")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        after = conn.execute("PRAGMA page_count").fetchone()[0]
+    return (before - after) * page_size
+
+
+def _checkpoint():
+    with connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+
+async def reclaim_space(step_pages: int = VACUUM_STEP_PAGES) -> int:
+    """
+    Возвращает свободные страницы файловой системе короткими шагами и
+    обрезает WAL. Возвращает, на сколько байт уменьшился файл БД.
+    """
+    reclaimed = 0
+    if await run_db(_auto_vacuum) != 2:
+        logger.warning("База не в auto_vacuum=INCREMENTAL: место после очистки не возвращается")
+    else:
+        # Шаг, после которого файл не уменьшился, — последний
+        while freed := await run_db(vacuum_step, step_pages):
+            reclaimed += freed
+            await asyncio.sleep(_PAUSE)
+    await run_db(_checkpoint)
+    return reclaimed
+
+
+class EventRetention:
+    def __init__(self, days: int | None, archive_dir: str):
+        self.days = days
+        self.archive_dir = archive_dir
+        self.archived_total = 0
+        self.reclaimed_bytes_total = 0
+        self.last_run_ts = 0
+
+    async def run(self) -> dict:
+        """Один проход: архив и удаление старых событий, затем возврат места."""
+        if self.days is None:
+            return {"archived": 0, "bytes_reclaimed": 0, "archive": None}
+        started = time.perf_counter()
+        cutoff_ts = now_ts() - self.days * 86400
+        path = os.path.join(self.archive_dir, f"events_{datetime.now(tz):%Y%m%d}.jsonl.gz")
+        archive = ArchiveFile(path)
+        archived = 0
+        try:
+            while count := await run_db(archive_batch, archive, cutoff_ts):
+                archived += count
+                await asyncio.sleep(_PAUSE)
+        finally:
+            archive.close()
+        reclaimed = await reclaim_space()
+
+        self.archived_total += archived
+        self.reclaimed_bytes_total += reclaimed
+        self.last_run_ts = now_ts()
+        report = {
+            "archived": archived,
+            "bytes_reclaimed": reclaimed,
+            "archive": path if archived else None,
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+        logger.info("Очистка аудита: в архив %s событий, освобождено %.1f МБ, %s",
+                    archived, reclaimed / 2**20, report["archive"] or "архив не понадобился")
+        return report
+
+    async def job(self):
+        """Задача планировщика."""
+        with job_timer("events_retention"):
+            try:
+                await self.run()
+            except Exception:
+                logger.exception("Ошибка очистки аудита")
+
+    def stats(self) -> dict:
+        return {
+            "archived_total": self.archived_total,
+            "reclaimed_bytes_total": self.reclaimed_bytes_total,
+            "last_run_ts": self.last_run_ts,
+        }
+
+
+retention = EventRetention(EVENTS_RETENTION_DAYS, EVENTS_ARCHIVE_DIR)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    print(asyncio.run(retention.run()))
@@ -0,0 +1,100 @@
+# services/search.py
+import re
+
+from db import connection
+
+# Размер страницы результатов поиска: страница целиком помещается в одно сообщение
+SEARCH_PAGE_SIZE = 10
+
+# Если совпадений больше, bm25 по всем ним считать слишком дорого, и выдача
+# идёт от новых задач к старым (порядок rowid в индексе, без сортировки)
+SEARCH_RANK_LIMIT = 5000
+
+# Части URL, которые есть почти в каждой задаче: по ним искать бессмысленно,
+# а пересечение их огромных списков совпадений — самая дорогая часть запроса
+_URL_NOISE = {"http", "https", "www", "notion", "so", "site"}
+
+# Веса колонок tasks_fts для bm25: заголовок важнее исполнителя, исполнитель важнее URL
+_SCORE = "bm25(tasks_fts, 10.0, 2.0, 5.0)"
+
+
+def build_match(text: str) -> str | None:
+    """
+    Превращает пользовательский ввод в запрос FTS5: все слова должны
+    встретиться, слова от трёх символов ищутся по префиксу. Короткие куски
+    ('p', 'so' из URL) по префиксу совпали бы почти со всем индексом, поэтому
+    для них нужно точное совпадение. '@' у username и служебные части
+    Notion-ссылки (_URL_NOISE) отбрасываются.
+    """
+    tokens = re.findall(r"\w+", text.lower())
+    tokens = [t for t in tokens if t not in _URL_NOISE] or tokens
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' if len(token) >= 3 else f'"{token}"' for token in tokens)
+
+
+def search_sql(mode: str, paged: bool) -> str:
+    """
+    SQL страницы поиска: сначала страница из индекса, потом задачи по id.
+    Параметры: rank — (match, [score, score, id], лимит), recent — (match, [id], лимит).
+    """
+    if mode == "rank":
+        where = f"AND ({_SCORE} > ? OR ({_SCORE} = ? AND rowid > ?))" if paged else ""
+        inner = f"""
+            SELECT rowid AS id, {_SCORE} AS score FROM tasks_fts
+            WHERE tasks_fts MATCH ? {where}
+            ORDER BY score, rowid LIMIT ?
+        """
+        order = "s.score, s.id"
+    else:
+        where = "AND rowid < ?" if paged else ""
+        inner = f"""
+            SELECT rowid AS id, NULL AS score FROM tasks_fts
+            WHERE tasks_fts MATCH ? {where}
+            ORDER BY rowid DESC LIMIT ?
+        """
+        order = "s.id DESC"
+    return f"""
+        SELECT t.*, u.username AS assignee_username, s.score
+        FROM ({inner}) s
+        JOIN tasks t ON t.id = s.id
+        LEFT JOIN users u ON u.tg_id = t.assigned_to
+        ORDER BY {order}
+    """
+
+
+def search_tasks(match: str, cursor: list | None = None, limit: int = SEARCH_PAGE_SIZE):
+    """
+    Ищет задачи по заголовку, Notion URL и username исполнителя.
+
+    Узкие запросы (до SEARCH_RANK_LIMIT совпадений) упорядочены по
+    релевантности bm25, широкие — от новых задач к старым. Страницы листаются
+    курсором по последней строке: ["rank", score, id] или ["recent", id].
+    Возвращает (строки, курсор следующей страницы или None).
+    """
+    with connection() as conn:
+        if cursor is None:
+            matched = conn.execute(
+                "SELECT COUNT(*) FROM (SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ? LIMIT ?)",
+                (match, SEARCH_RANK_LIMIT + 1)
+            ).fetchone()[0]
+            mode = "rank" if matched <= SEARCH_RANK_LIMIT else "recent"
+        else:
+            mode = cursor[0]
+
+        params = [match]
+        if cursor and mode == "rank":
+            _, score, task_id = cursor
+            params += [score, score, task_id]
+        elif cursor:
+            params.append(cursor[1])
+        params.append(limit + 1)
+        rows = conn.execute(search_sql(mode, cursor is not None), params).fetchall()
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    if mode == "rank":
+        return rows, ["rank", last['score'], last['id']]
+    return rows, ["recent", last['id']]
@@ -0,0 +1,219 @@
+# services/stats.py
+"""
+Сводная статистика по задачам: таблицы stats_levels (по уровню задачи) и
+stats_executors (по исполнителю).
+
+Счётчики обновляются инкрементально в той же транзакции, что и переход
+статуса (create, take, drop, done, return, expire), поэтому экран
+статистики PM читает готовые строки и не зависит от числа задач и событий.
+Время выполнения — от взятия (tasks.taken_at) до приёмки, включая доработки
+после возврата.
+
+Если сводка разошлась с аудитом (или появилась на старой базе), её можно
+пересобрать из events за один проход:
+    python -m services.stats
+Сверить сводку с пересборкой, ничего не меняя:
+    python -m services.stats --check
+События, ушедшие в архив по сроку хранения (services/retention.py), в
+пересборку не попадают, поэтому после очистки пересборка требует --force.
+"""
+import argparse
+
+from db import connection, init_db
+
+# Действие в events -> колонка счётчика
+ACTIONS = {
+    "create": "created",
+    "take": "taken",
+    "drop": "dropped",
+    "done": "done",
+    "return": "returned",
+    "expire": "expired",
+}
+
+# Уровень задачи может быть не указан
+NO_LEVEL = "—"
+
+_LEVEL_COLUMNS = list(ACTIONS.values()) + ["lead_sum", "lead_count"]
+# Исполнитель у задачи появляется только при взятии
+_EXECUTOR_COLUMNS = [c for c in _LEVEL_COLUMNS if c != "created"]
+
+
+def _upsert_sql(table: str, key: str, columns: list) -> str:
+    marks = ", ".join("?" * (len(columns) + 1))
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in columns)
+    return (f"INSERT INTO {table}({key}, {', '.join(columns)}) VALUES ({marks}) "
+            f"ON CONFLICT({key}) DO UPDATE SET {updates}")
+
+
+_LEVEL_UPSERT = _upsert_sql("stats_levels", "level", _LEVEL_COLUMNS)
+_EXECUTOR_UPSERT = _upsert_sql("stats_executors", "user_id", _EXECUTOR_COLUMNS)
+
+
+# Топы исполнителей для экрана статистики; column — done или expired
+TOP_EXECUTORS_SQL = """
+    SELECT s.*, u.username
+    FROM stats_executors s
+    LEFT JOIN users u ON u.tg_id = s.user_id
+    WHERE s.{column} > 0
+    ORDER BY s.{column} DESC
+    LIMIT ?
+"""
+
+
+def _deltas(action: str, lead: int | None, columns: list) -> list:
+    column = ACTIONS[action]
+    values = {c: int(c == column) for c in columns}
+    if lead is not None:
+        values["lead_sum"], values["lead_count"] = lead, 1
+    return [values[c] for c in columns]
+
+
+def record_transitions(conn, action: str, rows):
+    """
+    Учитывает переходы статуса в открытой транзакции conn.
+    rows — пары (исполнитель или None, уровень) или тройки с временем
+    выполнения в секундах для action='done'.
+    """
+    levels, executors = [], []
+    for executor_id, level, *lead in rows:
+        lead = lead[0] if lead else None
+        levels.append((level or NO_LEVEL, *_deltas(action, lead, _LEVEL_COLUMNS)))
+        if executor_id and action != "create":
+            executors.append((executor_id, *_deltas(action, lead, _EXECUTOR_COLUMNS)))
+    conn.executemany(_LEVEL_UPSERT, levels)
+    conn.executemany(_EXECUTOR_UPSERT, executors)
+
+
+def record_transition(conn, action: str, executor_id: int | None, level: str | None, lead: int | None = None):
+    """Один переход статуса в открытой транзакции conn."""
+    record_transitions(conn, action, [(executor_id, level, lead)])
+
+
+def rebuild(conn) -> int:
+    """
+    Пересобирает сводку из events одним проходом по idx_events_task в открытой
+    транзакции conn. Возвращает число учтённых событий.
+    """
+    levels: dict = {}
+    executors: dict = {}
+
+    def add(table: dict, key, columns: list, action: str, lead):
+        totals = table.setdefault(key, [0] * len(columns))
+        for i, delta in enumerate(_deltas(action, lead, columns)):
+            totals[i] += delta
+
+    cursor = conn.execute(f"""
+        SELECT e.task_id, e.ts, e.actor_id, e.action, t.level, t.assigned_to
+        FROM events e
+        JOIN tasks t ON t.id = e.task_id
+        WHERE e.action IN ({", ".join("?" * len(ACTIONS))})
+        ORDER BY e.task_id, e.ts, e.id
+    """, tuple(ACTIONS))
+
+    counted = 0
+    task_id = executor = taken_at = None
+    for event in cursor:
+        if event['task_id'] != task_id:
+            task_id, executor, taken_at = event['task_id'], None, None
+        action = event['action']
+        if action in ("take", "drop"):
+            executor = event['actor_id']
+        if action == "take":
+            taken_at = event['ts']
+        # done/return/expire делает не исполнитель; если взятие уже не в аудите,
+        # исполнитель берётся из задачи
+        who = executor or event['assigned_to']
+        lead = event['ts'] - taken_at if action == "done" and taken_at else None
+
+        add(levels, event['level'] or NO_LEVEL, _LEVEL_COLUMNS, action, lead)
+        if who and action != "create":
+            add(executors, who, _EXECUTOR_COLUMNS, action, lead)
+        counted += 1
+
+    conn.execute("DELETE FROM stats_levels")
+    conn.execute("DELETE FROM stats_executors")
+    conn.executemany(_LEVEL_UPSERT, [(key, *totals) for key, totals in levels.items()])
+    conn.executemany(_EXECUTOR_UPSERT, [(key, *totals) for key, totals in executors.items()])
+    return counted
+
+
+def check(conn) -> list:
+    """
+    Сверяет инкрементальные счётчики с пересборкой из events, не меняя
+    сводку (пересборка откатывается). Возвращает расхождения
+    (таблица, ключ, счётчики, счётчики по аудиту). lead_sum не сверяется:
+    taken_at и ts события взятия могут разойтись на секунду.
+    """
+    columns = [c for c in _LEVEL_COLUMNS if c != "lead_sum"]
+
+    def snapshot() -> dict:
+        rows = {}
+        for table, key in (("stats_levels", "level"), ("stats_executors", "user_id")):
+            names = [c for c in columns if c in (_LEVEL_COLUMNS if table == "stats_levels" else _EXECUTOR_COLUMNS)]
+            for row in conn.execute(f"SELECT {key}, {', '.join(names)} FROM {table}"):
+                rows[table, row[0]] = dict(zip(names, row[1:]))
+        return rows
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = snapshot()
+        rebuild(conn)
+        rebuilt = snapshot()
+    finally:
+        conn.rollback()
+    return [
+        (table, key, current.get((table, key)), rebuilt.get((table, key)))
+        for table, key in sorted(current.keys() | rebuilt.keys(), key=str)
+        if current.get((table, key)) != rebuilt.get((table, key))
+    ]
+
+
+def load_stats(top: int = 10) -> dict:
+    """Данные экрана статистики: все уровни и топы исполнителей по индексам."""
+    with connection() as conn:
+        return {
+            "levels": conn.execute("SELECT * FROM stats_levels ORDER BY level").fetchall(),
+            "top_done": conn.execute(TOP_EXECUTORS_SQL.format(column="done"), (top,)).fetchall(),
+            "top_expired": conn.execute(TOP_EXECUTORS_SQL.format(column="expired"), (top,)).fetchall(),
+        }
+
+
+def _backfill(force: bool):
+    init_db()
+    with connection() as conn:
+        archived_until = conn.execute("SELECT MAX(day) FROM events_daily").fetchone()[0]
+        if archived_until and not force:
+            print(f"События по {archived_until} уже в архиве: пересборка потеряет их счётчики. "
+                  f"Запустите с --force, если это нужно.")
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            counted = rebuild(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        levels = conn.execute("SELECT COUNT(*) FROM stats_levels").fetchone()[0]
+        executors = conn.execute("SELECT COUNT(*) FROM stats_executors").fetchone()[0]
+    print(f"Сводка пересобрана: {counted} событий, уровней {levels}, исполнителей {executors}")
+
+
+def _check():
+    init_db()
+    with connection() as conn:
+        mismatches = check(conn)
+    for table, key, current, rebuilt in mismatches:
+        print(f"{table} {key}: сводка {current}, по аудиту {rebuilt}")
+    print("Сводка совпадает с аудитом" if not mismatches else f"Расхождений: {len(mismatches)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересборка сводной статистики из events")
+    parser.add_argument("--force", action="store_true", help="пересобрать, даже если часть событий в архиве")
+    parser.add_argument("--check", action="store_true", help="только сверить сводку с аудитом")
+    args = parser.parse_args()
+    if args.check:
+        _check()
+    else:
+        _backfill(args.force)
@@ -0,0 +1,169 @@
+# services/webhook.py
+"""
+Приём апдейтов через webhook вместо long polling.
+
+`WebhookServer` — aiohttp-сервер, который проверяет секретный токен
+(заголовок X-Telegram-Bot-Api-Secret-Token) и отдаёт апдейт в `UpdateRunner`
+(или, при нескольких процессах, в services.cluster.Supervisor). Раннер
+обрабатывает апдейты пулом из UPDATE_WORKERS корутин: разные чаты идут
+параллельно, апдейты одного чата — строго по очереди. Если в работе уже
+UPDATE_QUEUE_SIZE апдейтов, приём новых ждёт, и Telegram сам притормаживает
+отправку. При остановке сервер перестаёт принимать апдейты (отвечает 503,
+Telegram повторит их позже) и дорабатывает уже принятые.
+"""
+import asyncio
+import hmac
+import logging
+import time
+from collections import deque
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def _chat_key(update: Update):
+    """Ключ очереди: чат, иначе пользователь, иначе сам апдейт (порядок не важен)."""
+    context = UserContextMiddleware.resolve_event_context(update)
+    if context.chat:
+        return context.chat.id
+    if context.user:
+        return context.user.id
+    return ("update", update.update_id)
+
+
+class UpdateRunner:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._chats: dict = {}              # ключ чата -> очередь его апдейтов; есть, пока чат в работе
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_pending)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._pending = 0
+        self._tasks: list[asyncio.Task] = []
+        self._bot: Bot | None = None
+        self.accepting = False
+        self.processed = 0
+        self.failed = 0
+
+    def start(self, dp: Dispatcher, bot: Bot, **data):
+        self._bot = bot
+        self.accepting = True
+        self._tasks = [asyncio.create_task(self._worker(dp, bot, data)) for _ in range(self.workers)]
+
+    async def submit(self, update: Update):
+        """Ставит апдейт в очередь его чата; ждёт, если очередь заполнена."""
+        await self._slots.acquire()
+        self._pending += 1
+        self._idle.clear()
+        key = _chat_key(update)
+        queue = self._chats.get(key)
+        if queue is None:
+            self._chats[key] = deque([update])
+            self._ready.put_nowait(key)
+        else:
+            queue.append(update)
+
+    async def submit_raw(self, data: dict):
+        """Разбирает апдейт в формате Bot API и ставит его в очередь."""
+        await self.submit(Update.model_validate(data, context={"bot": self._bot}))
+
+    async def drain(self, timeout: float):
+        """Перестаёт принимать апдейты, дожидается обработки принятых и останавливает воркеры."""
+        self.accepting = False
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Webhook: не обработано %s апдейтов при остановке", self._pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._pending,
+            "chats": len(self._chats),
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+    async def _worker(self, dp: Dispatcher, bot: Bot, data: dict):
+        while True:
+            key = await self._ready.get()
+            queue = self._chats[key]
+            # Апдейт остаётся в очереди, пока обрабатывается: так новый апдейт
+            # этого чата не попадёт к другому воркеру
+            update = queue[0]
+            try:
+                await dp.feed_update(bot, update, **data)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Webhook: ошибка обработки апдейта %s", update.update_id)
+            finally:
+                queue.popleft()
+                if queue:
+                    # В конец общей очереди, чтобы один активный чат не занимал воркер
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                self._slots.release()
+                self._pending -= 1
+                if not self._pending:
+                    self._idle.set()
+
+
+class WebhookServer:
+    def __init__(self, intake, path: str, secret: str):
+        """
+        intake — тот, кто обрабатывает принятые апдейты: UpdateRunner в этом
+        процессе или services.cluster.Supervisor, раздающий их воркерам.
+        Нужны атрибут accepting и методы submit_raw(data) и drain(timeout).
+        """
+        self.intake = intake
+        self.path = path
+        self.secret = secret
+        self.rejected = 0
+        self._app_runner: web.AppRunner | None = None
+        self._site: web.TCPSite | None = None
+        self.port: int | None = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token, self.secret):
+            self.rejected += 1
+            return web.Response(status=401)
+        if not self.intake.accepting:
+            return web.Response(status=503)
+        try:
+            await self.intake.submit_raw(await request.json())
+        except ValueError:
+            # Не JSON или не апдейт (ValidationError pydantic — тоже ValueError)
+            return web.Response(status=400)
+        return web.json_response({})
+
+    async def start(self, host: str, port: int) -> str:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self._app_runner = web.AppRunner(app)
+        await self._app_runner.setup()
+        self._site = web.TCPSite(self._app_runner, host, port)
+        await self._site.start()
+        self.port = self._site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}{self.path}"
+
+    async def stop(self, drain_timeout: float = 30):
+        """Новые апдейты получают 503, принятые дорабатываются, затем сервер закрывается."""
+        started = time.monotonic()
+        await self.intake.drain(drain_timeout)
+        if self._app_runner:
+            await self._app_runner.cleanup()
+        logger.info("Webhook остановлен за %.1f с: %s", time.monotonic() - started, self.intake.stats())
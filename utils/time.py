@@ -18,3 +18,18 @@ def from_ts(ts: int) -> datetime.datetime:
 def humanize_ts(ts: int) -> str:
     dt = from_ts(ts).astimezone(tz)
     return dt.strftime("%Y-%m-%d %H:%M")
+
+def parse_deadline(text: str) -> int | None:
+    """Дедлайн '6h', '+30m' или 'YYYY-MM-DD HH:MM' (в TIMEZONE) -> unix timestamp; None, если не разобрать."""
+    txt = text.strip().lower()
+    # Убираем необязательный '+' в начале
+    if txt.startswith("+"):
+        txt = txt[1:]
+    try:
+        if txt.endswith("h"):
+            return now_ts() + int(txt[:-1]) * 3600
+        if txt.endswith("m"):
+            return now_ts() + int(txt[:-1]) * 60
+        return int(tz.localize(datetime.datetime.strptime(txt, "%Y-%m-%d %H:%M")).timestamp())
+    except ValueError:
+        return None